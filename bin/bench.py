@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+""" Micro benchmarks of the jpamb utilities.
+"""
+
+import os
+import click
+from pathlib import Path
+from statistics import median
+from time import perf_counter_ns
+
+from utils import *
+from jpamb_utils import CharListValue, IntListValue
+
+
+WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
+
+
+def measure(fn, repeat) -> list[int]:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        fn()
+        times.append(perf_counter_ns() - start)
+    return times
+
+
+def report(name, times, unit=1_000):
+    click.echo(
+        f"{name:<24} median {median(times)/unit:10.1f}us"
+        f"  min {min(times)/unit:10.1f}us  max {max(times)/unit:10.1f}us"
+    )
+
+
+@click.group()
+@click.option("-v", "--verbose", count=True)
+@click.pass_context
+def bench(ctx, verbose):
+    """Run micro benchmarks from the root of the repository."""
+    os.chdir(WORKFOLDER)
+    ctx.obj = Suite(WORKFOLDER, QUERIES, setup_logger(verbose))
+
+
+@bench.command()
+@click.option("-r", "--repeat", show_default=True, default=20)
+@click.pass_obj
+def methodindex(suite, repeat):
+    """Compare MethodId.load with and without the method index.
+
+    `scan` parses the entire classfile, `cold` uses the index in a fresh
+    process (loading the index from disk), and `warm` uses an index that is
+    already loaded.
+    """
+    methods = [m for m, _ in Case.by_methodid(suite.cases())]
+    root = Path("decompiled")
+
+    (root / method_index.INDEX_NAME).unlink(missing_ok=True)
+    method_index._indices.clear()
+    report("build", measure(lambda: method_index.build(root), 1))
+
+    def cold(m):
+        method_index._indices.clear()
+        return method_index.lookup(m, m.classfile())
+
+    def warm(m):
+        return method_index.lookup(m, m.classfile())
+
+    scan, cold_times, warm_times = [], [], []
+    for m in methods:
+        assert warm(m) == m.scan(), f"index disagrees on {m}"
+        scan += measure(m.scan, repeat)
+        cold_times += measure(lambda: cold(m), repeat)
+        warm_times += measure(lambda: warm(m), repeat)
+
+    click.echo(f"{len(methods)} methods x {repeat} repetitions")
+    report("scan", scan)
+    report("cold", cold_times)
+    report("warm", warm_times)
+
+
+@bench.command("bytecode")
+@click.option("-r", "--repeat", show_default=True, default=20)
+@click.pass_obj
+def bytecode_(suite, repeat):
+    """Compare reading the bytecode of a method from json and from the
+    memory-mapped bytecode file.
+    """
+    methods = [m for m, _ in Case.by_methodid(suite.cases())]
+    root = Path("decompiled")
+    report("build", measure(lambda: bytecode.build(root), 1))
+
+    def from_json(m):
+        return m.scan()["code"]["bytecode"]
+
+    def from_mmap(m):
+        bytecode._files.clear()
+        return list(bytecode.load(root, check=False).method(m))
+
+    json_times, mmap_times = [], []
+    for m in methods:
+        assert from_json(m) == from_mmap(m), f"bytecode disagrees on {m}"
+        json_times += measure(lambda: from_json(m), repeat)
+        mmap_times += measure(lambda: from_mmap(m), repeat)
+
+    size = sum(
+        c.stat().st_size for c in root.glob("**/*.json") if not c.name.startswith(".")
+    )
+    click.echo(f"{len(methods)} methods x {repeat} repetitions")
+    click.echo(f"{'json size':<24} {size:10d}B")
+    click.echo(
+        f"{'bytecode size':<24} {(root / bytecode.BYTECODE_NAME).stat().st_size:10d}B"
+    )
+    report("json", json_times)
+    report("mmap", mmap_times)
+
+
+@bench.command()
+@click.option("-r", "--repeat", show_default=True, default=20)
+@click.pass_obj
+def cases(suite, repeat):
+    """Compare parsing the cases file with loading the case index.
+
+    `parse` parses every line of `stats/cases.txt`, `load` opens the index in
+    a fresh process, and `cases` reads all the cases from a loaded index.
+    """
+    root = Path("stats")
+    report("build", measure(lambda: case_index.build(root, QUERIES), 1))
+
+    def parse():
+        with open(root / "cases.txt") as f:
+            return [Case.from_spec(line[:-1]) for line in f]
+
+    def load():
+        case_index._indices.clear()
+        return case_index.load(root, QUERIES)
+
+    assert parse() == list(suite.cases()), "case index disagrees with the cases"
+    index = load()
+    click.echo(f"{len(index)} cases of {len(list(index.methods()))} methods")
+    report("parse", measure(parse, repeat))
+    report("load", measure(load, repeat))
+    report("cases", measure(lambda: list(suite.cases()), repeat))
+
+
+@bench.command()
+@click.option("-r", "--repeat", show_default=True, default=5)
+@click.option("--max-size", show_default=True, default=1_000_000)
+@click.pass_obj
+def inputs(suite, repeat, max_size):
+    """Measure how parsing int and char array inputs scales with their size."""
+    import random
+
+    size = 10
+    while size <= max_size:
+        ints = IntListValue(random.randint(-(2**31), 2**31 - 1) for _ in range(size))
+        chars = CharListValue(random.choice("abc, ") for _ in range(size))
+        for name, value in [("int", ints), ("char", chars)]:
+            string = f"({value})"
+            assert str(Input(tuple(InputParser.parse(string)))) == string
+            times = measure(lambda: InputParser.parse(string), repeat)
+            report(f"{name} {size}", times)
+        size *= 10
+
+
+@bench.command()
+@click.option("-n", "--count", show_default=True, default=10_000)
+@click.option("-l", "--length", show_default=True, default=100)
+@click.pass_obj
+def values(suite, count, length):
+    """Measure the memory use and comparison speed of the input values.
+
+    The memory is measured with tracemalloc, and includes the list holding the
+    values. Lists have `length` elements.
+    """
+    import random
+    import string
+    import tracemalloc
+
+    def integer():
+        return str(random.randint(-(2**31), 2**31 - 1))
+
+    def char():
+        return f"'{random.choice(string.ascii_letters)}'"
+
+    kinds = {
+        "boolean": lambda: random.choice(["true", "false"]),
+        "int": integer,
+        "char": char,
+        "int[]": lambda: f"[I:{', '.join(integer() for _ in range(length))}]",
+        "char[]": lambda: f"[C:{', '.join(char() for _ in range(length))}]",
+    }
+
+    for name, generate in kinds.items():
+        inputs = [f"({generate()})" for _ in range(count)]
+
+        tracemalloc.start()
+        values = [InputParser.parse(i)[0] for i in inputs]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        pairs = list(zip(values, values[1:]))
+
+        def compare():
+            for a, b in pairs:
+                a == b
+                a < b
+
+        (compare_ns,) = measure(compare, 1)
+        (hash_ns,) = measure(lambda: set(values), 1)
+        (sort_ns,) = measure(lambda: sorted(values), 1)
+        click.echo(
+            f"{name:<8} {size / count:10.1f}B/value"
+            f" {2 * len(pairs) / compare_ns * 1e9:14,.0f} comparisons/s"
+            f" {count / hash_ns * 1e9:14,.0f} hashes/s"
+            f" sorted in {sort_ns / 1e6:8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    bench()
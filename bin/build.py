@@ -1,32 +1,198 @@
 #!/usr/bin/env python3
+""" Rebuild the benchmark-suite.
 
+The build is a graph of steps, where every step has hashed inputs and
+outputs:
+
+    sources -> classes -> decompiled json
+                       -> cases.txt, distribution.csv, and the case index
+    decompiled json + cases.txt -> checked cases
+
+The hashes are kept in `target/jpamb-build.json`, and a step is skipped when
+the hashes of its inputs and outputs are the same as the last time it ran.
+Cases are only checked again when the bytecode of their method (or of the
+methods it calls) changed.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable
 import click
 import os
+import subprocess
 from pathlib import Path
 
 from utils import *
 
 WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
 
+BUILD_MANIFEST = Path("target", "jpamb-build.json")
+BUILD_VERSION = 1
+
+
+@dataclass
+class BuildGraph:
+    path: Path
+    logger: loguru._logger.Logger
+    steps: dict[str, dict] = field(default_factory=dict)
+    checked: dict[str, str] = field(default_factory=dict)
+
+    @staticmethod
+    def open(path: Path, logger) -> "BuildGraph":
+        graph = BuildGraph(path, logger)
+        try:
+            with open(path) as f:
+                content = json.load(f)
+            if content.get("version") == BUILD_VERSION:
+                graph.steps = content["steps"]
+                graph.checked = content["checked"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return graph
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        content = {
+            "version": BUILD_VERSION,
+            "steps": self.steps,
+            "checked": self.checked,
+        }
+        write_atomic(self.path, json.dumps(content, indent=2, sort_keys=True))
+
+    def up_to_date(self, name: str, inputs: str, outputs: Callable[[], str]) -> bool:
+        step = self.steps.get(name)
+        return (
+            step is not None
+            and step["inputs"] == inputs
+            and step["outputs"] == outputs()
+        )
+
+    def step(
+        self, name: str, inputs: str, outputs: Callable[[], str], run: Callable
+    ) -> bool:
+        """Run a step, unless it is up to date. Returns True if it was run.
+
+        A step that fails raises, and is not recorded, so it is run again.
+        """
+        if self.up_to_date(name, inputs, outputs):
+            self.logger.info(f"{name}: up to date")
+            return False
+        run()
+        self.steps[name] = {"inputs": inputs, "outputs": outputs()}
+        self.save()
+        return True
+
 
 @click.command()
 @click.option("--check/--no-check", default=True)
 @click.option("--decompile/--no-decompile", default=True)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="number of parallel jobs used to check and decompile the classes.",
+)
+@click.option(
+    "--force / --no-force",
+    default=False,
+    help="run all steps, even if they are up to date.",
+)
 @click.option("-v", "--verbose", count=True)
-def build(check, decompile, verbose):
+def build(check, decompile, jobs, force, verbose):
     """Rebuild the benchmark-suite."""
 
+    os.chdir(WORKFOLDER)
     logger = setup_logger(verbose)
     suite = Suite(WORKFOLDER, QUERIES, logger)
+    graph = BuildGraph(BUILD_MANIFEST, logger)
+    if not force:
+        graph = BuildGraph.open(BUILD_MANIFEST, logger)
 
-    suite.build()
-    suite.update_cases()
+    sources = Path("src/main/java")
+    classes = Path("target/classes")
+    decompiled = Path("decompiled")
+    stats = Path("stats")
 
-    if check:
-        suite.check()
+    def classes_hash():
+        return hash_files(classes, classes.glob("**/*.class"))
+
+    def run_build():
+        try:
+            suite.build()
+        except subprocess.CalledProcessError as e:
+            raise click.ClickException(
+                f"mvn compile failed with exit code {e.returncode}"
+            )
+
+    graph.step(
+        "classes",
+        hash_files(Path("."), [Path("pom.xml"), *sources.glob("**/*.java")]),
+        classes_hash,
+        run_build,
+    )
+    compiled = classes_hash()
+
+    decompile_inputs = hash_values(compiled, jvm2json_version())
+
+    def decompiled_hash():
+        jsons = [j for j in decompiled.glob("**/*.json") if not j.name.startswith(".")]
+        return hash_files(decompiled, jsons)
+
+    def run_decompile():
+        reused, regenerated = suite.decompile(jobs)
+        logger.success(
+            f"Reused {reused} and regenerated {regenerated} decompiled classes"
+        )
 
     if decompile:
-        suite.decompile()
+        graph.step("decompiled", decompile_inputs, decompiled_hash, run_decompile)
+
+    def cases_hash():
+        return hash_files(stats, [stats / "cases.txt", stats / "distribution.csv"])
+
+    graph.step("cases", compiled, cases_hash, suite.update_cases)
+    if case_index.is_stale(stats):
+        logger.info("Indexing the cases")
+        case_index.build(stats, QUERIES)
+
+    if check:
+        # The methods are only fingerprinted from the decompiled json, if it
+        # is up to date with the classes. Otherwise everything is checked.
+        runtime = hash_files(
+            classes,
+            [c for c in classes.glob("**/*.class") if "cases" not in c.parts],
+        )
+        fingerprints = {}
+        if graph.up_to_date("decompiled", decompile_inputs, decompiled_hash):
+            fingerprints = method_index.fingerprints(decompiled)
+
+        def fingerprint(case):
+            if (method := fingerprints.get(str(case.methodid))) is None:
+                return None
+            return hash_values(runtime, str(case), method)
+
+        cases = {str(case): (case, fingerprint(case)) for case in suite.cases()}
+        todo = [
+            case
+            for key, (case, fp) in sorted(cases.items())
+            if fp is None or graph.checked.get(key) != fp
+        ]
+        logger.info(f"Checking {len(todo)} of {len(cases)} cases")
+
+        failed = suite.failed_checks(todo, jobs) if todo else []
+        # Every case is either unchanged since it was checked, or was just checked
+        graph.checked = {
+            key: fp
+            for key, (case, fp) in cases.items()
+            if fp is not None and case not in failed
+        }
+        graph.save()
+
+        if failed:
+            logger.error("Failed checks:")
+            for f in failed:
+                logger.error(f)
+        else:
+            logger.success("Successfully verified all cases.")
 
 
 if __name__ == "__main__":
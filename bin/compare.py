@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+""" Compare the times of the tools in two evaluations.
+
+Every method is run `-N` times, so the noise in its time can be estimated from
+its runs. The runs of every method are resampled with replacement (a
+bootstrap), which gives a confidence interval of the ratio between its mean
+time in the new and in the old evaluation. The same resamples, combined like
+in `bin/stats.py`, give an interval for every tool: the sum of the mean times
+of its methods, and the geometric mean of their mean relative times.
+
+    python bin/compare.py before.json after.json --threshold 0.1
+
+A change is significant when the whole interval is above 1, a regression, or
+below 1, an improvement. The command fails if a tool is confidently slower by
+more than the threshold, that is when its interval is above 1 + threshold.
+"""
+
+from pathlib import Path
+import click
+import sys
+
+import numpy as np
+
+import utils
+
+# Methods need this many runs in both evaluations to estimate their noise
+MIN_RUNS = 2
+
+METRICS = ["time", "relative"]
+
+
+def read_runs(file: Path, time_key: str, relative_key: str, cached: bool, logger):
+    """Read the (time x relative) runs of every method of every tool in a
+    result file.
+    """
+    experiments = list(utils.read_results(file, logger))
+    if len(experiments) != 1:
+        raise click.UsageError(
+            f"{file} should contain one result, not {len(experiments)}"
+        )
+    _, experiment = experiments[0]
+
+    tools = {}
+    for tool, ctx in experiment["tools"].items():
+        methods = {}
+        for r in ctx.get("results") or []:
+            if r.get("cached") and not cached:
+                continue
+            methods.setdefault(r["method"], []).append([r[time_key], r[relative_key]])
+        runs = {m: np.array(v, dtype=float) for m, v in methods.items()}
+        tools[tool] = {m: v[np.isfinite(v).all(axis=1)] for m, v in runs.items()}
+    return tools
+
+
+def bootstrap(runs: np.ndarray, resamples: int, rng) -> np.ndarray:
+    """The means of resamples of the runs, a (resamples x metric) array."""
+    picks = rng.integers(0, len(runs), (resamples, len(runs)))
+    return runs[picks].mean(axis=1)
+
+
+def interval(ratios: np.ndarray, confidence: float) -> tuple[np.ndarray, np.ndarray]:
+    """The percentile interval of resampled ratios, over the first axis."""
+    alpha = 1 - confidence
+    low, high = np.quantile(ratios, [alpha / 2, 1 - alpha / 2], axis=0)
+    return low, high
+
+
+def change(low: float, high: float) -> str:
+    if low > 1:
+        return "regression"
+    if high < 1:
+        return "improvement"
+    return ""
+
+
+def compare_tool(old: dict, new: dict, resamples, confidence, rng):
+    """Compare the runs of a tool, and return a row for every metric of every
+    method and for the tool.
+    """
+    methods = sorted(
+        m
+        for m in old.keys() & new.keys()
+        if len(old[m]) >= MIN_RUNS and len(new[m]) >= MIN_RUNS
+    )
+    if not methods:
+        return [], []
+
+    # (method x resample x metric)
+    before = np.stack([bootstrap(old[m], resamples, rng) for m in methods])
+    after = np.stack([bootstrap(new[m], resamples, rng) for m in methods])
+    point_before = np.stack([old[m].mean(axis=0) for m in methods])
+    point_after = np.stack([new[m].mean(axis=0) for m in methods])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        low, high = interval((after / before).transpose(1, 0, 2), confidence)
+        ratio = point_after / point_before
+
+    method_rows = []
+    for i, m in enumerate(methods):
+        for j, metric in enumerate(METRICS):
+            method_rows.append(
+                {
+                    "method": m,
+                    "metric": metric,
+                    "old": point_before[i, j],
+                    "new": point_after[i, j],
+                    "ratio": ratio[i, j],
+                    "low": low[i, j],
+                    "high": high[i, j],
+                    "change": change(low[i, j], high[i, j]),
+                }
+            )
+
+    def combine(means: np.ndarray) -> np.ndarray:
+        time = means[..., 0].sum(axis=0)
+        relative = np.exp(np.log(means[..., 1]).mean(axis=0))
+        return np.stack([time, relative], axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tool_low, tool_high = interval(combine(after) / combine(before), confidence)
+        tool_before, tool_after = combine(point_before), combine(point_after)
+    tool_rows = [
+        {
+            "methods": len(methods),
+            "metric": metric,
+            "old": tool_before[j],
+            "new": tool_after[j],
+            "ratio": tool_after[j] / tool_before[j],
+            "low": tool_low[j],
+            "high": tool_high[j],
+            "change": change(tool_low[j], tool_high[j]),
+        }
+        for j, metric in enumerate(METRICS)
+    ]
+    return method_rows, tool_rows
+
+
+@click.command()
+@click.option("-v", "--verbose", count=True)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(writable=True, dir_okay=False),
+    help="write the comparison of every method as csv.",
+)
+@click.option(
+    "--time",
+    "times",
+    type=click.Choice(["raw", "adjusted"]),
+    default="raw",
+    show_default=True,
+    help="compare the raw times, or the times without the startup of the tools.",
+)
+@click.option(
+    "--cached / --no-cached",
+    default=False,
+    show_default=True,
+    help="include the times of results that were reused from the cache.",
+)
+@click.option(
+    "--confidence",
+    type=click.FloatRange(0, 1, min_open=True, max_open=True),
+    default=0.95,
+    show_default=True,
+    help="the confidence level of the intervals.",
+)
+@click.option(
+    "--resamples",
+    type=click.IntRange(min=100),
+    default=10_000,
+    show_default=True,
+    help="the number of bootstrap resamples.",
+)
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0),
+    default=0.05,
+    show_default=True,
+    help="fail if a tool is significantly slower by more than this fraction.",
+)
+@click.option(
+    "--metric",
+    type=click.Choice(METRICS),
+    default="relative",
+    show_default=True,
+    help="the metric that the threshold is checked against.",
+)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.argument("OLD", type=click.Path(exists=True, readable=True, path_type=Path))
+@click.argument("NEW", type=click.Path(exists=True, readable=True, path_type=Path))
+def compare(
+    old,
+    new,
+    output,
+    times,
+    cached,
+    confidence,
+    resamples,
+    threshold,
+    metric,
+    seed,
+    verbose,
+):
+    """Compare the times of the tools in two results, with bootstrap
+    confidence intervals over the iterations of every method.
+    """
+    import pandas as pd
+
+    logger = utils.setup_logger(verbose)
+
+    time_key, relative_key = "time", "relative"
+    if times == "adjusted":
+        time_key, relative_key = "adjusted_time", "adjusted_relative"
+
+    before = read_runs(old, time_key, relative_key, cached, logger)
+    after = read_runs(new, time_key, relative_key, cached, logger)
+    if missing := sorted(before.keys() ^ after.keys()):
+        logger.warning(f"Only one of the results has {', '.join(missing)}")
+
+    rng = np.random.default_rng(seed)
+    method_rows, tool_rows = [], []
+    for tool in sorted(before.keys() & after.keys()):
+        # Tools that were filtered out of the evaluation have no results
+        if not before[tool] or not after[tool]:
+            continue
+        methods, tools = compare_tool(
+            before[tool], after[tool], resamples, confidence, rng
+        )
+        if not tools:
+            logger.warning(
+                f"{tool} has no methods with {MIN_RUNS} runs in both results,"
+                " run them with more iterations (-N)"
+            )
+            continue
+        compared = tools[0]["methods"]
+        if skipped := len(before[tool].keys() | after[tool].keys()) - compared:
+            logger.warning(f"{tool}: left out {skipped} methods with too few runs")
+        method_rows += [{"tool": tool} | row for row in methods]
+        tool_rows += [{"tool": tool} | row for row in tools]
+
+    if not tool_rows:
+        logger.error("Found no tools to compare")
+        sys.exit(1)
+
+    per_method = pd.DataFrame(method_rows)
+    per_tool = pd.DataFrame(tool_rows)
+
+    if output:
+        per_method.to_csv(output, index=False)
+        logger.success(f"Written the comparison of the methods to {output!r}")
+
+    pd.set_option("display.width", 200)
+    changed = per_method[per_method["change"] != ""]
+    if len(changed):
+        # Every method is tested on its own, so at a confidence of 95% about 1
+        # in 20 of the methods that did not change is flagged as well
+        logger.info(
+            f"{len(changed)} method changes at a confidence of {confidence:.0%}"
+        )
+        if verbose:
+            print(changed.set_index(["tool", "method", "metric"]).to_string())
+            print()
+    print(per_tool.set_index(["tool", "metric"]).to_string())
+
+    checked = per_tool[per_tool["metric"] == metric]
+    if len(failed := checked[checked["low"] > 1 + threshold]):
+        for _, row in failed.iterrows():
+            logger.error(
+                f"{row['tool']} is slower by {row['low'] - 1:.1%} to"
+                f" {row['high'] - 1:.1%} ({metric}), more than {threshold:.1%}"
+            )
+        sys.exit(1)
+    logger.success(f"No tool is significantly slower by more than {threshold:.1%}")
+
+
+if __name__ == "__main__":
+    compare()
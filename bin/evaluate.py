@@ -3,15 +3,24 @@
 """
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 import click
+import collections
+import functools
 import math
 import os
+import queue
+import statistics
 import subprocess
-from time import perf_counter_ns
+import threading
+from time import monotonic, perf_counter_ns
+from typing import Optional
 
 from utils import *
+from jpamb_utils import registry as method_registry
 
 
 def add_timeout(m):
@@ -38,6 +47,9 @@ def tool_parser(ctx_, parms_, tools):
 def experiment_parser(ctx_, parms_, experiment):
     import yaml
 
+    if experiment is None:
+        return None
+
     with open(experiment) as f:
         experiment = yaml.safe_load(f)
 
@@ -67,6 +79,74 @@ def experiment_parser(ctx_, parms_, experiment):
         elif isinstance(t["executable"], str):
             t["executable"] = [t["executable"]]
 
+        if not isinstance(t.setdefault("worker", False), bool):
+            raise click.UsageError(
+                context + f"'tools.{tn}.worker' should be true or false"
+            )
+
+        zygote = t.setdefault("zygote", None)
+        if zygote is not None:
+            if not (
+                isinstance(zygote, list) and all(isinstance(m, str) for m in zygote)
+            ):
+                raise click.UsageError(
+                    context + f"'tools.{tn}.zygote' should be a list of modules"
+                )
+            if t["worker"]:
+                raise click.UsageError(
+                    context + f"'tools.{tn}' can't be both a worker and a zygote"
+                )
+            if not hasattr(os, "fork"):
+                raise click.UsageError(
+                    context + f"'tools.{tn}.zygote' needs an os that supports fork"
+                )
+            if len(t["executable"]) < 2:
+                raise click.UsageError(
+                    context
+                    + f"'tools.{tn}.zygote' needs an executable like [python, script.py]"
+                )
+
+        sources = t.setdefault("sources", [])
+        if not (isinstance(sources, list) and all(isinstance(g, str) for g in sources)):
+            raise click.UsageError(
+                context + f"'tools.{tn}.sources' should be a list of file patterns"
+            )
+
+        probe = t.setdefault("probe", None)
+        if isinstance(probe, str):
+            t["probe"] = [probe]
+        elif probe is not None and not (
+            isinstance(probe, list) and all(isinstance(a, str) for a in probe)
+        ):
+            raise click.UsageError(
+                context + f"'tools.{tn}.probe' should be a list of arguments"
+            )
+
+        limits = t.setdefault("limits", None)
+        if limits is not None:
+            if not isinstance(limits, dict) or not set(limits) <= {"memory", "cpu"}:
+                raise click.UsageError(
+                    context + f"'tools.{tn}.limits' can only have 'memory' and 'cpu'"
+                )
+            try:
+                if limits.get("memory") is not None:
+                    limits["memory"] = parse_size(limits["memory"])
+                if limits.get("cpu") is not None:
+                    limits["cpu"] = float(limits["cpu"])
+            except ValueError:
+                raise click.UsageError(
+                    context
+                    + f"'tools.{tn}.limits' should be a size like 2G and seconds"
+                )
+            if t["worker"] and limits.get("cpu") is not None:
+                raise click.UsageError(
+                    context + f"'tools.{tn}' can't limit the cpu time of a worker"
+                )
+            if not hasattr(os, "wait4"):
+                raise click.UsageError(
+                    context + f"'tools.{tn}.limits' needs an os with resource limits"
+                )
+
     if not "machine" in experiment:
         raise click.UsageError(context + "no 'machine'")
 
@@ -83,6 +163,274 @@ def experiment_parser(ctx_, parms_, experiment):
     return experiment
 
 
+JOURNAL_VERSION = 1
+
+
+class Journal:
+    """The results of an evaluation, appended as json lines as soon as they
+    are complete, so that an interrupted evaluation can be resumed.
+
+    The first line is the `header` of the experiment, and every other line is
+    either the `result` of a run of a tool, a calibration `window`, the
+    `baselines` and `probes` of a session, or a `node` that joined it. With
+    `resume`, the records of an existing journal with the same header are
+    kept, and `done` has the (method, tool, iteration) of their results. The
+    results of runs that were not ok are dropped, so that they run again.
+    """
+
+    def __init__(self, path: Path, header: dict, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        self.windows = 0
+        if resume and path.exists():
+            self.load(header)
+            self.file = open(path, "a", encoding="utf-8")
+        else:
+            self.file = open(path, "w", encoding="utf-8")
+            self.write({"header": header})
+
+    def load(self, header: dict):
+        size = 0
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        try:
+            with open(self.path, "rb") as f, open(tmp, "wb") as kept:
+                for line in f:
+                    # A crash can leave the last line half written
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if size == 0 and record.get("header") != header:
+                        raise click.UsageError(
+                            f"the journal {str(self.path)!r} is of another"
+                            " experiment, run without --resume to start over"
+                        )
+                    if "result" in record:
+                        result = record["result"]
+                        if result["status"] != "ok":
+                            continue
+                        self.done.add(
+                            (result["method"], record["tool"], result["iteration"])
+                        )
+                    elif "window" in record:
+                        self.windows += 1
+                    kept.write(line)
+                    size += len(line)
+            if size == 0:
+                raise click.UsageError(f"the journal {str(self.path)!r} is empty")
+            os.replace(tmp, self.path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def write(self, record: dict):
+        with self.lock:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+
+    def result(self, tool_name: str, order, result: dict):
+        self.write({"tool": tool_name, "order": order, "result": result})
+
+    def window(self, window: dict) -> int:
+        """Write a calibration window, and return its number."""
+        with self.lock:
+            number = self.windows
+            self.windows += 1
+            self.file.write(json.dumps({"window": dict(window, number=number)}) + "\n")
+            self.file.flush()
+        return number
+
+    def close(self):
+        self.file.close()
+
+
+def aggregate(journal: Path, experiment: dict, output, iterations: int, logger):
+    """Write the results in the journal to `output`, as part of the
+    experiment, with the totals of every tool.
+
+    This is a single pass over the journal, where the results of every tool
+    are spooled to a temporary file, so only their order is kept in memory.
+    Results are in the order they would have been run in one job.
+    """
+    import tempfile
+
+    tools = experiment["tools"]
+    spools = {}
+    totals = defaultdict(lambda: defaultdict(float))
+    statuses = defaultdict(collections.Counter)
+    windows = []
+    baselines = []
+    nodes = {}
+    flagged = excursions = 0
+
+    with open(journal, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if "window" in record:
+                windows.append(record["window"])
+                continue
+            if "baselines" in record:
+                baselines.extend(record["baselines"])
+                continue
+            if "probes" in record:
+                for k, probe in record["probes"].items():
+                    tools[k].setdefault("probes", []).extend(probe["times"])
+                    tools[k]["startup"] = probe["startup"]
+                    tools[k]["startup_noise"] = probe["noise"]
+                    if "node" in record:
+                        startups = tools[k].setdefault("startups", {})
+                        startups[record["node"]] = probe["startup"]
+                continue
+            if "node" in record:
+                node = nodes[record["node"]["name"]] = record["node"]
+                node["results"] = 0
+                continue
+            if "result" not in record:
+                continue
+
+            tool_name, r = record["tool"], record["result"]
+            if tool_name not in spools:
+                spools[tool_name] = (tempfile.TemporaryFile(), [])
+            spool, order = spools[tool_name]
+            content = json.dumps(r).encode()
+            order.append((record["order"], spool.tell(), len(content)))
+            spool.write(content)
+
+            t = totals[tool_name]
+            t["count"] += 1
+            t["score"] += r["score"]
+            t["time"] += r["time"]
+            t["relative"] += math.log(r["relative"])
+            if r["adjusted_time"] is not None:
+                t["adjusted"] += 1
+                t["adjusted_time"] += r["adjusted_time"]
+                t["adjusted_relative"] += math.log(r["adjusted_relative"])
+            statuses[tool_name][r["status"]] += 1
+            flagged += r["oversubscribed"]
+            excursions += r["excursion"]
+            if "node" in r:
+                nodes[r["node"]]["results"] += 1
+
+    if flagged:
+        logger.warning(
+            f"{flagged} results were taken while the cores were oversubscribed"
+        )
+    if excursions:
+        logger.warning(
+            f"{excursions} results were taken while the calibrations drifted"
+        )
+
+    for k, t in sorted(totals.items()):
+        if failures := {s: n for s, n in statuses[k].items() if s != "ok"}:
+            pretty = ", ".join(f"{n} {s}" for s, n in sorted(failures.items()))
+            logger.warning(f"Runs of {k} that failed: {pretty}")
+        tools[k]["results"] = f"@@results {k}@@"
+        tools[k]["score"] = score = t["score"] / iterations
+        tools[k]["time"] = time = t["time"] / t["count"]
+        tools[k]["relative"] = relative = math.exp(t["relative"] / t["count"])
+        # Only the runs that were measurably slower than the startup have an
+        # adjusted time
+        tools[k]["adjusted_runs"] = adjusted = int(t["adjusted"])
+        tools[k]["adjusted_time"] = tools[k]["adjusted_relative"] = None
+        without = "no runs were measurably slower than the startup"
+        if tools[k].get("startup") is None:
+            without = "not adjusted, as it could not be probed"
+        if adjusted:
+            tools[k]["adjusted_time"] = adjusted_time = t["adjusted_time"] / adjusted
+            tools[k]["adjusted_relative"] = adjusted_relative = math.exp(
+                t["adjusted_relative"] / adjusted
+            )
+            without = (
+                f"{adjusted_time/1_000_000:0.1f}ms/{adjusted_relative:0.3f}x"
+                f" without startup, in {adjusted} of {int(t['count'])} runs"
+            )
+
+        logger.success(
+            f"Tested {k}: score {score:0.2f} in avg {time/1_000_000:0.0f}ms/{relative:0.3f}x"
+            f" ({without})"
+        )
+
+    for name, node in sorted(nodes.items()):
+        logger.info(f"{name} ran {node['results']} results on {node['jobs']} jobs")
+
+    experiment["baselines"] = baselines
+    experiment["calibrations"] = windows
+    if nodes:
+        experiment["nodes"] = list(nodes.values())
+
+    # The results are streamed into the place of their markers
+    content = json.dumps(experiment)
+    with open(output, "w", encoding="utf-8") as fp:
+        for k in (k for k in tools if k in spools):
+            spool, order = spools[k]
+            before, content = content.split(json.dumps(f"@@results {k}@@"), 1)
+            fp.write(before + "[")
+            for i, (_, offset, length) in enumerate(sorted(order)):
+                spool.seek(offset)
+                fp.write(("," if i else "") + spool.read(length).decode())
+            fp.write("]")
+            spool.close()
+        fp.write(content)
+
+
+RESULT_CACHE = WORKFOLDER / "target" / "results-cache"
+RESULT_CACHE_VERSION = 3
+
+
+def tool_fingerprint(tool) -> str:
+    """Hash how a tool is run: its executable, the files in it, and the files
+    that match its `sources`, relative to the working folder.
+    """
+    import hashlib
+
+    files = {a for a in tool["executable"] if Path(a).is_file()}
+    for pattern in tool["sources"]:
+        files.update(str(p) for p in WORKFOLDER.glob(pattern) if p.is_file())
+    contents = {
+        f: hashlib.sha256(Path(f).read_bytes()).hexdigest() for f in sorted(files)
+    }
+    return hash_values(
+        tool["executable"],
+        tool["worker"],
+        tool["zygote"],
+        tool["limits"],
+        contents,
+    )
+
+
+# The arguments that tools are probed with to measure their startup time, the
+# simplest method in the suite, unless the tool has its own `probe`. The
+# analysis of this method is part of the startup, so a tool that has a mode
+# that does nothing should use it as its `probe`.
+PROBE = ["jpamb.cases.Simple.justReturnNothing:()V"]
+
+# A calibration that is this much slower than the baseline of its core means
+# that the core was shared with other processes.
+OVERSUBSCRIBED = 1.5
+
+
+def available_cores() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+@contextmanager
+def pinned_to(core):
+    """Pin the current thread, and the processes it starts, to a core."""
+    if core is None:
+        yield
+        return
+    before = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, {core})
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, before)
+
+
 def calibrate(sieve_exe, log_calibration):
     calibrators = [100_000, 100_000]
     calibration = 0
@@ -98,6 +446,790 @@ def calibrate(sieve_exe, log_calibration):
     return calibration
 
 
+# Calibrations that differ by more than this have drifted, which makes the
+# calibrations more frequent, and flags the runs in between as excursions.
+DRIFT = 0.1
+
+
+class Calibrator:
+    """Calibrates the core of a job at most every `interval` seconds, and
+    more often when the calibrations drift.
+
+    The runs between two calibrations are normalized with a calibration that
+    is interpolated between them, so the relative times of a result are only
+    set at the next calibration, or when the calibrator is closed, which then
+    calls the `done` of the result. The samples of every calibration are
+    written once to the `journal`.
+    """
+
+    def __init__(self, sieve_exe, core, baseline, interval, journal: "Journal"):
+        self.sieve_exe = sieve_exe
+        self.core = core
+        self.baseline = baseline
+        self.interval = self.max_interval = interval
+        self.journal = journal
+        self.last = (monotonic(), baseline)
+        self.pending = []
+
+    def add(self, result, when, done):
+        """Add a result, that was run at `when`, and calibrate if it is due."""
+        self.pending.append((result, when, done))
+        if monotonic() - self.last[0] >= self.interval:
+            self.calibrate()
+
+    def close(self):
+        if self.pending:
+            with pinned_to(self.core):
+                self.calibrate()
+
+    def calibrate(self):
+        samples = []
+        calibration = calibrate(self.sieve_exe, lambda **kw: samples.append(kw))
+        now = monotonic()
+        start, previous = self.last
+
+        times = [s["time"] for s in samples]
+        unstable = max(times) > min(times) * (1 + DRIFT)
+        drift = abs(calibration / previous - 1)
+        excursion = unstable or drift > DRIFT
+
+        window = self.journal.window(
+            {
+                "core": self.core,
+                "calibration": calibration,
+                "samples": samples,
+                "runs": len(self.pending),
+                "drift": drift,
+                "excursion": excursion,
+            }
+        )
+
+        for result, when, done in self.pending:
+            share = (when - start) / (now - start) if now > start else 1.0
+            interpolated = previous + (calibration - previous) * share
+            result["calibration"] = interpolated
+            result["relative"] = result["time"] / interpolated
+            if result["adjusted_time"] is not None:
+                result["adjusted_relative"] = result["adjusted_time"] / interpolated
+            result["window"] = window
+            result["excursion"] = excursion
+            # A core that is much slower than its baseline is shared with others
+            if interpolated > self.baseline * OVERSUBSCRIBED:
+                result["oversubscribed"] = True
+            done(result)
+        self.pending.clear()
+
+        if drift > DRIFT:
+            self.interval /= 2
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        self.last = (now, calibration)
+
+
+def assign_cores(jobs, logger) -> tuple[list, bool]:
+    """Assign every job a core, and return whether the cores are
+    oversubscribed.
+    """
+    cores = available_cores()
+    pinned = jobs > 1 and hasattr(os, "sched_setaffinity")
+    if jobs > 1 and not pinned:
+        logger.warning("Can't pin jobs to cores on this platform")
+    if jobs > len(cores):
+        logger.warning(
+            f"Running {jobs} jobs on {len(cores)} cores,"
+            " all results will be flagged as oversubscribed"
+        )
+    assigned = [cores[i % len(cores)] if pinned else None for i in range(jobs)]
+    return assigned, jobs > len(cores)
+
+
+def measure_baselines(sieve_exe, assigned, iterations, logger) -> dict:
+    """Every core gets its own baseline, measured before the jobs start."""
+    baselines = {}
+    for core in sorted(set(assigned), key=str):
+        with pinned_to(core):
+            for i in range(iterations):
+                calibration = calibrate(sieve_exe, lambda **kwargs: ())
+                logger.info(
+                    f"Base calibrated {i}"
+                    + (f" on core {core}" if core is not None else "")
+                    + f": {calibration/1_000_000:0.0f}ms"
+                )
+            baselines[core] = calibration
+    return baselines
+
+
+class Runner:
+    """Runs the tools of an experiment in jobs, which are threads that are
+    each pinned to their own core.
+
+    Workers and zygotes answer one request at a time, so every job gets its
+    own, which are started on the core of the job, and its own calibrator.
+    """
+
+    def __init__(
+        self, tools, timeout, sieve_exe, calibration_interval, oversubscribed, logger
+    ):
+        self.tools = tools
+        self.timeout = timeout
+        self.sieve_exe = sieve_exe
+        self.calibration_interval = calibration_interval
+        self.oversubscribed = oversubscribed
+        self.logger = logger
+        self.limits = {
+            tool_name: Limits(**tool["limits"])
+            for tool_name, tool in tools.items()
+            if tool["limits"] is not None
+        }
+        self.startups = {}
+        self.noises = {}
+        self.local = threading.local()
+        self.started = []
+        self.calibrators = []
+        self.stopped = threading.Event()
+
+    def setup_job(self, core, baseline, journal):
+        """Set up the current thread as a job on `core`, which writes its
+        calibrations to `journal`.
+        """
+        local = self.local
+        local.core = core
+        if core is not None:
+            os.sched_setaffinity(0, {core})
+        local.workers = {
+            tool_name: Worker(
+                tool["executable"],
+                logger=self.logger,
+                limits=self.limits.get(tool_name),
+            )
+            for tool_name, tool in self.tools.items()
+            if tool["worker"]
+        }
+        local.zygotes = {
+            tool_name: Zygote(
+                tool["zygote"], logger=self.logger, python=tool["executable"][0]
+            )
+            for tool_name, tool in self.tools.items()
+            if tool["zygote"] is not None
+        }
+        self.started.extend(local.workers.values())
+        self.started.extend(local.zygotes.values())
+        local.calibrator = Calibrator(
+            self.sieve_exe, core, baseline, self.calibration_interval, journal
+        )
+        self.calibrators.append(local.calibrator)
+
+    def execute(self, tool_name, args):
+        """Run a tool, and return its output, time, status, and usage."""
+        logger = self.logger
+        tool = self.tools[tool_name]
+        usage = {}
+        status = "ok"
+        try:
+            if worker := self.local.workers.get(tool_name):
+                fpred, time_ns = worker.request(args, timeout=self.timeout)
+            else:
+                fpred, time_ns = run_cmd(
+                    tool["executable"] + args,
+                    timeout=self.timeout,
+                    logger=logger,
+                    zygote=self.local.zygotes.get(tool_name),
+                    limits=self.limits.get(tool_name),
+                    usage=usage,
+                )
+        except LimitExceeded as e:
+            logger.warning(f"Tool {tool_name!r} exceeded its {e.limit} limit")
+            fpred, time_ns = "", float("NaN")
+            status = f"{e.limit} limit"
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"Tool {tool_name!r} failed with {e}")
+            fpred, time_ns = "", float("NaN")
+            status = "error"
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Tool {tool_name!r} timed out")
+            fpred, time_ns = "", float("NaN")
+            status = "timeout"
+        return fpred, time_ns, status, usage
+
+    def probe(self, tool_name):
+        self.logger.debug(f"Probing {tool_name!r}")
+        args = self.tools[tool_name]["probe"] or PROBE
+        _, time_ns, status, _ = self.execute(tool_name, args)
+        return time_ns if status == "ok" else None
+
+    def probe_all(self, executor, tool_names, probes) -> dict:
+        """Probe the tools before they are run, so that every result can be
+        adjusted for the startup of its tool, and return the probes.
+
+        Workers are started before they are timed, so they have no startup
+        and are not probed.
+        """
+        probed = defaultdict(list)
+        for tool_name in sorted(tool_names):
+            if self.tools[tool_name]["worker"]:
+                self.startups[tool_name] = self.noises[tool_name] = 0
+                probed[tool_name] = []
+        futures = {
+            executor.submit(self.probe, tool_name): tool_name
+            for tool_name in sorted(tool_names)
+            if not self.tools[tool_name]["worker"]
+            for _ in range(probes)
+        }
+        for future in as_completed(futures):
+            probed[futures[future]].append(future.result())
+        for tool_name, times in sorted(probed.items()):
+            if self.tools[tool_name]["worker"]:
+                continue
+            if ok := [t for t in times if t is not None]:
+                self.startups[tool_name] = statistics.median(ok)
+                self.noises[tool_name] = max(ok) - min(ok)
+                self.logger.info(
+                    f"Probed {tool_name}:"
+                    f" startup {self.startups[tool_name]/1_000_000:0.1f}ms,"
+                    f" spread {self.noises[tool_name]/1_000_000:0.1f}ms"
+                    f" over {len(ok)} probes"
+                )
+            else:
+                self.logger.warning(
+                    f"Could not probe {tool_name}, its times are not adjusted"
+                )
+        return {
+            tool_name: {
+                "times": times,
+                "startup": self.startups.get(tool_name),
+                "noise": self.noises.get(tool_name),
+            }
+            for tool_name, times in probed.items()
+        }
+
+    def run(self, m, outcomes, n, tool_name, cached, done):
+        """Run a tool on a method, and score its predictions against the
+        `outcomes` of the cases of the method. The result, with the `output`
+        of the tool, is passed to `done` once its relative times are set.
+        """
+        if self.stopped.is_set():
+            return
+        logger = self.logger
+        tool = self.tools[tool_name]
+        core = self.local.core
+        if cached is not None:
+            logger.debug(f"Reusing the cached result of {tool_name!r}")
+            fpred, time_ns = cached["output"], cached["time"]
+            status, usage = cached["status"], cached["usage"]
+            startup, noise = cached["startup"], cached["startup_noise"]
+        else:
+            logger.debug(f"Testing {tool_name!r}")
+            start = monotonic()
+            fpred, time_ns, status, usage = self.execute(tool_name, [str(m)])
+            when = (start + monotonic()) / 2
+            startup = self.startups.get(tool_name)
+            noise = self.noises.get(tool_name)
+
+        total = 0
+        time = time_ns / 1_000_000_000
+
+        # Without the startup of the tool, the time is closer to the cost of
+        # its analysis. A run that is not slower than the startup by more than
+        # the spread of the probes can't be told apart from the startup, so it
+        # has no adjusted time, and neither has a run of a tool that could not
+        # be probed, or that failed.
+        adjusted_ns = None
+        if startup is not None and time_ns - startup > noise:
+            adjusted_ns = time_ns - startup
+
+        predictions = {}
+        for line in fpred.splitlines():
+            try:
+                query, pred = line.split(";")
+                logger.debug(f"response: {line}")
+            except ValueError:
+                logger.warning(f"Tool {tool_name!r} produced bad output")
+                logger.warning(line)
+                continue
+            if not query in QUERIES:
+                logger.warning(f"{query!r} not a known query")
+                continue
+            prediction = Prediction.parse(pred)
+            predictions[query] = prediction
+            sometimes = query in outcomes
+            score = prediction.score(sometimes)
+            logger.debug(
+                f"Check query {query!r} ({sometimes}): waged {prediction.wager:0.3f}"
+                f" and predicted {prediction.to_probability():0.3%}, got {score:0.3f}"
+            )
+            total += score
+
+        pretty = ", ".join(f"{k} ({str(p)})" for k, p in sorted(predictions.items()))
+        logger.info(f"{tool_name!r} scored {total:0.2f} in {time:0.3}s with {pretty}")
+
+        # The relative times are set by the calibrator
+        result = {
+            "method": str(m),
+            "iteration": n,
+            "wagers": {k: p.wager for k, p in predictions.items()},
+            "time": time_ns,
+            "relative": None,
+            "startup": startup,
+            "startup_noise": noise,
+            "adjusted_time": adjusted_ns,
+            "adjusted_relative": None,
+            "usage": usage or None,
+            "status": status,
+            "score": total,
+            "calibration": None,
+            "window": None,
+            "excursion": False,
+            "worker": tool["worker"],
+            "zygote": tool["zygote"] is not None,
+            "core": core,
+            "oversubscribed": self.oversubscribed,
+            "cached": cached is not None,
+            "output": fpred,
+        }
+
+        if cached is not None:
+            # A cached result keeps the calibration it was run with
+            result["calibration"] = calibration = cached["calibration"]
+            result["relative"] = time_ns / calibration
+            if adjusted_ns is not None:
+                result["adjusted_relative"] = adjusted_ns / calibration
+            result["core"] = cached["core"]
+            done(result)
+        else:
+            self.local.calibrator.add(result, when, done)
+
+    def stop(self):
+        """Start no more runs. The tools run in their own sessions, so the
+        runs in progress are not interrupted, and their results are kept.
+        """
+        self.stopped.set()
+
+    def flush(self):
+        """Calibrate the pending results of the current job."""
+        self.local.calibrator.close()
+
+    def close(self):
+        for worker in self.started:
+            worker.close()
+        for calibrator in self.calibrators:
+            calibrator.close()
+
+
+def expected_times(paths, logger) -> dict[tuple[str, str], float]:
+    """The mean time of the runs of every tool on every method that were ok,
+    in the results of earlier evaluations.
+    """
+    times = defaultdict(list)
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                experiment = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the history in {str(path)!r}: {e}")
+            continue
+        for tool_name, tool in experiment.get("tools", {}).items():
+            for result in tool.get("results") or []:
+                if result.get("status", "ok") == "ok":
+                    times[tool_name, result["method"]].append(result["time"])
+    return {key: statistics.fmean(ts) for key, ts in times.items()}
+
+
+def address_parser(ctx_, parms_, address):
+    if address is None:
+        return None
+    host, _, port = address.rpartition(":")
+    try:
+        return host or "localhost", int(port)
+    except ValueError:
+        raise click.BadParameter(f"{address!r} should be like HOST:PORT")
+
+
+async def receive(reader) -> Optional[dict]:
+    """Receive a message, or None if the connection is closed."""
+    line = await reader.readline()
+    return json.loads(line) if line.strip() else None
+
+
+async def send(writer, message: dict):
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
+
+
+class Coordinator:
+    """Hands out the runs of an evaluation to the jobs of the nodes that
+    connect to it over TCP, and journals the results they send back.
+
+    The runs are dealt when `nodes` nodes have joined, longest expected first,
+    each to the job with the least expected work. A job takes its own runs
+    longest first, and when it has none left, it steals the shortest half of
+    the work of the job with the most left, or all of it if that job has
+    disconnected. The runs that a job had not sent back when it disconnected
+    go back to its queue, so they are stolen as well.
+
+    A job that has nothing to run sends its pending results, and then waits
+    for work, until every run is done.
+
+    If not all nodes have joined within `node_timeout` seconds, the runs are
+    dealt to the jobs of the nodes that did, and if no job is running for that
+    long, because no node joined or all of them left, the coordinator gives up.
+    """
+
+    def __init__(
+        self, experiment, items, expected, nodes, node_timeout, record, journal, logger
+    ):
+        self.experiment = experiment
+        self.items = items
+        self.expected = expected
+        self.nodes = nodes
+        self.node_timeout = node_timeout
+        self.record = record
+        self.journal = journal
+        self.logger = logger
+        self.remaining = set(items)
+        self.methods = collections.Counter(item["method"] for item in items.values())
+        self.joined = set()
+        self.dealt = False
+        self.queues = {}
+        self.loads = {}
+        self.running = {}
+        self.alive = set()
+        self.handlers = set()
+
+    async def serve(self, address):
+        import asyncio
+
+        self.changed = asyncio.Condition()
+        self.finished = asyncio.Event()
+        if not self.remaining:
+            return
+        server = await asyncio.start_server(self.handle, *address, limit=2 * MAX_OUTPUT)
+        host, port = server.sockets[0].getsockname()[:2]
+        self.logger.info(
+            f"Coordinating {len(self.remaining)} runs on {host}:{port},"
+            f" waiting for {self.nodes} nodes"
+        )
+        self.stalled_since = monotonic()
+        async with server:
+            while not self.finished.is_set():
+                try:
+                    await asyncio.wait_for(self.finished.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    await self.check_stalled()
+            # The jobs are told that they are done, before the server stops
+            if self.handlers:
+                await asyncio.wait(self.handlers, timeout=10)
+
+    async def check_stalled(self):
+        """Deal the runs to the nodes that have joined, or give up, when no
+        job has been running for `node_timeout` seconds.
+        """
+        now = monotonic()
+        if self.dealt and self.alive:
+            self.stalled_since = now
+            return
+        if now - self.stalled_since < self.node_timeout:
+            return
+        if not self.alive:
+            raise click.ClickException(
+                f"No jobs have been running for {self.node_timeout:g}s,"
+                f" with {len(self.remaining)} runs left"
+            )
+        self.logger.warning(
+            f"Only {len(self.joined)} of {self.nodes} nodes joined within"
+            f" {self.node_timeout:g}s, dealing the runs to them"
+        )
+        async with self.changed:
+            self.deal()
+            self.changed.notify_all()
+
+    async def handle(self, reader, writer):
+        import asyncio
+
+        self.handlers.add(asyncio.current_task())
+        node = job = None
+        try:
+            if (hello := await receive(reader)) is None:
+                return
+            node = hello["hello"]["node"]
+            await send(writer, {"experiment": self.experiment})
+            # A node only asks for the experiment, before it starts its jobs
+            if (ready := await receive(reader)) is None:
+                return
+            if error := self.refuse(node, ready["ready"]):
+                self.logger.error(error)
+                await send(writer, {"error": error})
+                return
+            job = await self.join(node, ready["ready"])
+            await send(writer, {"ok": True})
+            while (message := await receive(reader)) is not None:
+                if "take" in message:
+                    await send(writer, await self.take(job, message["take"]["idle"]))
+                elif "window" in message:
+                    window = dict(message["window"], node=node)
+                    await send(writer, {"number": self.journal.window(window)})
+                elif "result" in message:
+                    await self.report(job, node, message["item"], message["result"])
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning(f"Lost the connection to {node or 'a node'}: {e!r}")
+        finally:
+            writer.close()
+            if job is not None:
+                await self.leave(job, node)
+            self.handlers.discard(asyncio.current_task())
+
+    def refuse(self, node, ready) -> Optional[str]:
+        """Why a node can't run the runs of the experiment, if it can't."""
+        if ready["version"] != self.experiment["version"]:
+            return (
+                f"{node} has version {ready['version']} of the suite,"
+                f" and not {self.experiment['version']}"
+            )
+        fingerprints = self.experiment["fingerprints"]
+        if differ := [
+            k for k in fingerprints if ready["fingerprints"].get(k) != fingerprints[k]
+        ]:
+            return f"the tools {', '.join(sorted(differ))} of {node} are not the same"
+        return None
+
+    async def join(self, node, ready) -> int:
+        job = len(self.queues)
+        self.queues[job] = collections.deque()
+        self.loads[job] = 0.0
+        self.running[job] = set()
+        self.alive.add(job)
+        if node not in self.joined:
+            self.joined.add(node)
+            self.logger.info(f"{node} joined with {ready['machine']['jobs']} jobs")
+            self.journal.write({"node": dict(ready["machine"], name=node)})
+            baselines = [dict(b, node=node) for b in ready["baselines"]]
+            self.journal.write({"baselines": baselines})
+            if ready["probes"]:
+                self.journal.write({"probes": ready["probes"], "node": node})
+        async with self.changed:
+            if not self.dealt and len(self.joined) >= self.nodes:
+                self.deal()
+                self.changed.notify_all()
+        return job
+
+    def deal(self):
+        import heapq
+
+        jobs = [(0.0, job) for job in sorted(self.alive)]
+        for i in sorted(self.remaining, key=lambda i: (-self.expected[i], i)):
+            load, job = heapq.heappop(jobs)
+            self.queues[job].append(i)
+            self.loads[job] += self.expected[i]
+            heapq.heappush(jobs, (self.loads[job], job))
+        self.dealt = True
+        self.logger.info(
+            f"Dealt {len(self.remaining)} runs to {len(self.alive)} jobs"
+            f" of {len(self.joined)} nodes"
+        )
+
+    def next(self, job) -> Optional[int]:
+        queue = self.queues[job]
+        if not queue:
+            victims = [j for j, q in self.queues.items() if q]
+            if not victims:
+                return None
+            victim = max(victims, key=lambda j: (j not in self.alive, self.loads[j]))
+            self.steal(job, victim)
+        i = queue.popleft()
+        self.loads[job] -= self.expected[i]
+        return i
+
+    def steal(self, thief, victim):
+        """Steal the shortest runs of the victim, up to half its work, or all
+        of it if it has disconnected.
+        """
+        queue = self.queues[victim]
+        half = self.loads[victim] / 2 if victim in self.alive else math.inf
+        stolen = []
+        work = 0.0
+        while queue and (not stolen or work + self.expected[queue[-1]] <= half):
+            stolen.append(queue.pop())
+            work += self.expected[stolen[-1]]
+        self.loads[victim] -= work
+        self.loads[thief] += work
+        # The stolen runs are taken longest first as well
+        self.queues[thief].extendleft(stolen)
+        self.logger.debug(f"Job {thief} stole {len(stolen)} runs from job {victim}")
+
+    async def take(self, job, idle) -> dict:
+        async with self.changed:
+            while self.remaining:
+                if self.dealt and (i := self.next(job)) is not None:
+                    self.running[job].add(i)
+                    return {"item": self.items[i]}
+                if not idle:
+                    return {"wait": True}
+                await self.changed.wait()
+        return {"done": True}
+
+    async def report(self, job, node, i, result):
+        self.running[job].discard(i)
+        if i not in self.remaining:
+            self.logger.warning(f"{node} sent a run that was already done")
+            return
+        self.remaining.remove(i)
+        self.record(i, result, node)
+        method = self.items[i]["method"]
+        self.methods[method] -= 1
+        if self.methods[method] == 0:
+            self.logger.success(f"Ran {method}")
+        if not self.remaining:
+            async with self.changed:
+                self.changed.notify_all()
+            self.finished.set()
+
+    async def leave(self, job, node):
+        self.alive.discard(job)
+        lost = self.running.pop(job)
+        if lost:
+            self.logger.warning(
+                f"A job of {node} left with {len(lost)} runs, they are run again"
+            )
+            for i in sorted(lost, key=lambda i: self.expected[i]):
+                self.queues[job].appendleft(i)
+                self.loads[job] += self.expected[i]
+        if self.remaining and self.dealt and not self.alive:
+            self.logger.warning(
+                f"No jobs are left, waiting for nodes to run {len(self.remaining)} runs"
+            )
+        async with self.changed:
+            self.changed.notify_all()
+
+
+class Link:
+    """The connection of a job of a node to the coordinator, with one json
+    message per line.
+    """
+
+    def __init__(self, address):
+        import socket
+
+        self.socket = socket.create_connection(address)
+        self.file = self.socket.makefile("rwb")
+
+    def send(self, message: dict):
+        self.file.write((json.dumps(message) + "\n").encode())
+        self.file.flush()
+
+    def receive(self) -> dict:
+        if not (line := self.file.readline()):
+            raise click.ClickException("the coordinator closed the connection")
+        message = json.loads(line)
+        if "error" in message:
+            raise click.ClickException(message["error"])
+        return message
+
+    def request(self, message: dict) -> dict:
+        self.send(message)
+        return self.receive()
+
+    def window(self, window: dict) -> int:
+        """Send a calibration window, and return its number, like
+        `Journal.window`.
+        """
+        return self.request({"window": window})["number"]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+def join(address, node, jobs, version, sieve_exe, logger):
+    """Run the runs that the coordinator at `address` hands out, in `jobs`
+    jobs, and send back their results, calibrations, and the baselines of
+    the cores.
+    """
+    import platform
+
+    link = Link(address)
+    experiment = link.request({"hello": {"node": node}})["experiment"]
+    link.close()
+    tools = experiment["tools"]
+    logger.info(f"Joined the evaluation of {', '.join(sorted(tools))} as {node}")
+
+    assigned, oversubscribed = assign_cores(jobs, logger)
+    baselines = measure_baselines(sieve_exe, assigned, experiment["iterations"], logger)
+    runner = Runner(
+        tools,
+        experiment["timeout"],
+        sieve_exe,
+        experiment["calibration_interval"],
+        oversubscribed,
+        logger,
+    )
+    ready = {
+        "version": version,
+        "fingerprints": {
+            tool_name: tool_fingerprint(tool) for tool_name, tool in tools.items()
+        },
+        "machine": {
+            "os": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cores": len(available_cores()),
+            "jobs": jobs,
+        },
+        "baselines": [
+            {"core": core, "calibration": calibration}
+            for core, calibration in baselines.items()
+        ],
+        "probes": None,
+    }
+
+    local = threading.local()
+    free_cores = queue.SimpleQueue()
+    for core in assigned:
+        free_cores.put(core)
+
+    def setup_job():
+        local.link = Link(address)
+        local.link.request({"hello": {"node": node}})
+        core = free_cores.get()
+        runner.setup_job(core, baselines[core], local.link)
+
+    def work():
+        link = local.link
+        link.request({"ready": ready})
+        idle = False
+        while not runner.stopped.is_set() and "done" not in (
+            reply := link.request({"take": {"idle": idle}})
+        ):
+            # Before waiting for work, the pending results are sent back
+            if idle := "wait" in reply:
+                runner.flush()
+                continue
+            item = reply["item"]
+            runner.run(
+                item["method"],
+                set(item["outcomes"]),
+                item["iteration"],
+                item["tool"],
+                item["cached"],
+                lambda result, i=item["item"]: link.send({"item": i, "result": result}),
+            )
+        runner.flush()
+        link.close()
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs, initializer=setup_job) as executor:
+            ready["probes"] = runner.probe_all(
+                executor, experiment["probe"], experiment["probes"]
+            )
+            try:
+                for future in [executor.submit(work) for _ in range(jobs)]:
+                    future.result()
+            except KeyboardInterrupt:
+                logger.warning("Interrupted, finishing the runs in progress")
+                runner.stop()
+                raise
+    finally:
+        runner.close()
+    logger.success(f"{node} is done")
+
+
 @click.command()
 @click.option(
     "--timeout",
@@ -122,19 +1254,135 @@ def calibrate(sieve_exe, log_calibration):
     default=1,
     help="number of iterations.",
 )
+@click.option(
+    "--calibration-interval",
+    show_default=True,
+    default=10.0,
+    type=click.FloatRange(min=0),
+    help="seconds between calibrations, which are more frequent when they"
+    " drift; 0 calibrates after every run.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    show_default=True,
+    default=1,
+    type=click.IntRange(min=1),
+    help="number of tools to run in parallel, each pinned to its own core.",
+)
+@click.option(
+    "--probes",
+    show_default=True,
+    default=5,
+    type=click.IntRange(min=0),
+    help="number of times every tool is probed, to measure its startup time.",
+)
+@click.option(
+    "--cache / --no-cache",
+    default=True,
+    show_default=True,
+    help="reuse the results of runs, where the tool, method, and suite are unchanged.",
+)
+@click.option(
+    "--refresh-cache",
+    is_flag=True,
+    help="run everything again, and replace the cached results.",
+)
+@click.option(
+    "--cache-max-size",
+    show_default=True,
+    default="256M",
+    help="the size that the cache is evicted to after the evaluation.",
+)
+@click.option(
+    "--cache-max-age",
+    show_default=True,
+    default=30.0,
+    type=click.FloatRange(min=0),
+    help="days that an unused result stays in the cache.",
+)
+@click.option(
+    "--journal",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="the journal that results are written to as they complete"
+    " [default: the output with the suffix .jsonl]",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="keep the results in the journal, and only run the rest.",
+)
+@click.option(
+    "--coordinate",
+    metavar="HOST:PORT",
+    callback=address_parser,
+    help="hand out the runs to the nodes that connect to this address,"
+    " instead of running them.",
+)
+@click.option(
+    "--nodes",
+    show_default=True,
+    default=1,
+    type=click.IntRange(min=1),
+    help="with --coordinate, the number of nodes to wait for before the runs"
+    " are handed out.",
+)
+@click.option(
+    "--node-timeout",
+    show_default=True,
+    default=600.0,
+    type=click.FloatRange(min=0),
+    help="with --coordinate, the seconds to wait for the nodes to join, and for"
+    " new nodes when all have left.",
+)
+@click.option(
+    "--history",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="with --coordinate, earlier results used to hand out the longest runs"
+    " first [default: the output, if it exists]",
+)
+@click.option(
+    "--connect",
+    metavar="HOST:PORT",
+    callback=address_parser,
+    help="run the runs of the coordinator at this address, instead of an EXPERIMENT.",
+)
+@click.option(
+    "--node",
+    help="with --connect, the name of this node [default: the host and pid]",
+)
 @click.option("-v", "--verbose", count=True)
 @click.option("-o", "--output", show_default=True, default=WORKFOLDER / "result.json")
-@click.argument("EXPERIMENT", callback=experiment_parser)
+@click.argument("EXPERIMENT", required=False, callback=experiment_parser)
 def evaluate(
-    experiment, timeout, iterations, verbose, filter_methods, filter_tools, output
+    experiment,
+    timeout,
+    iterations,
+    calibration_interval,
+    jobs,
+    probes,
+    cache,
+    refresh_cache,
+    cache_max_size,
+    cache_max_age,
+    journal,
+    resume,
+    coordinate,
+    nodes,
+    node_timeout,
+    history,
+    connect,
+    node,
+    verbose,
+    filter_methods,
+    filter_tools,
+    output,
 ):
     """Given an command check if it can predict the results."""
     import random, itertools
 
     logger = setup_logger(verbose)
-    suite = Suite(WORKFOLDER, QUERIES, logger)
-    tools = experiment["tools"]
-    by_tool = defaultdict(list)
 
     with open(WORKFOLDER / "CITATION.cff") as f:
         import yaml
@@ -148,110 +1396,239 @@ def evaluate(
     logger.info(f"Building timer from {sieve}")
     sieve_exe = build_c(sieve, logger)
 
-    for i in range(iterations):
-        calibration = calibrate(sieve_exe, lambda **kwargs: ())
-        logger.info(f"Base calibrated {i}: {calibration/1_000_000:0.0f}ms")
+    # Start the event loop before any job thread is pinned to a core
+    event_loop()
+
+    if connect is not None:
+        import socket
+
+        node = node or f"{socket.gethostname()}-{os.getpid()}"
+        join(connect, node, jobs, version, sieve_exe, logger)
+        return
+    if experiment is None:
+        raise click.UsageError("Missing argument 'EXPERIMENT', or --connect")
+
+    suite = Suite(WORKFOLDER, QUERIES, logger)
+    tools = experiment["tools"]
+
+    # A journal can only be resumed by the same experiment
+    fingerprints = {
+        tool_name: tool_fingerprint(tool) for tool_name, tool in tools.items()
+    }
+    journal = Journal(
+        journal or Path(output).with_suffix(".jsonl"),
+        {
+            "journal": JOURNAL_VERSION,
+            "version": version,
+            "timeout": timeout,
+            "iterations": iterations,
+            "tools": fingerprints,
+        },
+        resume=resume,
+    )
+    if journal.done:
+        logger.info(f"Resuming with {len(journal.done)} results from the journal")
 
-    for m, cases in Case.by_methodid(suite.cases()):
-        if filter_methods and not filter_methods.search(str(m)):
+    # The methods are looked up once, by handle, in the registry of the suite
+    methods = method_registry.load(suite.decompiled())
+    index = suite.index()
+    cases = sorted(map(methods.intern, index.methods()), key=methods.methodid)
+    tasks = []
+    handles = []
+    orders = methods.table()
+    for position, handle in enumerate(cases):
+        m = methods.methodid(handle)
+        if filter_methods and not filter_methods.search(methods.name(handle)):
             logger.trace(f"{m} did not match {filter_methods}")
             continue
 
+        outcomes = set(index.names(index.outcomes(m)))
         for n, (tool_name, tool) in itertools.product(
             range(iterations), random.sample(sorted(tools.items()), k=len(tools))
         ):
             if filter_tools and not filter_tools.search(tool_name):
                 logger.trace(f"{tool_name} did not match {filter_tools}")
                 continue
+            if (methods.name(handle), tool_name, n) in journal.done:
+                continue
+            # The order of the result, if it had been run in one job
+            orders[handle] = position
+            tasks.append((m, outcomes, n, tool_name))
+            handles.append(handle)
 
-            logger.debug(f"Testing {tool_name!r}")
-            try:
-                fpred, time_ns = run_cmd(
-                    tool["executable"] + [str(m)],
-                    timeout=timeout,
-                    logger=logger,
-                )
-            except subprocess.CalledProcessError as e:
-                logger.warning(f"Tool {tool_name!r} failed with {e}")
-                fpred, time_ns = "", float("NaN")
-            except subprocess.TimeoutExpired:
-                logger.warning(f"Tool {tool_name!r} timed out")
-                fpred, time_ns = "", float("NaN")
-
-            total = 0
-            time = time_ns / 1_000_000_000
-            calibrations = []
-            calibration = calibrate(
-                sieve_exe,
-                lambda **kwarg: calibrations.append(kwarg),
+    # A run is cached under the hash of the tool, the bytecode of the method
+    # and the methods it calls, the version of the suite, and the timeout.
+    results_cache = None
+    keys = {}
+    hits = {}
+    if cache:
+        results_cache = ResultCache(
+            RESULT_CACHE,
+            max_size=parse_size(cache_max_size),
+            max_age=cache_max_age * 24 * 60 * 60,
+            refresh=refresh_cache,
+        )
+        bodies = methods.fingerprints()
+        for i, (_, _, n, tool_name) in enumerate(tasks):
+            if (method := bodies[handles[i]]) is None:
+                continue
+            keys[i] = hash_values(
+                RESULT_CACHE_VERSION,
+                fingerprints[tool_name],
+                method,
+                version,
+                timeout,
+                n,
             )
-            relative = time_ns / calibration
-
-            predictions = {}
-            for line in fpred.splitlines():
-                try:
-                    query, pred = line.split(";")
-                    logger.debug(f"response: {line}")
-                except ValueError:
-                    logger.warning(f"Tool {tool_name!r} produced bad output")
-                    logger.warning(line)
-                    continue
-                if not query in QUERIES:
-                    logger.warning(f"{query!r} not a known query")
-                    continue
-                prediction = Prediction.parse(pred)
-                predictions[query] = prediction
-                sometimes = any(query == c.result for c in cases)
-                score = prediction.score(sometimes)
-                logger.debug(
-                    f"Check query {query!r} ({sometimes}): waged {prediction.wager:0.3f}"
-                    f" and predicted {prediction.to_probability():0.3%}, got {score:0.3f}"
-                )
-                total += score
+            if (entry := results_cache.get(keys[i])) is not None:
+                hits[i] = entry
+        logger.info(f"Reusing {len(hits)} of {len(tasks)} results from the cache")
 
-            pretty = ", ".join(
-                f"{k} ({str(p)})" for k, p in sorted(predictions.items())
-            )
-            logger.info(
-                f"{tool_name!r} scored {total:0.2f} in {time:0.3}s/{relative:0.3}x with {pretty}"
+    def record(i, result, node=None):
+        _, _, n, tool_name = tasks[i]
+        output = result.pop("output")
+        # Only clean runs are cached, the others are run again the next time
+        if (
+            i in keys
+            and not result["cached"]
+            and result["status"] == "ok"
+            and not result["oversubscribed"]
+            and not result["excursion"]
+        ):
+            results_cache.put(
+                keys[i],
+                {
+                    "output": output,
+                    "time": result["time"],
+                    "status": result["status"],
+                    "usage": result["usage"],
+                    "startup": result["startup"],
+                    "startup_noise": result["startup_noise"],
+                    "calibration": result["calibration"],
+                    "core": result["core"],
+                },
             )
+        if node is not None:
+            result["node"] = node
+        journal.result(tool_name, [orders[handles[i]], n], result)
 
-            by_tool[tool_name].append(
-                {
-                    "method": str(m),
+    uncached = {tool_name for i, (*_, tool_name) in enumerate(tasks) if i not in hits}
+    if coordinate is not None:
+        # The runs are handed out longest first, by the times of earlier
+        # results, or of the tool, or the timeout if the tool is new.
+        if not history and Path(output).exists():
+            history = [Path(output)]
+        known = expected_times(history, logger)
+        by_tool = defaultdict(list)
+        for (tool_name, _), time in known.items():
+            by_tool[tool_name].append(time)
+        expected = {}
+        for i, (*_, tool_name) in enumerate(tasks):
+            if i in hits:
+                expected[i] = 0.0
+            elif (time := known.get((tool_name, methods.name(handles[i])))) is not None:
+                expected[i] = time
+            elif by_tool[tool_name]:
+                expected[i] = statistics.fmean(by_tool[tool_name])
+            else:
+                expected[i] = timeout * 1_000_000_000
+
+        used = {tool_name for *_, tool_name in tasks}
+        coordinator = Coordinator(
+            {
+                "tools": {k: t for k, t in tools.items() if k in used},
+                "fingerprints": {k: fingerprints[k] for k in used},
+                "version": version,
+                "timeout": timeout,
+                "iterations": iterations,
+                "calibration_interval": calibration_interval,
+                "probes": probes,
+                "probe": sorted(uncached),
+            },
+            {
+                i: {
+                    "item": i,
+                    "method": methods.name(handles[i]),
+                    "outcomes": sorted(outcomes),
                     "iteration": n,
-                    "wagers": {k: p.wager for k, p in predictions.items()},
-                    "time": time_ns,
-                    "relative": relative,
-                    "score": total,
-                    "calibration": calibration,
-                    "calibrations": calibrations,
+                    "tool": tool_name,
+                    "cached": hits.get(i),
                 }
-            )
+                for i, (_, outcomes, n, tool_name) in enumerate(tasks)
+            },
+            expected,
+            nodes,
+            node_timeout,
+            record,
+            journal,
+            logger,
+        )
+        event_loop().run(coordinator.serve(coordinate))
+    else:
+        assigned, oversubscribed = assign_cores(jobs, logger)
+        baselines = measure_baselines(sieve_exe, assigned, iterations, logger)
+        journal.write(
+            {
+                "baselines": [
+                    {"core": core, "calibration": calibration}
+                    for core, calibration in baselines.items()
+                ]
+            }
+        )
 
-        logger.success(f"Ran {m}")
+        runner = Runner(
+            tools, timeout, sieve_exe, calibration_interval, oversubscribed, logger
+        )
+        free_cores = queue.SimpleQueue()
+        for core in assigned:
+            free_cores.put(core)
 
-    for k, t in sorted(by_tool.items()):
-        if not t:
-            logger.warning(f"No experiments for {k}")
-            continue
-        score = sum(r["score"] for r in t) / iterations
-        time = sum(r["time"] for r in t) / len(t)
-        relative = math.exp(sum(math.log(r["relative"]) for r in t) / len(t))
-        tools[k]["results"] = t
-        tools[k]["score"] = score
-        tools[k]["time"] = time
-        tools[k]["relative"] = relative
+        def setup_job():
+            core = free_cores.get()
+            runner.setup_job(core, baselines[core], journal)
 
-        logger.success(
-            f"Tested {k}: score {score:0.2f} in avg {time/1_000_000:0.0f}ms/{relative:0.3f}x"
-        )
+        remaining = methods.table(0)
+        for handle in handles:
+            remaining[handle] += 1
+        try:
+            with ThreadPoolExecutor(
+                max_workers=jobs, initializer=setup_job
+            ) as executor:
+                if probed := runner.probe_all(executor, uncached, probes):
+                    journal.write({"probes": probed})
+
+                futures = {
+                    executor.submit(
+                        runner.run, *task, hits.get(i), functools.partial(record, i)
+                    ): i
+                    for i, task in enumerate(tasks)
+                }
+                try:
+                    for future in as_completed(futures):
+                        i = futures.pop(future)
+                        future.result()
+                        remaining[handles[i]] -= 1
+                        if remaining[handles[i]] == 0:
+                            logger.success(f"Ran {methods.name(handles[i])}")
+                except KeyboardInterrupt:
+                    logger.warning(
+                        "Interrupted, finishing the runs in progress;"
+                        " run again with --resume to run the rest"
+                    )
+                    runner.stop()
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        finally:
+            runner.close()
+    journal.close()
+
+    if results_cache is not None:
+        if evicted := results_cache.evict():
+            logger.info(f"Evicted {evicted} results from the cache")
 
     experiment["timestamp"] = int(datetime.now().timestamp() * 1000)
     experiment["version"] = version
-
-    with open(output, "w", encoding="utf-8") as fp:
-        json.dump(experiment, fp)
+    aggregate(journal.path, experiment, output, iterations, logger)
 
     logger.success(f"Written results to {output!r}")
 
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+""" Score the wagers stored in earlier results against the current cases.
+
+The tools don't have to be run again when the cases change, because the
+wagers of every run are stored in `result.json`. They are loaded into a
+(run x query) matrix, with the tool and the method of every run, and the
+current cases give a (method x query) matrix of the outcomes that sometimes
+happen. The scores of all runs are then computed at once, and summed into a
+(tool x method x query) tensor:
+
+    python bin/rescore.py result.json submissions/*.zip -o rescored.csv
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+import click
+import collections
+import os
+
+import numpy as np
+
+from utils import *
+
+WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
+
+
+def score(wagers: np.ndarray, happens: np.ndarray) -> np.ndarray:
+    """Like `Prediction.score`, for an array of wagers and whether their
+    queries happen. A missing wager is NaN, and scores 0.
+    """
+    wagers = np.where(happens, wagers, -wagers)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # An infinite wager that wins scores 1, and one that loses -inf
+        scores = np.where(wagers > 0, 1 - 1 / (wagers + 1), wagers)
+    return np.nan_to_num(scores, nan=0.0, posinf=np.inf, neginf=-np.inf)
+
+
+@dataclass
+class Runs:
+    """The wagers of all the runs in a collection of results."""
+
+    tools: list[dict] = field(default_factory=list)
+    methods: dict[str, int] = field(default_factory=dict)
+    tool: list[int] = field(default_factory=list)
+    method: list[int] = field(default_factory=list)
+    wagers: list[float] = field(default_factory=list)
+
+    def add(self, name: str, experiment: dict):
+        queries = {q: i for i, q in enumerate(QUERIES)}
+        missing = [np.nan] * len(QUERIES)
+        for tool_name, ctx in experiment["tools"].items():
+            # Tools that were filtered out of the evaluation have no results
+            if not (results := ctx.get("results")):
+                continue
+            runs = collections.Counter(r["method"] for r in results)
+            t = len(self.tools)
+            self.tools.append(
+                {
+                    "file": name,
+                    "group": experiment["group_name"],
+                    "tool": tool_name,
+                    "timestamp": experiment.get("timestamp"),
+                    "iterations": max(runs.values(), default=1),
+                    "score": ctx.get("score"),
+                }
+            )
+            for r in results:
+                row = list(missing)
+                for query, wager in r["wagers"].items():
+                    if (q := queries.get(query)) is not None:
+                        row[q] = wager
+                self.tool.append(t)
+                self.method.append(
+                    self.methods.setdefault(r["method"], len(self.methods))
+                )
+                self.wagers.extend(row)
+
+    def outcomes(self, cases) -> tuple[np.ndarray, np.ndarray]:
+        """The (method x query) matrix of the outcomes that sometimes happen
+        in the cases, and which methods have cases at all.
+        """
+        queries = {q: i for i, q in enumerate(QUERIES)}
+        happens = np.zeros((len(self.methods), len(QUERIES)), dtype=bool)
+        for case in cases:
+            if (m := self.methods.get(str(case.methodid))) is not None:
+                happens[m, queries[case.result]] = True
+        return happens, happens.any(axis=1)
+
+    def rescore(self, cases) -> np.ndarray:
+        """Score all runs against the cases, and return the (tool x method x
+        query) tensor of the scores, averaged over the iterations.
+        """
+        shape = (len(self.tools), len(self.methods), len(QUERIES))
+        wagers = np.array(self.wagers, dtype=float).reshape(-1, len(QUERIES))
+        tool = np.array(self.tool, dtype=np.intp)
+        method = np.array(self.method, dtype=np.intp)
+        happens, known = self.outcomes(cases)
+
+        # Methods that no longer have cases are not part of the suite
+        runs = known[method]
+        scores = score(wagers[runs], happens[method[runs]])
+        cells = np.ravel_multi_index((tool[runs], method[runs]), shape[:2])
+        totals = np.stack(
+            [
+                np.bincount(cells, weights=scores[:, q], minlength=shape[0] * shape[1])
+                for q in range(len(QUERIES))
+            ],
+            axis=-1,
+        ).reshape(shape)
+        iterations = np.array([t["iterations"] for t in self.tools], dtype=float)
+        return totals / iterations[:, None, None]
+
+
+@click.command()
+@click.option("-v", "--verbose", count=True)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(writable=True, dir_okay=False),
+    help="write the rescored tools as csv.",
+)
+@click.argument(
+    "FILES", nargs=-1, type=click.Path(exists=True, readable=True, path_type=Path)
+)
+def rescore(files, output, verbose):
+    """Rescore the wagers in a collection of results against the current
+    cases, without running the tools again.
+    """
+    import pandas as pd
+
+    logger = setup_logger(verbose)
+    suite = Suite(WORKFOLDER, QUERIES, logger)
+
+    runs = Runs()
+    for file in files:
+        for name, experiment in read_results(file, logger):
+            try:
+                runs.add(name, experiment)
+            except KeyError as e:
+                logger.warning(f"Could not read {name!r}, it has no {e}")
+    logger.info(
+        f"Loaded {len(runs.tool)} runs of {len(runs.tools)} tools"
+        f" on {len(runs.methods)} methods"
+    )
+
+    cases = list(suite.cases())
+    scores = runs.rescore(cases)
+    tested = {str(c.methodid) for c in cases}
+    if gone := len(set(runs.methods) - tested):
+        logger.warning(f"{gone} methods have no cases anymore, they are not scored")
+    if new := len(tested - set(runs.methods)):
+        logger.warning(f"{new} methods with cases have no wagers, they score 0")
+
+    df = pd.DataFrame(runs.tools)
+    df["version"] = pd.to_datetime(df["timestamp"], unit="ms")
+    df["rescored"] = scores.sum(axis=(1, 2))
+    df["change"] = df["rescored"] - df["score"]
+    for q, query in enumerate(QUERIES):
+        df[query] = scores[:, :, q].sum(axis=1)
+    logger.success(f"Rescored {len(df)} tools")
+
+    if output:
+        df.drop(columns=["timestamp"]).to_csv(output, index=False)
+        logger.success(f"Written the scores to {output!r}")
+
+    print(df.set_index(["group", "tool", "version"])[["score", "rescored", "change"]])
+
+
+if __name__ == "__main__":
+    rescore()
@@ -1,81 +1,335 @@
 #!/usr/bin/env python3
+""" Calculate the stats of a collection of experiments.
 
-from json import JSONDecodeError, encoder
-import click
+The results are first ingested into a columnar store, which is partitioned by
+group and tool, where every partition is a `.npz` file of the runs of all the
+results of a tool:
+
+    target/stats-store/<group>/<tool>.npz
+
+The manifest of the store remembers which files, or entries in zip files, were
+ingested, so running the stats again only decodes the new or changed ones. The
+stats are then computed with group-by aggregations over the runs of all
+partitions at once.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+import click
+import json
+import os
 import utils
-import math
 import numpy as np
 import pandas as pd
-from pathlib import Path
 
+WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
 
-def analyse(experiment, logger):
-    for tool, ctx in experiment["tools"].items():
-        per_method = defaultdict(dict)
+STORE = WORKFOLDER / "target" / "stats-store"
+STORE_VERSION = 1
 
-        for r in ctx["results"]:
-            m = per_method[r["method"]]
-            absolute = r["time"] / 1_000_000
-            relative = math.log10(r["relative"])
-            score = r["score"]
-            m.setdefault("absolute", []).append(absolute)
-            m.setdefault("relative", []).append(relative)
-            m.setdefault("score", []).append(score)
+# The times of the runs, which are NaN for results where some run has none
+TIMES = ["time", "relative", "adjusted_time", "adjusted_relative"]
 
-        rows = []
-        for m, k in sorted(per_method.items()):
-            rows.append(
-                {
-                    "method": m,
-                    "absolute/mean": np.mean(k["absolute"]),
-                    "absolute/std": np.std(k["absolute"]),
-                    "relative/mean": np.mean(k["relative"]),
-                    "relative/std": np.std(k["relative"]),
-                    "score": np.mean(k["score"]),
-                }
-            )
+# Entries of a zip file are ingested in batches of this size
+BATCH = 16
 
-        is_syntactic = "syntactic" in ctx["technologies"]
-        is_static = "static" in ctx["technologies"]
-        is_dynamic = "dynamic" in ctx["technologies"]
-        is_cheater = "cheater" in ctx["technologies"]
 
-        kind = None
+def sources(file: Path) -> dict[str, tuple[Optional[str], list]]:
+    """The results in a file by name, with their entry in the zip file, and a
+    stamp that changes when they do.
+    """
+    if file.suffix == ".zip":
+        import zipfile
+
+        with zipfile.ZipFile(file) as zf:
+            return {
+                f"{file}/{entry.filename}": (
+                    entry.filename,
+                    [entry.file_size, entry.CRC],
+                )
+                for entry in zf.infolist()
+                if entry.filename.endswith(".json")
+            }
+    stat = file.stat()
+    return {str(file): (None, [stat.st_size, stat.st_mtime_ns])}
+
+
+def partitions(experiment):
+    """Split an experiment into the metadata and the runs of every tool."""
+    for position, (tool, ctx) in enumerate(experiment["tools"].items()):
+        # Tools that were filtered out of the evaluation have no results
+        if not (results := ctx.get("results")):
+            continue
+        columns = {
+            "method": np.array([r["method"] for r in results]),
+            "score": np.array([r["score"] for r in results], dtype=float),
+            "cached": np.array([bool(r.get("cached")) for r in results]),
+        }
+        for key in TIMES:
+            if all(key in r for r in results):
+                columns[key] = np.array([r[key] for r in results], dtype=float)
+        meta = {
+            "group": experiment["group_name"],
+            "tool": tool,
+            "timestamp": experiment["timestamp"],
+            "position": position,
+            "technologies": ctx["technologies"],
+            "columns": sorted(columns),
+        }
+        yield meta, columns
 
-        if is_static:
-            kind = "static"
 
-        if is_dynamic:
-            kind = "dynamic"
+def decode(file: Path, entries: list[tuple[str, Optional[str]]]):
+    """Decode the results in a file, or in some entries of a zip file, into
+    their partitions. This runs in a worker process.
+    """
+    zf = None
+    if file.suffix == ".zip":
+        import zipfile
+
+        zf = zipfile.ZipFile(file)
+
+    done = []
+    try:
+        for name, entry in entries:
+            content = zf.read(entry) if zf else file.read_bytes()
+            try:
+                done.append(
+                    (name, list(partitions(utils.decode_results(content))), None)
+                )
+            except KeyError as e:
+                done.append((name, [], f"it has no {e}"))
+            except ValueError as e:
+                done.append((name, [], str(e)))
+    finally:
+        if zf:
+            zf.close()
+    return done
+
+
+def partition_path(group: str, tool: str) -> Path:
+    def folder(s: str) -> str:
+        return quote(s, safe="").replace(".", "%2E")
+
+    return Path(folder(group), f"{folder(tool)}.npz")
+
+
+def merge(path: Path, removed: set[str], added: list[tuple[str, dict]]):
+    """Rewrite a partition without the runs of the removed sources, and with
+    the runs of the added ones.
+    """
+    parts = []
+    if path.exists():
+        with np.load(path) as z:
+            sources = z["sources"][z["source"]]
+            keep = ~np.isin(sources, list(removed))
+            part = {k: z[k][keep] for k in ["score", "cached", *TIMES]}
+            part["source"] = sources[keep]
+            part["method"] = z["methods"][z["method"]][keep]
+            parts.append(part)
+    for name, columns in added:
+        runs = len(columns["method"])
+        part = {k: columns.get(k, np.full(runs, np.nan)) for k in TIMES}
+        part |= {k: columns[k] for k in ["method", "score", "cached"]}
+        part["source"] = np.full(runs, name)
+        parts.append(part)
+
+    merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    if not len(merged["source"]):
+        path.unlink(missing_ok=True)
+        return
+    merged["sources"], merged["source"] = np.unique(
+        merged["source"], return_inverse=True
+    )
+    merged["methods"], merged["method"] = np.unique(
+        merged["method"], return_inverse=True
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    with open(tmp, "wb") as f:
+        np.savez(f, **merged)
+    os.replace(tmp, path)
+
+
+def update_store(store: Path, files, jobs, logger) -> list[dict]:
+    """Ingest the new and changed results of the files, and return the
+    metadata of the tools in all their results.
+    """
+    manifest_path = store / "manifest.json"
+    manifest = {}
+    try:
+        with open(manifest_path) as f:
+            content = json.load(f)
+        if content.get("version") == STORE_VERSION:
+            manifest = content["sources"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    names = []
+    stamps = {}
+    pending: dict[Path, list] = {}
+    touched: dict[str, list] = {}
+    for file in files:
+        for name, (entry, stamp) in sources(file).items():
+            if name in stamps:
+                continue
+            names.append(name)
+            stamps[name] = stamp
+            if (known := manifest.pop(name, None)) and known["stamp"] == stamp:
+                manifest[name] = known
+                continue
+            for tool in known["tools"] if known else []:
+                touched.setdefault(tool["path"], [])
+            pending.setdefault(file, []).append((name, entry))
+
+    if pending:
+        total = sum(len(entries) for entries in pending.values())
+        logger.info(f"Ingesting {total} of {len(names)} results")
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [
+                pool.submit(decode, file, entries[i : i + BATCH])
+                for file, entries in pending.items()
+                for i in range(0, len(entries), BATCH)
+            ]
+            decoded = {}
+            for future in as_completed(futures):
+                for name, parts, warning in future.result():
+                    logger.debug(f"Decoded {name!r}")
+                    decoded[name] = (parts, warning)
+
+        for name in names:
+            if name not in decoded:
+                continue
+            parts, warning = decoded[name]
+            tools = []
+            for meta, columns in parts:
+                path = partition_path(meta["group"], meta["tool"]).as_posix()
+                touched.setdefault(path, []).append((name, columns))
+                tools.append(meta | {"source": name, "path": path})
+            manifest[name] = {"stamp": stamps[name], "tools": tools, "warning": warning}
+
+        for path, added in touched.items():
+            merge(store / path, set(decoded), added)
+        content = {"version": STORE_VERSION, "sources": manifest}
+        utils.write_atomic(manifest_path, json.dumps(content))
+        logger.success(
+            f"Ingested {total} results into {len(touched)} partitions of {str(store)!r}"
+        )
 
-        if is_syntactic:
-            kind = "syntactic"
+    result = []
+    for name in names:
+        if warning := manifest[name]["warning"]:
+            logger.warning(f"Could not read {name!r}, {warning}")
+        result.extend(manifest[name]["tools"])
+    return result
 
-        if is_static and is_dynamic:
-            kind = "hybrid"
 
-        if is_cheater:
-            kind = "cheater"
+def load_runs(store: Path, tools: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """Load the runs of the tools from their partitions, with the index of
+    their tool, their method, their score, whether they were cached, and the
+    columns in keys.
+    """
+    methods: dict[str, int] = {}
+    columns = {k: [] for k in ["tool", "method", "score", "cached", *keys]}
+    for path, group in tools.groupby("path"):
+        with np.load(store / path) as z:
+            index = dict(zip(group["source"], group.index))
+            tool = np.array([index.get(s, -1) for s in z["sources"]])[z["source"]]
+            method = np.array(
+                [methods.setdefault(m, len(methods)) for m in z["methods"]]
+            )[z["method"]]
+            runs = tool >= 0
+            columns["tool"].append(tool[runs])
+            columns["method"].append(method[runs])
+            for key in ["score", "cached", *keys]:
+                columns[key].append(z[key][runs])
+    return pd.DataFrame(
+        {k: np.concatenate(v) if v else np.array([]) for k, v in columns.items()}
+    )
+
+
+def analyse(runs: pd.DataFrame, time_key: str, relative_key: str, cached=True):
+    """Aggregate the runs into the score, the sum of the mean times of the
+    methods in seconds, and the geometric mean of their relative times, of
+    every tool. The times of runs that were reused from the cache are left
+    out, unless `cached` is set.
+
+    A method where some run has no time has no mean time, and is left out of
+    the sum and the geometric mean.
+    """
+    included = np.ones(len(runs), dtype=bool) if cached else ~runs["cached"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        absolute = runs[time_key] / 1_000_000
+        relative = np.log10(runs[relative_key])
+    per_method = (
+        pd.DataFrame(
+            {
+                "tool": runs["tool"],
+                "method": runs["method"],
+                "score": runs["score"],
+                "included": included,
+                "absolute": absolute.where(included, 0.0),
+                "relative": relative.where(included, 0.0),
+                "absolute_nan": included & absolute.isna(),
+                "relative_nan": included & relative.isna(),
+            }
+        )
+        .groupby(["tool", "method"])
+        .agg(
+            score=("score", "mean"),
+            included=("included", "sum"),
+            absolute=("absolute", "sum"),
+            relative=("relative", "sum"),
+            absolute_nan=("absolute_nan", "any"),
+            relative_nan=("relative_nan", "any"),
+        )
+    )
+    per_method["absolute"] = (per_method["absolute"] / per_method["included"]).mask(
+        per_method["absolute_nan"]
+    )
+    per_method["relative"] = (per_method["relative"] / per_method["included"]).mask(
+        per_method["relative_nan"]
+    )
 
-        if kind is None:
-            kind = "adhoc"
+    per_tool = per_method.groupby("tool").agg(
+        score=("score", "sum"),
+        absolute=("absolute", "sum"),
+        relative=("relative", "mean"),
+    )
+    per_tool["relative"] = np.power(10, per_tool["relative"])
+    return per_tool
 
-        df = pd.DataFrame(rows)
-        result = {
-            "group": experiment["group_name"],
-            "version": datetime.fromtimestamp(experiment["timestamp"] / 1000),
-            "tool": tool,
-            "kind": kind,
-            "technologies": ctx["technologies"],
-            "score": df["score"].sum(),
-            "absolute": df["absolute/mean"].sum(),
-            "relative": math.pow(10, df["relative/mean"].mean()),
-        }
 
-        return result
-        # swriter.writerow(result)
+def kind(technologies) -> str:
+    is_syntactic = "syntactic" in technologies
+    is_static = "static" in technologies
+    is_dynamic = "dynamic" in technologies
+    is_cheater = "cheater" in technologies
+
+    kind = None
+
+    if is_static:
+        kind = "static"
+
+    if is_dynamic:
+        kind = "dynamic"
+
+    if is_syntactic:
+        kind = "syntactic"
+
+    if is_static and is_dynamic:
+        kind = "hybrid"
+
+    if is_cheater:
+        kind = "cheater"
+
+    if kind is None:
+        kind = "adhoc"
+
+    return kind
 
 
 @click.command()
@@ -84,57 +338,79 @@ def analyse(experiment, logger):
 #     "-o", "--stats", default="-", type=click.Path(writable=True, allow_dash=True)
 # )
 @click.option("-o", "--report", type=click.Path(writable=True))
+@click.option(
+    "--time",
+    "times",
+    type=click.Choice(["raw", "adjusted"]),
+    default="raw",
+    show_default=True,
+    help="plot the raw times, or the times without the startup of the tools.",
+)
+@click.option(
+    "--cached / --no-cached",
+    default=True,
+    show_default=True,
+    help="include the times of results that were reused from the cache.",
+)
+@click.option(
+    "--store",
+    type=click.Path(file_okay=False, writable=True, path_type=Path),
+    default=STORE,
+    show_default=True,
+    help="the folder of the columnar store of the results.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    help="number of processes used to ingest the results.",
+)
 @click.argument(
     "FILES", nargs=-1, type=click.Path(exists=True, readable=True, path_type=Path)
 )
-def stats(files, report, verbose):
+def stats(files, report, times, cached, store, jobs, verbose):
     """A program for calculating and presenting the stats of
     a collection of experiments.
     """
 
-    import json
-
     logger = utils.setup_logger(verbose)
 
-    results = []
-
-    def handle_result(result):
-        try:
-            results.append(analyse(result, logger))
-        except KeyError as e:
-            logger.debug(sorted(result))
-            logger.warning(e)
-
-    for file in files:
-        logger.info(f"Analysing {file!r}")
-
-        if file.suffix == ".zip":
-            import zipfile
-
-            with zipfile.ZipFile(file) as zf:
-                for entry in zf.infolist():
-                    if not entry.filename.endswith(".json"):
-                        logger.trace(f"Ignoreing {entry.filename!r}")
-                        continue
-                    logger.info(f"Unpacking {entry.filename!r}")
-                    content = zf.read(entry)
-                    try:
-                        txt = content.decode("utf-8-sig")
-                    except UnicodeDecodeError:
-                        txt = content.decode("utf-16")
-                    handle_result(json.loads(txt))
-            continue
-
-        try:
-            with open(file, encoding="utf-8-sig") as fp:
-                handle_result(json.load(fp))
-        except UnicodeDecodeError:
-            with open(file, encoding="utf-16") as fp:
-                handle_result(json.load(fp))
-
-    logger.success(f"Analysed {len(files)} file")
-
-    df = pd.DataFrame(results)
+    time_key, relative_key = "time", "relative"
+    if times == "adjusted":
+        time_key, relative_key = "adjusted_time", "adjusted_relative"
+
+    tools = pd.DataFrame(update_store(store, files, jobs, logger))
+    if tools.empty:
+        logger.error("Found no results to analyse")
+        return
+
+    # Analyse the first tool of every experiment
+    tools = tools[tools["position"] == 0]
+    timed = tools["columns"].map(lambda c: time_key in c and relative_key in c)
+    for _, tool in tools[~timed].iterrows():
+        logger.warning(f"{tool['group']}/{tool['tool']} has no {time_key!r}")
+    tools = tools[timed].reset_index(drop=True)
+
+    runs = load_runs(store, tools, [time_key, relative_key])
+    tools = tools.join(analyse(runs, time_key, relative_key, cached=cached))
+    tools["version"] = tools["timestamp"].map(
+        lambda t: datetime.fromtimestamp(t / 1000)
+    )
+    tools["kind"] = tools["technologies"].map(kind)
+    logger.success(f"Analysed {len(runs)} runs of {len(tools)} tools")
+
+    df = tools[
+        [
+            "group",
+            "version",
+            "tool",
+            "kind",
+            "technologies",
+            "score",
+            "absolute",
+            "relative",
+        ]
+    ]
     df = df.loc[df.groupby(["group", "tool"])["version"].idxmax()]
 
     if report:
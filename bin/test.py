@@ -2,9 +2,16 @@
 """ The jpamb tester
 """
 
-import os
-import click
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from time import perf_counter_ns
+from typing import Optional
+import click
+import os
+import queue
+import signal
+import threading
+
 from utils import *
 
 
@@ -34,9 +41,38 @@ WORKFOLDER = Path(os.path.abspath(__file__)).parent.parent
     help="only take methods that matches the regex.",
     callback=re_parser,
 )
+@click.option(
+    "--worker / --no-worker",
+    default=False,
+    help="start the command once, and send it the cases using the worker protocol.",
+)
+@click.option(
+    "--zygote",
+    "zygote",
+    multiple=True,
+    metavar="MODULE",
+    help="fork the cases from a python process, that has imported MODULE (can be repeated).",
+)
+@click.option(
+    "--fork / --no-fork",
+    default=False,
+    help="fork the cases from a python process, also implied by --zygote.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    show_default=True,
+    default=1,
+    type=click.IntRange(min=1),
+    help="number of cases to run in parallel.",
+)
 @click.argument("cmd", nargs=-1, type=click.Path())
 def test(
+    jobs,
     filter_methods,
+    worker,
+    zygote,
+    fork,
     verbose,
     cmd,
     timeout,
@@ -46,45 +82,158 @@ def test(
     logger = setup_logger(verbose)
     suite = Suite(WORKFOLDER, QUERIES, logger)
 
+    cases = []
+    for case in sorted(suite.cases()):
+        if filter_methods and not filter_methods.search(str(case.methodid)):
+            logger.trace(f"{case} did not match {filter_methods}")
+            continue
+        cases.append(case)
+
+    # The output of every case is buffered, and written to the report in the
+    # order of the cases, no matter in which order they finish.
+    buffers = collections.defaultdict(list)
+    fp: Optional[TextIO] = None
     if report:
-        fp: TextIO = click.open_file(report, "w")  # type: ignore
+        fp = click.open_file(report, "w")  # type: ignore
         logger.add(
-            fp,
-            filter=(lambda record: record["extra"]["process"] != "main"),
+            lambda message: buffers[message.record["extra"]["case"]].append(message),
+            filter=(
+                lambda record: record["extra"]["process"] != "main"
+                and "case" in record["extra"]
+            ),
             format="{extra[process][0]}{extra[process][1]}> {message}",
             level="DEBUG",
         )
 
-    for case in sorted(suite.cases()):
-        if filter_methods and not filter_methods.search(str(case.methodid)):
-            logger.trace(f"{case} did not match {filter_methods}")
-            continue
-        logger.info(f"Running {case}")
+    if (zygote or fork) and (worker or len(cmd) < 2):
+        raise click.UsageError("--zygote needs a command like: python script.py")
+
+    # Workers and zygotes answer one request at a time, so every job gets its own.
+    tools: list[Worker] = []
+    for _ in range(jobs):
+        if worker:
+            tools.append(Worker(list(cmd), logger=logger))
+        elif zygote or fork:
+            tools.append(Zygote(list(zygote), logger=logger, python=cmd[0]))
+    idle = queue.SimpleQueue()
+    for tool in tools:
+        idle.put(tool)
+
+    running: set[ProcessGroup] = set()
+    cancelled = threading.Event()
+
+    def cancel():
+        cancelled.set()
+        for process in list(running):
+            process.kill()
+        for tool in tools:
+            tool.stop()
 
-        result: str
+    def run(index: int, case: Case):
+        # A case is only cancelled before it starts, or when it is killed
+        # by the cancellation, otherwise its outcome is reported
+        if cancelled.is_set():
+            return None
+        args = (str(case.methodid), str(case.input))
+        case_logger = logger.bind(case=index)
+        tool = idle.get() if tools else None
+        start_ns = perf_counter_ns()
         try:
-            (result, _) = run_cmd(
-                cmd + (str(case.methodid), str(case.input)),
-                logger=logger,
-                timeout=timeout,
-            )
+            if worker:
+                (result, _) = tool.request(
+                    list(args), timeout=timeout, logger=case_logger
+                )
+            else:
+                (result, _) = run_cmd(
+                    cmd + args,
+                    logger=case_logger,
+                    timeout=timeout,
+                    zygote=tool,
+                    running=running,
+                )
+            error = None
         except subprocess.CalledProcessError as e:
-            logger.error(e)
-            result = e.stdout
+            if cancelled.is_set() and e.returncode == -signal.SIGKILL:
+                return None
             if fail_fast:
-                for i in e.stderr.splitlines():
-                    logger.warning(i)
-                for i in e.stdout.splitlines():
-                    logger.warning(i)
-                logger.error("Failing fast")
-                sys.exit(-1)
-
-        test = r[-1] if (r := result.splitlines()) else ""
-        logger.info(f"Returned {test!r}")
-        if test == case.result:
-            logger.success(f"Mathed {case}: {case.result!r}")
-        else:
-            logger.error(f"Failed {case}: {test!r} != {case.result!r}")
+                cancel()
+            result, error = e.stdout, e
+        except subprocess.TimeoutExpired as e:
+            if fail_fast:
+                cancel()
+            result, error = "", e
+        finally:
+            if tool:
+                idle.put(tool)
+        return result, error, perf_counter_ns() - start_ns
+
+    start_ns = perf_counter_ns()
+    passed, failed, skipped = 0, 0, 0
+    total_ns, slowest = 0, None
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    futures = [executor.submit(run, i, case) for i, case in enumerate(cases)]
+    try:
+        for i, (case, future) in enumerate(zip(cases, futures)):
+            outcome = None if future.cancelled() else future.result()
+            if fp:
+                fp.write("".join(buffers.pop(i, [])))
+                fp.flush()
+            if outcome is None:
+                logger.warning(f"Cancelled {case}")
+                skipped += 1
+                continue
+
+            logger.info(f"Running {case}")
+            result, error, time_ns = outcome
+            total_ns += time_ns
+            if slowest is None or time_ns > slowest[0]:
+                slowest = (time_ns, case)
+
+            if isinstance(error, subprocess.TimeoutExpired):
+                # A timeout is a failure, even for the cases that expect `*`
+                logger.error(f"Failed {case}: timed out after {timeout}s")
+                if fail_fast:
+                    logger.error("Failing fast")
+                    sys.exit(-1)
+                failed += 1
+                continue
+            elif error:
+                logger.error(error)
+                if fail_fast:
+                    for line in error.stderr.splitlines():
+                        logger.warning(line)
+                    for line in error.stdout.splitlines():
+                        logger.warning(line)
+                    logger.error("Failing fast")
+                    sys.exit(-1)
+
+            test = r[-1] if (r := result.splitlines()) else ""
+            logger.info(f"Returned {test!r}")
+            if test == case.result:
+                logger.success(f"Mathed {case}: {case.result!r}")
+                passed += 1
+            else:
+                logger.error(f"Failed {case}: {test!r} != {case.result!r}")
+                failed += 1
+    finally:
+        if not all(f.done() for f in futures):
+            cancel()
+        executor.shutdown(cancel_futures=True)
+        for tool in tools:
+            tool.close()
+
+    wall_ns = perf_counter_ns() - start_ns
+    summary = f"Passed {passed}, failed {failed}"
+    if skipped:
+        summary += f", cancelled {skipped}"
+    summary += f" of {len(cases)} cases in {wall_ns / 1e9:0.2f}s with {jobs} job(s)"
+    (logger.success if failed == 0 else logger.error)(summary)
+    if slowest:
+        logger.success(
+            f"Total time {total_ns / 1e9:0.2f}s, slowest case {slowest[0] / 1e9:0.2f}s"
+            f" ({slowest[1]})"
+        )
 
 
 if __name__ == "__main__":
@@ -1,20 +1,28 @@
 import collections
-from dataclasses import dataclass
+import functools
+from dataclasses import dataclass, field
 from io import StringIO
 from pathlib import Path
-from typing import TextIO, TypeVar
+from typing import NoReturn, Optional, TextIO, TypeVar
+import os
 import re
 import subprocess
 import sys
+import threading
 import csv
 import json
 
 from jpamb_utils import InputParser, JvmType, JvmValue, MethodId
+from jpamb_utils import index as method_index, bytecode, cases as case_index
+from jpamb_utils.worker import STDERR_DONE
 
 import loguru
 
 W = TypeVar("W", bound=TextIO)
 
+ZYGOTE = Path(__file__).absolute().parent / "zygote.py"
+MARK = STDERR_DONE.split("{")[0]
+
 QUERIES = [
     "*",
     "assertion error",
@@ -33,22 +41,40 @@ def re_parser(ctx_, parms_, expr):
 
 
 def build_c(input_file, logger):
-    """Build a C file (hopefully platform independent)"""
-    from os import environ
+    """Build a C file (hopefully platform independent), unless the executable
+    is newer than it.
+
+    The executable is compiled to a temporary file and moved in place, so
+    processes that build it at the same time never write to an executable
+    that another process is running.
+    """
+    import os
     import platform
     import shutil
 
-    compiler = shutil.which(environ.get("CC", "gcc"))
+    output_file = input_file.with_suffix("")
+    if platform.system() == "Windows":
+        output_file = output_file.with_suffix(".exe")
+
+    try:
+        if output_file.stat().st_mtime_ns > input_file.stat().st_mtime_ns:
+            logger.debug(f"{output_file} is up to date")
+            return output_file
+    except FileNotFoundError:
+        pass
+
+    compiler = shutil.which(os.environ.get("CC", "gcc"))
 
     if not compiler:
         logger.error("Could not find $CC or gcc compiler on PATH")
         raise Exception("Could not find $CC or gcc compiler on PATH")
 
-    output_file = input_file.with_suffix("")
-
-    if platform.system() == "Windows":
-        output_file = output_file.with_suffix(".exe")
-    subprocess.check_call([compiler, "-o", output_file, input_file, "-lm"])
+    tmp = output_file.with_name(f".{output_file.name}.{os.getpid()}")
+    try:
+        subprocess.check_call([compiler, "-o", tmp, input_file, "-lm"])
+        os.replace(tmp, output_file)
+    finally:
+        tmp.unlink(missing_ok=True)
 
     return output_file
 
@@ -83,10 +109,7 @@ class Input:
 
     @staticmethod
     def parse(string: str) -> "Input":
-        parsed_args = InputParser(string).parse_inputs()
-        input = Input(tuple(parsed_args))
-        assert string == str(input), f"{input} should formatted as {string}"
-        return input
+        return Input(tuple(InputParser(string).parse_inputs()))
 
     def __str__(self) -> str:
         return self.print(StringIO()).getvalue()
@@ -99,6 +122,184 @@ class Input:
         return file
 
 
+def write_atomic(path: Path, content: str):
+    """Write a file through a temporary file, so it is never half written."""
+    import os
+    import threading
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    try:
+        tmp.write_text(content)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def decode_results(content: bytes) -> dict:
+    """Decode the content of a `result.json`, in utf-8 or utf-16."""
+    try:
+        return json.loads(content.decode("utf-8-sig"))
+    except UnicodeDecodeError:
+        return json.loads(content.decode("utf-16"))
+
+
+def read_results(file: Path, logger):
+    """Read the results in a `result.json`, or in every json file in a zip of
+    them, and yield their name and content.
+    """
+    if file.suffix == ".zip":
+        import zipfile
+
+        with zipfile.ZipFile(file) as zf:
+            for entry in zf.infolist():
+                if not entry.filename.endswith(".json"):
+                    logger.trace(f"Ignoreing {entry.filename!r}")
+                    continue
+                logger.info(f"Unpacking {entry.filename!r}")
+                yield f"{file}/{entry.filename}", decode_results(zf.read(entry))
+    else:
+        yield str(file), decode_results(file.read_bytes())
+
+
+MANIFEST_NAME = ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class Manifest:
+    """The content hashes of the classfiles that the decompiled classes were
+    generated from, and the jvm2json that generated them.
+    """
+
+    path: Path
+    entries: dict[str, dict] = field(default_factory=dict)
+    tool: Optional[dict] = None
+
+    @staticmethod
+    def open(path: Path) -> "Manifest":
+        manifest = Manifest(path)
+        try:
+            with open(path) as f:
+                content = json.load(f)
+            if content.get("version") == MANIFEST_VERSION:
+                manifest.entries = content["classes"]
+                manifest.tool = content["jvm2json"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return manifest
+
+    def save(self):
+        content = {
+            "version": MANIFEST_VERSION,
+            "jvm2json": self.tool,
+            "classes": self.entries,
+        }
+        write_atomic(self.path, json.dumps(content, indent=2, sort_keys=True))
+
+
+def jvm2json_version() -> Optional[dict]:
+    """Identify the jvm2json on the PATH, or None if there is none."""
+    import os
+    import shutil
+
+    if (path := shutil.which("jvm2json")) is None:
+        return None
+    stat = os.stat(path)
+    return {
+        "path": os.path.realpath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def hash_files(root: Path, paths) -> str:
+    """Hash the names and contents of files, relative to root."""
+    import hashlib
+
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(path.relative_to(root).as_posix().encode() + b"\0")
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def hash_values(*values) -> str:
+    import hashlib
+
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+def parse_size(size) -> int:
+    """Parse a size like 512M or 2G into bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if isinstance(size, str) and size[-1:].upper() in units:
+        return int(float(size[:-1]) * units[size[-1].upper()])
+    return int(size)
+
+
+@dataclass
+class ResultCache:
+    """An on-disk cache of tool runs, where every entry is stored under the
+    hash of everything the run depends on.
+
+    Entries that are used are touched, so eviction removes the entries that
+    are older than `max_age` seconds, and then the least recently used ones
+    until the cache is at most `max_size` bytes. With `refresh`, entries are
+    not read, but still written.
+    """
+
+    root: Path
+    max_size: int
+    max_age: float
+    refresh: bool = False
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        import os
+
+        if self.refresh:
+            return None
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key: str, entry: dict):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(path, json.dumps(entry))
+
+    def evict(self) -> int:
+        """Evict old entries, and return how many were removed."""
+        from time import time
+
+        entries = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)
+
+        removed = 0
+        size = 0
+        oldest = time() - self.max_age
+        for mtime, entry_size, path in entries:
+            size += entry_size
+            if mtime < oldest or size > self.max_size:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
 def summary64(cmd):
     import base64
     import hashlib
@@ -106,78 +307,808 @@ def summary64(cmd):
     return base64.b64encode(hashlib.sha256(str(cmd).encode()).digest()).decode()[:8]
 
 
-def run_cmd(cmd: list[str], /, timeout, logger, **kwargs):
+# At most this many bytes of the stdout and stderr of a command are kept
+MAX_OUTPUT = 16 * 1024 * 1024
+READ_CHUNK = 64 * 1024
+
+
+# The cores of the process, before any thread is pinned to a core
+PROCESS_AFFINITY = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+
+
+class EventLoop:
+    """An asyncio event loop running in a background thread.
+
+    All commands are run as tasks on the same loop, so waiting on many
+    processes does not need threads of their own. Synchronous code, also from
+    other threads, submits coroutines with `run`.
+
+    The loop runs on all the cores of the process, even if it is started from
+    a thread that is pinned to one, so that the jobs pinned to that core don't
+    share it with the loop.
+    """
+
+    def __init__(self):
+        import asyncio
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.serve, name="jpamb-event-loop", daemon=True
+        )
+        self.thread.start()
+
+    def serve(self):
+        import asyncio
+        import os
+
+        if PROCESS_AFFINITY is not None:
+            os.sched_setaffinity(0, PROCESS_AFFINITY)
+        asyncio.set_event_loop(self.loop)
+        if sys.version_info < (3, 12) and hasattr(os, "pidfd_open"):
+            # The default watcher of older versions uses a thread per process
+            watcher = asyncio.PidfdChildWatcher()
+            watcher.attach_loop(self.loop)
+            asyncio.set_child_watcher(watcher)
+        self.loop.run_forever()
+
+    def run(self, coroutine):
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+_event_loop: Optional[EventLoop] = None
+_event_loop_lock = threading.Lock()
+
+
+def event_loop() -> EventLoop:
+    """Get the shared event loop, starting it the first time."""
+    global _event_loop
+
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = EventLoop()
+        return _event_loop
+
+
+class ProcessGroup:
+    """The process group of a command, which is started in its own session,
+    so that the processes it starts are killed with it.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+
+    def kill(self):
+        import os
+        import signal
+
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.pid, signal.SIGKILL)
+            else:
+                os.kill(self.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+class Capture:
+    """Captured output, of which at most `limit` bytes are kept. Keeps the
+    start of the output, or the end if `tail` is set.
+    """
+
+    def __init__(self, limit: int, tail=False):
+        self.chunks = collections.deque()
+        self.size = 0
+        self.dropped = 0
+        self.limit = limit
+        self.tail = tail
+
+    def append(self, chunk: bytes):
+        if not self.tail:
+            keep = chunk[: max(self.limit - self.size, 0)]
+            self.dropped += len(chunk) - len(keep)
+            chunk = keep
+        if chunk:
+            self.chunks.append(chunk)
+            self.size += len(chunk)
+        while self.size > self.limit:
+            excess = self.size - self.limit
+            first = self.chunks.popleft()
+            if len(first) > excess:
+                self.chunks.appendleft(first[excess:])
+            removed = min(len(first), excess)
+            self.size -= removed
+            self.dropped += removed
+
+    def text(self) -> str:
+        return b"".join(self.chunks).decode("utf-8", errors="replace")
+
+
+@dataclass
+class Limits:
+    """Resource limits of a tool: `memory` is the size of its address space
+    in bytes (RLIMIT_AS) and `cpu` is its cpu time in seconds (RLIMIT_CPU).
+
+    The limits are set before the tool starts, by a shell that sets them and
+    then execs the tool, as running Python code in a child forked from a
+    threaded process is not safe. Zygotes set them in their forked children.
+    """
+
+    memory: Optional[int] = None
+    cpu: Optional[float] = None
+
+    # The signals that a process dies of when it can't allocate memory, as
+    # runtimes abort, or crash, when an allocation fails
+    OUT_OF_MEMORY = ("SIGABRT", "SIGSEGV", "SIGBUS")
+
+    def command(self, cmd: list[str]) -> list[str]:
+        """The command, run through a shell that sets the limits."""
+        import math
+
+        ulimits = []
+        if self.memory is not None:
+            # A process that runs out of memory may dump core, which is large
+            ulimits += ["ulimit -c 0", f"ulimit -v {self.memory // 1024}"]
+        if self.cpu is not None:
+            # The process gets SIGXCPU at the soft limit, and SIGKILL a second later
+            seconds = math.ceil(self.cpu)
+            ulimits += [f"ulimit -S -t {seconds}", f"ulimit -H -t {seconds + 1}"]
+        if not ulimits:
+            return cmd
+        # A limit that can't be set fails the command, instead of running it
+        # without the limit
+        return ["/bin/sh", "-c", " && ".join([*ulimits, 'exec "$@"']), "sh", *cmd]
+
+    def exceeded(self, returncode: int, usage: Optional[dict]) -> Optional[str]:
+        """The limit that a failed process exceeded, if any, from the signal
+        it died of, and its cpu time.
+        """
+        import signal
+
+        if returncode >= 0:
+            return None
+        if self.cpu is not None:
+            cpu_ns = usage and usage["user_time"] + usage["sys_time"]
+            if returncode == -getattr(signal, "SIGXCPU", 0) or (
+                cpu_ns and cpu_ns >= self.cpu * 1_000_000_000
+            ):
+                return "cpu"
+        if self.memory is not None and returncode in (
+            -getattr(signal, name)
+            for name in self.OUT_OF_MEMORY
+            if hasattr(signal, name)
+        ):
+            return "memory"
+        return None
+
+
+class LimitExceeded(subprocess.CalledProcessError):
+    """A command that failed because it exceeded one of its `Limits`."""
+
+    def __init__(self, limit: str, returncode, cmd, output=None, stderr=None):
+        super().__init__(returncode, cmd, output, stderr)
+        self.limit = limit
+
+    def __str__(self):
+        return f"Command '{self.cmd}' exceeded its {self.limit} limit"
+
+
+def usage_of(rusage) -> dict:
+    """The resource usage of a process, from its `resource.struct_rusage`.
+    Times are in ns and the max resident set size in bytes.
+    """
+    return {
+        "user_time": int(rusage.ru_utime * 1_000_000_000),
+        "sys_time": int(rusage.ru_stime * 1_000_000_000),
+        "max_rss": rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+        "voluntary_switches": rusage.ru_nvcsw,
+        "involuntary_switches": rusage.ru_nivcsw,
+    }
+
+
+class Child:
+    """A process started on the event loop.
+
+    Where the platform has `os.wait4`, the process is waited for with it, so
+    that its resource usage is known. Otherwise it is a plain asyncio process.
+    """
+
+    def __init__(self, pid: int, stdout, stderr, wait):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self._wait = wait
+        self.returncode = None
+        self.usage = None
+
+    @staticmethod
+    async def start(cmd: list[str], affinity=None, **kwargs) -> "Child":
+        """Start a command on the cores in `affinity`, if it is given."""
+        import asyncio
+        import os
+
+        if not hasattr(os, "wait4"):
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                **kwargs,
+            )
+            if affinity is not None:
+                os.sched_setaffinity(process.pid, affinity)
+            return Child(process.pid, process.stdout, process.stderr, process.wait)
+
+        loop = asyncio.get_running_loop()
+        # The child inherits the affinity of the event loop, which is set for
+        # just the start, as nothing else runs on the loop in the meantime.
+        before = None
+        if affinity is not None:
+            before = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, affinity)
+        try:
+            popen = subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
+            )
+        finally:
+            if before is not None:
+                os.sched_setaffinity(0, before)
+        readers = []
+        for pipe in (popen.stdout, popen.stderr):
+            reader = asyncio.StreamReader()
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), pipe
+            )
+            readers.append(reader)
+
+        async def wait():
+            returncode, rusage = await Child.wait4(popen.pid)
+            # Keep Popen from waiting for the process again
+            popen.returncode = returncode
+            return returncode, rusage
+
+        return Child(popen.pid, *readers, wait)
+
+    @staticmethod
+    async def wait4(pid: int):
+        import asyncio
+        import os
+
+        try:
+            fd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            while True:
+                wpid, status, rusage = os.wait4(pid, os.WNOHANG)
+                if wpid:
+                    return os.waitstatus_to_exitcode(status), rusage
+                await asyncio.sleep(0.001)
+
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+        loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await exited
+        finally:
+            loop.remove_reader(fd)
+            os.close(fd)
+        _, status, rusage = os.wait4(pid, 0)
+        return os.waitstatus_to_exitcode(status), rusage
+
+    async def wait(self) -> int:
+        if self.returncode is None:
+            result = await self._wait()
+            if isinstance(result, tuple):
+                self.returncode, rusage = result
+                self.usage = usage_of(rusage)
+            else:
+                self.returncode = result
+        return self.returncode
+
+
+async def run_cmd_async(
+    cmd: list[str],
+    /,
+    timeout,
+    logger,
+    running=None,
+    max_output=MAX_OUTPUT,
+    affinity=None,
+    limits: Optional[Limits] = None,
+    usage: Optional[dict] = None,
+    **kwargs,
+):
+    """Run a command on the running event loop, with the same contract as
+    `run_cmd`. At most `max_output` bytes of stdout and stderr are kept, and
+    the command runs on the cores in `affinity`, if it is given.
+    """
+    import asyncio
+    import os
     import shlex
-    import threading
-    from time import monotonic, perf_counter_ns
+    from time import perf_counter_ns
 
     logger = logger.bind(process=summary64(cmd))
-    cp = None
-    stdout = []
-    stderr = []
-    tout = None
-    try:
-        start = monotonic()
-        start_ns = perf_counter_ns()
+    logger.debug(f"starting: {shlex.join(map(str, cmd))}")
+
+    stdout = Capture(max_output)
+    stderr = Capture(max_output, tail=True)
+    args = list(map(str, cmd))
+    if affinity is not None and affinity == os.sched_getaffinity(0):
+        affinity = None
+    if limits is not None:
+        args = limits.command(args)
+
+    start_ns = perf_counter_ns()
+    process = await Child.start(
+        args, affinity=affinity, start_new_session=os.name == "posix", **kwargs
+    )
+    group = ProcessGroup(process.pid)
+    if running is not None:
+        running.add(group)
+
+    async def save_result():
+        while chunk := await process.stdout.read(READ_CHUNK):
+            stdout.append(chunk)
+
+    async def log_lines():
+        line = b""
+        while chunk := await process.stderr.read(READ_CHUNK):
+            stderr.append(chunk)
+            *lines, line = (line + chunk).split(b"\n")
+            if len(line) > READ_CHUNK:
+                lines.append(line)
+                line = b""
+            for l in lines:
+                logger.debug(l.decode("utf-8", errors="replace"))
+        if line:
+            logger.debug(line.decode("utf-8", errors="replace"))
 
-        if timeout:
-            end = start + timeout
-        else:
-            end = None
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(save_result(), log_lines(), process.wait()), timeout
+        )
+        end_ns = perf_counter_ns()
+    except asyncio.TimeoutError:
+        logger.debug("process timed out, terminating")
+        group.kill()
+        await process.wait()
+        raise subprocess.TimeoutExpired(
+            cmd, timeout, output=stdout.text().strip(), stderr=stderr.text()
+        ) from None
+    except asyncio.CancelledError:
+        group.kill()
+        raise
+    finally:
+        if running is not None:
+            running.discard(group)
+        if usage is not None and process.usage is not None:
+            usage.update(process.usage)
+
+    for name, capture in (("stdout", stdout), ("stderr", stderr)):
+        if capture.dropped:
+            logger.warning(f"dropped {capture.dropped} bytes of {name}")
+
+    if process.returncode != 0:
+        error = subprocess.CalledProcessError
+        if limits and (limit := limits.exceeded(process.returncode, process.usage)):
+            logger.debug(f"process exceeded its {limit} limit")
+            error = functools.partial(LimitExceeded, limit)
+        raise error(
+            cmd=cmd,
+            returncode=process.returncode,
+            stderr=stderr.text(),
+            output=stdout.text().strip(),
+        )
 
-        logger.debug(f"starting: {shlex.join(map(str, cmd))}")
+    logger.debug("done")
+    return (stdout.text().strip(), end_ns - start_ns)
+
+
+def run_cmd(
+    cmd: list[str],
+    /,
+    timeout,
+    logger,
+    zygote=None,
+    running=None,
+    limits: Optional[Limits] = None,
+    usage: Optional[dict] = None,
+    **kwargs,
+):
+    """Run a command and return its output and the time it took in ns.
+
+    Raises `CalledProcessError` if it fails and `TimeoutExpired` if it times
+    out, in which case the whole process group of the command is killed. The
+    command is run on the shared event loop, see `run_cmd_async`. If a
+    `Zygote` is given, the command is forked from it instead. The process
+    group is added to the set `running` while it runs, so that it can be
+    killed from another thread.
+
+    The command runs with the resource `limits`, and raises `LimitExceeded`
+    if it fails because of them. Its resource usage, as given by `usage_of`,
+    is added to the dict `usage` where the platform supports it.
+    """
+    import os
+
+    if zygote is not None:
+        return zygote.run(
+            cmd, timeout=timeout, logger=logger, limits=limits, usage=usage
+        )
 
-        cp = subprocess.Popen(
-            cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True, **kwargs
+    if hasattr(os, "sched_getaffinity"):
+        # Run the command on the cores of this thread, not of the event loop
+        kwargs.setdefault("affinity", os.sched_getaffinity(0))
+    return event_loop().run(
+        run_cmd_async(
+            cmd,
+            timeout=timeout,
+            logger=logger,
+            running=running,
+            limits=limits,
+            usage=usage,
+            **kwargs,
         )
-        assert cp and cp.stdout and cp.stderr
+    )
+
+
+class Worker:
+    """A long-running tool, that answers requests using the worker protocol
+    (see `jpamb_utils.worker`).
+
+    `request` has the same contract as `run_cmd`. The worker is started on the
+    first request, and restarted after it crashes or times out. The `limits`
+    apply to the worker as a whole, so only a memory limit makes sense.
+    """
+
+    ENV = {"JPAMB_WORKER": "1"}
+
+    def __init__(
+        self,
+        cmd: list[str],
+        /,
+        logger,
+        env=None,
+        startup_timeout=60.0,
+        limits: Optional[Limits] = None,
+        **kwargs,
+    ):
+        import os
+
+        self.cmd = cmd
+        self.limits = limits
+        self.startup_timeout = startup_timeout
+        self.env = dict(env or os.environ, **self.ENV)
+        self.kwargs = kwargs
+        self.logger = self.log = logger.bind(process=summary64(cmd))
+        self.process = None
+        self.responses = None
+        self.stderr = collections.deque(maxlen=100)
+        self.marks = None
+        self.requests = 0
+
+    def start(self):
+        import queue
+        import shlex
+        import threading
+
+        self.logger.debug(f"starting worker: {shlex.join(map(str, self.cmd))}")
+        cmd = self.cmd
+        if self.limits is not None:
+            cmd = self.limits.command(cmd)
+        # In its own session, so that a Ctrl-C of the harness does not
+        # interrupt the request it is answering
+        self.process = cp = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env=self.env,
+            start_new_session=os.name == "posix",
+            **self.kwargs,
+        )
+        self.responses = responses = queue.Queue()
+        self.marks = marks = queue.Queue()
 
-        def log_lines(cp):
+        def log_lines():
             assert cp.stderr
             with cp.stderr:
                 for line in iter(cp.stderr.readline, ""):
-                    stderr.append(line)
-                    logger.debug(line[:-1])
+                    if line.startswith(MARK):
+                        marks.put(line[:-1])
+                        continue
+                    self.stderr.append(line)
+                    self.log.debug(line[:-1])
 
-        def save_result(cp):
+        def read_responses():
             assert cp.stdout
             with cp.stdout:
-                stdout.append(cp.stdout.read())
-
-        terr = threading.Thread(target=log_lines, args=(cp,), daemon=True)
-        terr.start()
-        tout = threading.Thread(target=save_result, args=(cp,), daemon=True)
-        tout.start()
+                for line in iter(cp.stdout.readline, ""):
+                    responses.put(line)
+            responses.put(None)
+
+        threading.Thread(target=log_lines, daemon=True).start()
+        threading.Thread(target=read_responses, daemon=True).start()
+
+        # The worker announces that it is ready, so that its startup is not
+        # included in the time of the first request.
+        try:
+            line = responses.get(timeout=self.startup_timeout)
+        except queue.Empty:
+            self.stop()
+            raise subprocess.TimeoutExpired(self.cmd, self.startup_timeout)
+        ready = json.loads(line) if line else {}
+        if not ready.get("ready"):
+            self.crashed(self.cmd)
+        if not ready.get("marks"):
+            self.marks = None
+        self.logger.debug("worker is ready")
+
+    def crashed(self, cmd) -> NoReturn:
+        try:
+            # The process is None if the worker was stopped by another thread
+            returncode = self.process.wait(timeout=1) if self.process else -9
+        except subprocess.TimeoutExpired:
+            returncode = -1
+        self.stop()
+        error = subprocess.CalledProcessError
+        stderr = "".join(self.stderr)
+        if self.limits and (limit := self.limits.exceeded(returncode, None)):
+            error = functools.partial(LimitExceeded, limit)
+        raise error(cmd=cmd, returncode=returncode, stderr=stderr, output="")
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.logger.debug("stopping worker")
+            self.process.kill()
+        self.process.wait()
+        self.process = None
+
+    def close(self):
+        """Ask the worker to finish, by closing its input."""
+        if self.process is None:
+            return
+        try:
+            assert self.process.stdin
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.stop()
+
+    def send(
+        self, cmd: list[str], request: dict, /, timeout, logger=None
+    ) -> tuple[dict, int]:
+        """Send a request and wait for its response. `cmd` is only used in
+        the errors, and the output of the worker is logged to `logger` while
+        the request runs.
+        """
+        import queue
+        from time import perf_counter_ns
+
+        if self.process is None or self.process.poll() is not None:
+            self.stop()
+            self.start()
+        assert self.process and self.process.stdin and self.responses
+
+        self.requests += 1
+        rid = self.requests
+        self.stderr.clear()
+        if logger is not None:
+            self.log = logger.bind(process=summary64(self.cmd))
+        else:
+            self.log = self.logger
+        self.log.debug(f"request: {request}")
 
-        terr.join(end and end - monotonic())
-        tout.join(end and end - monotonic())
-        exitcode = cp.wait(end and end - monotonic())
+        start_ns = perf_counter_ns()
+        try:
+            self.process.stdin.write(json.dumps(dict(request, id=rid)) + "\n")
+            self.process.stdin.flush()
+            line = self.responses.get(timeout=timeout)
+        except queue.Empty:
+            self.log.debug("worker timed out, stopping it")
+            self.stop()
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except OSError:
+            line = None
         end_ns = perf_counter_ns()
 
-        if exitcode != 0:
+        if line is None:
+            self.crashed(cmd)
+
+        response = json.loads(line)
+        if response["id"] != rid:
+            self.stop()
+            raise ValueError(f"worker answered {response['id']} to request {rid}")
+
+        # Wait until the worker has written all of its stderr for this request
+        if self.marks is not None:
+            done = STDERR_DONE.format(id=rid)
+            try:
+                while self.marks.get(timeout=1) != done:
+                    pass
+            except queue.Empty:
+                self.log.debug("worker did not mark the end of its stderr")
+        return (response, end_ns - start_ns)
+
+    def request(self, args: list[str], /, timeout, logger=None):
+        response, time_ns = self.send(
+            self.cmd + args, {"args": args}, timeout=timeout, logger=logger
+        )
+
+        output = response["output"].strip()
+        if response["error"] is not None:
             raise subprocess.CalledProcessError(
+                cmd=self.cmd + args,
+                returncode=1,
+                stderr="".join(self.stderr) + response["error"],
+                output=output,
+            )
+
+        self.log.debug("done")
+        return (output, time_ns)
+
+
+class Zygote(Worker):
+    """A fork server for Python tools (see `bin/zygote.py`).
+
+    The zygote imports `modules` once, and then forks a child for every
+    command, which runs the script of the command as `__main__`. This saves
+    the startup and imports of the interpreter, without changing the tool.
+
+    `run` has the same contract as `run_cmd`, for commands of the form
+    `[python, script, *args]`.
+    """
+
+    ENV: dict[str, str] = {}
+
+    # Extra time given to the zygote to report a timed out child
+    GRACE = 5.0
+
+    def __init__(
+        self, modules: list[str], /, logger, python: str = sys.executable, **kwargs
+    ):
+        super().__init__([python, str(ZYGOTE), *modules], logger=logger, **kwargs)
+
+    def run(
+        self,
+        cmd: list[str],
+        /,
+        timeout,
+        logger=None,
+        limits: Optional[Limits] = None,
+        usage: Optional[dict] = None,
+    ):
+        import dataclasses
+        import shlex
+
+        logger = (logger or self.logger).bind(process=summary64(cmd))
+        logger.debug(f"forking: {shlex.join(map(str, cmd))}")
+
+        request = {"argv": [str(c) for c in cmd[1:]], "timeout": timeout}
+        if limits is not None:
+            request["limits"] = dataclasses.asdict(limits)
+        response, _ = self.send(
+            cmd, request, timeout=timeout and timeout + self.GRACE, logger=logger
+        )
+        if usage is not None and response.get("usage") is not None:
+            usage.update(response["usage"])
+
+        for line in response["stderr"].splitlines():
+            logger.debug(line)
+
+        if response["timeout"]:
+            logger.debug("process timed out, terminating")
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+        stdout = response["stdout"].strip()
+        if response["returncode"] != 0:
+            error = subprocess.CalledProcessError
+            if limits and (
+                limit := limits.exceeded(response["returncode"], response.get("usage"))
+            ):
+                logger.debug(f"process exceeded its {limit} limit")
+                error = functools.partial(LimitExceeded, limit)
+            raise error(
                 cmd=cmd,
-                returncode=exitcode,
-                stderr="\n".join(stderr),
-                output=stdout[0].strip(),
+                returncode=response["returncode"],
+                stderr=response["stderr"],
+                output=stdout,
             )
 
         logger.debug("done")
-        return (stdout[0].strip(), end_ns - start_ns)
-    except subprocess.CalledProcessError as e:
-        if tout:
-            tout.join()
-        e.stdout = stdout[0].strip()
-        raise e
-    except subprocess.TimeoutExpired:
-        logger.debug("process timed out, terminating")
-        if cp:
-            cp.terminate()
-            if cp.stdout:
-                cp.stdout.close()
-            if cp.stderr:
-                cp.stderr.close()
-        raise
+        return (stdout, response["time_ns"])
+
+
+class CaseServer:
+    """A JVM running `jpamb.Runtime --server`, which checks cases one at a
+    time, without starting a new JVM for every case. The server runs on the
+    shared event loop, so its methods are coroutines.
+
+    The JVM can't stop a case that runs forever, so it answers `*` and exits
+    when a case times out. It is then restarted on the next case.
+    """
+
+    # How long to wait for an answer, besides the timeout of the case
+    GRACE = 30.0
+
+    def __init__(self, classfiles: Path, /, logger, timeout=0.5):
+        self.cmd = ["java", "-cp", str(classfiles), "-ea", "jpamb.Runtime"]
+        self.cmd += ["--server", str(int(timeout * 1000))]
+        self.timeout = timeout
+        self.logger = logger.bind(process=summary64(self.cmd))
+        self.process = None
+
+    async def start(self):
+        import asyncio
+        import os
+
+        self.logger.debug("starting case server")
+        self.process = process = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=os.name == "posix",
+        )
+
+        async def log_lines():
+            assert process.stderr
+            while line := await process.stderr.readline():
+                self.logger.debug(line.decode("utf-8", errors="replace").rstrip("\n"))
+
+        self.stderr = asyncio.ensure_future(log_lines())
+
+    async def stop(self):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            ProcessGroup(self.process.pid).kill()
+        await self.process.wait()
+        self.process = None
+
+    async def close(self):
+        import asyncio
+
+        if self.process is None:
+            return
+        try:
+            assert self.process.stdin
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), 5)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        await self.stop()
+
+    async def check(self, case: "Case") -> Optional[str]:
+        """Run a case, and return its result, or None if the JVM failed."""
+        import asyncio
+
+        if self.process is None or self.process.returncode is not None:
+            await self.stop()
+            await self.start()
+        assert self.process and self.process.stdin and self.process.stdout
+
+        try:
+            self.process.stdin.write(f"{case.methodid} {case.input}\n".encode())
+            await self.process.stdin.drain()
+            line = await asyncio.wait_for(
+                self.process.stdout.readline(), self.timeout + self.GRACE
+            )
+            result = line.decode().rstrip("\n") if line else None
+        except (OSError, ValueError, asyncio.TimeoutError):
+            result = None
+
+        if result == "*":
+            # The JVM exits after a case times out
+            await self.process.wait()
+        if result is None or result.startswith("error:"):
+            self.logger.debug(f"case server failed with {result!r}")
+            await self.stop()
+            return None
+        return result
 
 
 def runtime(*args, enable_assertions=False, **kwargs):
@@ -288,7 +1219,7 @@ class Suite:
 
     def build(self):
         self.logger.info("Building the benchmark suite")
-        subprocess.call(["mvn", "compile"], cwd=self.workfolder)
+        subprocess.check_call(["mvn", "compile"], cwd=self.workfolder)
         self.logger.info("Done")
 
     def update_cases(self):
@@ -298,6 +1229,10 @@ class Suite:
             lines = runtime(cwd=self.workfolder).splitlines(keepends=True)
             f.write("".join(sorted(lines)))
 
+        self.logger.info("Indexing the cases")
+        case_index.build(stats, self.queries)
+        index = self.index()
+
         self.logger.info("Updating the distribution")
 
         with open(stats / "distribution.csv", "w") as f:
@@ -307,15 +1242,13 @@ class Suite:
             sums = collections.Counter()
             total = 0
 
-            for mid, cases in Case.by_methodid(self.cases()):
+            for mid in sorted(map(MethodId.parse, index.methods())):
+                outcomes = index.outcomes(mid)
                 occ = []
                 total += 1
-                for t in self.queries:
-                    if any(c.result == t for c in cases):
-                        occ.append(1)
-                        sums[t] += 1
-                    else:
-                        occ.append(0)
+                for i, t in enumerate(self.queries):
+                    occ.append(outcomes >> i & 1)
+                    sums[t] += occ[-1]
 
                 w.writerow([mid] + occ)
 
@@ -323,34 +1256,67 @@ class Suite:
 
         self.logger.info("Done")
 
+    def index(self) -> case_index.CaseIndex:
+        """The index of the cases, which is built again when the cases
+        file changes.
+        """
+        return case_index.load(self.stats_folder(), self.queries)
+
     def cases(self):
-        with open(self.stats_folder() / "cases.txt", "r") as f:
-            for r in f.readlines():
-                yield Case.from_spec(r[:-1])
+        for methodid, _, values, result in self.index().cases():
+            yield Case(methodid, Input(values), result)
 
-    def check(self):
+    def check(self, jobs: Optional[int] = None, cases=None) -> bool:
+        """Check that the cases (all by default) give the expected results,
+        using `jobs` JVMs.
+        """
         self.logger.info("Checking cases")
+        failed = self.failed_checks(self.cases() if cases is None else cases, jobs)
+        if failed:
+            self.logger.error("Failed checks:")
+            for f in failed:
+                self.logger.error(f)
+            return False
+        else:
+            self.logger.success("Successfully verified all cases.")
+            return True
+
+    def failed_checks(self, cases, jobs: Optional[int] = None) -> list["Case"]:
+        """Check the cases, and return the ones that failed."""
+        import asyncio
+        import os
+
         failed = []
+        timeout = 0.5
+        jobs = jobs or min(4, os.cpu_count() or 1)
+        cases = list(cases)
+
+        async def check_all():
+            servers = [
+                CaseServer(self.classfiles, logger=self.logger, timeout=timeout)
+                for _ in range(jobs)
+            ]
+            idle = asyncio.Queue()
+            for server in servers:
+                idle.put_nowait(server)
+
+            async def check(case):
+                server = await idle.get()
+                try:
+                    return await server.check(case)
+                finally:
+                    idle.put_nowait(server)
 
-        for case in self.cases():
-            self.logger.debug(f"Testing {case!s:<74}")
-            cmd = ["java", "-cp", self.classfiles, "-ea"]
-            cmd += ["jpamb.Runtime", str(case.methodid), str(case.input)]
-            timeout = 0.5
             try:
-                result, time = run_cmd(
-                    cmd,
-                    timeout=timeout,
-                    logger=self.logger,
-                )
-                self.logger.debug(f"Got {result!r} in {time/10**9}s")
-            except subprocess.CalledProcessError:
-                result = None
-                self.logger.debug(f"Process failed.")
-            except subprocess.TimeoutExpired:
-                result = "*"
-                self.logger.debug(f"Timed out after {timeout}.")
+                return await asyncio.gather(*map(check, cases))
+            finally:
+                for server in servers:
+                    await server.close()
+
+        results = event_loop().run(check_all())
 
+        for case, result in zip(cases, results):
+            self.logger.debug(f"Got {result!r} for {case!s:<74}")
             outcome = "SUCCESS"
             if case.result != result:
                 outcome = "FAILED"
@@ -358,22 +1324,44 @@ class Suite:
 
             self.logger.info(f"Testing {case!s:<74}: {outcome}")
 
-        if failed:
-            self.logger.error("Failed checks:")
-            for f in failed:
-                self.logger.error(f)
-            return False
-        else:
-            self.logger.success("Successfully verified all cases.")
-            return True
+        return failed
+
+    def decompile(self, jobs: Optional[int] = None) -> tuple[int, int]:
+        """Decompile the classfiles that changed since the last decompilation,
+        using `jobs` parallel jobs, and return how many decompiled classes were
+        reused and regenerated.
+
+        The content hashes of the classfiles are kept in a manifest in the
+        decompiled folder.
+        """
+        import hashlib
+        import os
+        from concurrent.futures import ThreadPoolExecutor
 
-    def decompile(self):
         self.logger.info("Decompiling classfiles")
         decompiled = self.decompiled()
-        for clazz in self.classfiles.glob("**/*.class"):
+        manifest = Manifest.open(decompiled / MANIFEST_NAME)
+        previous = manifest.entries
+        if (tool := jvm2json_version()) is not None and manifest.tool != tool:
+            self.logger.info("jvm2json changed, decompiling everything")
+            previous = {}
+
+        entries, todo, existing = {}, [], set()
+        for clazz in sorted(self.classfiles.glob("**/*.class")):
+            key = clazz.relative_to(self.classfiles).as_posix()
+            existing.add(key)
             jsonclazz = decompiled / clazz.relative_to(self.classfiles).with_suffix(
                 ".json"
             )
+            sha256 = hashlib.sha256(clazz.read_bytes()).hexdigest()
+            entry = previous.get(key)
+            if entry and entry["sha256"] == sha256 and jsonclazz.exists():
+                entries[key] = entry
+            else:
+                todo.append((key, clazz, jsonclazz, sha256))
+        reused = len(entries)
+
+        def convert(key, clazz, jsonclazz, sha256):
             self.logger.info(
                 f"Converting {clazz.relative_to(self.workfolder)} to {jsonclazz.relative_to(self.workfolder)}"
             )
@@ -384,6 +1372,33 @@ class Suite:
                 self.logger.warning(f"jvm2json: {res}")
             self.logger.trace(res)
             encoding = json.loads(res)
-            with open(jsonclazz, "w") as f:
-                json.dump(encoding, f, indent=2, sort_keys=True)
-        self.logger.success("Done decompiling classfiles")
+            write_atomic(jsonclazz, json.dumps(encoding, indent=2, sort_keys=True))
+            return key, {
+                "sha256": sha256,
+                "json": jsonclazz.relative_to(decompiled).as_posix(),
+            }
+
+        try:
+            with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+                for key, entry in executor.map(lambda t: convert(*t), todo):
+                    entries[key] = entry
+        finally:
+            # Classes that failed to decompile are left out, so they are
+            # decompiled again next time.
+            removed = [e for k, e in manifest.entries.items() if k not in existing]
+            for entry in removed:
+                self.logger.info(f"Removing {entry['json']}")
+                (decompiled / entry["json"]).unlink(missing_ok=True)
+            manifest.entries = entries
+            manifest.tool = tool or manifest.tool
+            manifest.save()
+
+        self.logger.info("Indexing the decompiled methods")
+        method_index.build(decompiled)
+        if todo or removed or bytecode.is_stale(decompiled):
+            self.logger.info("Encoding the decompiled bytecode")
+            bytecode.build(decompiled)
+        self.logger.success(
+            f"Done decompiling classfiles, reused {reused} and regenerated {len(todo)}"
+        )
+        return reused, len(todo)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+""" A fork server for Python tools.
+
+The zygote is started by the harness (see `Zygote` in `bin/utils.py`) with the
+modules that the tool imports:
+
+    python bin/zygote.py tree_sitter tree_sitter_java jpamb_utils
+
+It imports the modules and prints `{"ready": true}`. Then it receives one
+command per line on stdin:
+
+    {"id": 1, "argv": ["solutions/syntaxer.py", "jpamb.cases.Simple.divideByN:(I)I"], "timeout": 2.0}
+
+For every command it forks a child, which runs `argv[0]` as `__main__`, like
+`python *argv` would have done, but without importing the modules again. The
+command may also have `"limits"`, with the `memory` (in bytes) and `cpu` (in
+seconds) that the child may use. When the child has exited, or has been
+killed after `timeout` seconds together with the processes it started (it
+leads its own process group), the zygote answers with a single line on
+stdout, which includes the resource usage of the child:
+
+    {"id": 1, "stdout": "...", "stderr": "...", "returncode": 0, "time_ns": 3120000, "timeout": false, "usage": {...}}
+
+The zygote only uses the standard library, so it can run with the interpreter
+of the tool.
+"""
+
+from time import monotonic, perf_counter_ns, sleep
+from typing import Optional
+import atexit
+import importlib
+import json
+import os
+import runpy
+import select
+import signal
+import sys
+import tempfile
+import traceback
+
+
+def limit(limits: dict):
+    """Set the resource limits of the current process."""
+    import math
+    import resource
+
+    if limits.get("memory") is not None:
+        memory = limits["memory"]
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    if limits.get("cpu") is not None:
+        seconds = math.ceil(limits["cpu"])
+        resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds + 1))
+
+
+def usage(rusage) -> dict:
+    """The resource usage of a child, like `usage_of` in `bin/utils.py`."""
+    return {
+        "user_time": int(rusage.ru_utime * 1_000_000_000),
+        "sys_time": int(rusage.ru_stime * 1_000_000_000),
+        "max_rss": rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+        "voluntary_switches": rusage.ru_nvcsw,
+        "involuntary_switches": rusage.ru_nivcsw,
+    }
+
+
+def child(argv: list[str], stdout: int, stderr: int, limits: dict):
+    """Run the script in argv as `__main__`, and exit with its exit code.
+
+    A script that runs out of memory aborts, like the interpreter does when
+    it can't even raise a MemoryError, so the harness can tell from the exit
+    signal.
+    """
+    code = 1
+    out_of_memory = False
+    try:
+        # The child leads its own process group, so that the processes it
+        # starts are killed with it
+        os.setpgid(0, 0)
+        limit(limits)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+        os.dup2(stdout, 1)
+        os.dup2(stderr, 2)
+        sys.stdin = open(0, closefd=False)
+
+        sys.argv = list(argv)
+        sys.path[0] = os.path.dirname(os.path.abspath(argv[0]))
+        runpy.run_path(argv[0], run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+    except BaseException as e:
+        out_of_memory = isinstance(e, MemoryError)
+        # Hide the frames of the zygote, like python would have
+        tb = e.__traceback__
+        while tb and tb.tb_frame.f_code.co_filename != argv[0]:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+    finally:
+        try:
+            atexit._run_exitfuncs()
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            if out_of_memory:
+                os.abort()
+            os._exit(code)
+
+
+def wait(pid: int, timeout: Optional[float]) -> Optional[tuple[int, dict]]:
+    """Wait for a child to exit, and return its exit code and resource usage,
+    or None if it has not exited before the timeout.
+    """
+    try:
+        fd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        deadline = timeout and monotonic() + timeout
+        while True:
+            wpid, status, rusage = os.wait4(pid, os.WNOHANG)
+            if wpid:
+                return os.waitstatus_to_exitcode(status), usage(rusage)
+            if deadline and monotonic() > deadline:
+                return None
+            sleep(0.001)
+
+    try:
+        ready, _, _ = select.select([fd], [], [], timeout)
+    finally:
+        os.close(fd)
+    if not ready:
+        return None
+    _, status, rusage = os.wait4(pid, 0)
+    return os.waitstatus_to_exitcode(status), usage(rusage)
+
+
+def run(argv: list[str], timeout: Optional[float], limits: dict) -> dict:
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        start_ns = perf_counter_ns()
+        pid = os.fork()
+        if pid == 0:
+            child(argv, stdout.fileno(), stderr.fileno(), limits)
+        try:
+            # Also here, so the group exists before the child gets to it
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+
+        waited = wait(pid, timeout)
+        end_ns = perf_counter_ns()
+        if waited is None:
+            os.killpg(pid, signal.SIGKILL)
+            _, _, rusage = os.wait4(pid, 0)
+            waited = None, usage(rusage)
+        returncode, used = waited
+
+        outputs = []
+        for f in (stdout, stderr):
+            f.seek(0)
+            outputs.append(f.read().decode("utf-8", errors="replace"))
+
+    return {
+        "stdout": outputs[0],
+        "stderr": outputs[1],
+        "returncode": returncode,
+        "time_ns": end_ns - start_ns,
+        "timeout": returncode is None,
+        "usage": used,
+    }
+
+
+def serve(modules: list[str]):
+    for module in modules:
+        importlib.import_module(module)
+
+    protocol = sys.stdout
+    protocol.write(json.dumps({"ready": True}) + "\n")
+    protocol.flush()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        response = run(
+            request["argv"], request.get("timeout"), request.get("limits") or {}
+        )
+        response["id"] = request["id"]
+        protocol.write(json.dumps(response) + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1:])
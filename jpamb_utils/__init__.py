@@ -1,6 +1,7 @@
 from typing import NoReturn, TypeAlias, Literal, Optional
 from dataclasses import dataclass
 from collections import namedtuple
+from array import array
 from pathlib import Path
 import re
 import sys
@@ -74,17 +75,68 @@ def parse_type(input_type: str) -> tuple[JvmType, str]:
         raise ValueError(f"Unknown type {input_type}")
 
 
-def string_compare(cls):
-    from functools import total_ordering
+def decompiled_type(tpe: dict) -> JvmType:
+    """Convert a type from the decompiled json into a JvmType."""
+    if "base" in tpe:
+        return tpe["base"]
+    elif tpe.get("kind") == "array" and "base" in tpe["type"]:
+        return tpe["type"]["base"] + "[]"
+    else:
+        raise ValueError(f"Can't handle {tpe}")
+
+
+class _Value:
+    """The base of the input values.
+
+    Values are immutable, and compare like their strings, as the cases are
+    sorted by them. Values of the same type are equal when their values are,
+    without printing them.
+    """
+
+    __slots__ = ("value",)
+    __match_args__ = ("value",)
+
+    def __init__(self, value) -> None:
+        object.__setattr__(self, "value", value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return (type(self), (self.value,))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.value!r})"
+
+    def __eq__(self, other) -> bool:
+        if type(self) is type(other):
+            return self.value == other.value
+        # Values of different types never print the same
+        if isinstance(other, _Value):
+            return False
+        return str(self) == str(other)
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.value))
+
+    def __lt__(self, other) -> bool:
+        return str(self) < str(other)
 
-    cls.__eq__ = lambda self, other: str(self) == str(other)
-    cls.__le__ = lambda self, other: str(self) < str(other)
-    return total_ordering(cls)
+    def __le__(self, other) -> bool:
+        return str(self) <= str(other)
 
+    def __gt__(self, other) -> bool:
+        return str(self) > str(other)
 
-@dataclass(frozen=True)
-@string_compare
-class BoolValue:
+    def __ge__(self, other) -> bool:
+        return str(self) >= str(other)
+
+
+class BoolValue(_Value):
+    __slots__ = ()
     value: bool
 
     def __str__(self):
@@ -94,9 +146,8 @@ class BoolValue:
         return IntValue(1) if self.value else IntValue(0)
 
 
-@dataclass(frozen=True)
-@string_compare
-class IntValue:
+class IntValue(_Value):
+    __slots__ = ()
     value: int
 
     def __str__(self):
@@ -106,9 +157,8 @@ class IntValue:
         return self.value
 
 
-@dataclass(frozen=True)
-@string_compare
-class CharValue:
+class CharValue(_Value):
+    __slots__ = ()
     value: str
 
     def __str__(self):
@@ -118,35 +168,73 @@ class CharValue:
         return IntValue(ord(self.value[0]))
 
 
-@dataclass(frozen=True)
-@string_compare
-class IntListValue:
-    value: tuple[int]
+class IntListValue(_Value):
+    """A list of ints, stored in an `array('i')`, which must not be modified.
+    The hash and the string are computed once.
+    """
+
+    __slots__ = ("_hash", "_str")
+    value: array
+
+    def __init__(self, value) -> None:
+        if not (isinstance(value, array) and value.typecode == "i"):
+            value = array(
+                "i", (v.value if isinstance(v, IntValue) else v for v in value)
+            )
+        super().__init__(value)
+        object.__setattr__(self, "_hash", None)
+        object.__setattr__(self, "_str", None)
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            object.__setattr__(
+                self, "_hash", hash((IntListValue, self.value.tobytes()))
+            )
+        return self._hash  # type: ignore
 
     def __str__(self) -> str:
-        val = ", ".join(str(a) for a in self.value)
-        return f"[I:{val}]"
+        if self._str is None:
+            val = ", ".join(map(str, self.value))
+            object.__setattr__(self, "_str", f"[I:{val}]")
+        return self._str  # type: ignore
 
     def tolocal(self):
-        return self.value
+        return tuple(IntValue(v) for v in self.value)
 
 
-@dataclass(frozen=True)
-@string_compare
-class CharListValue:
-    value: tuple[str]
+class CharListValue(_Value):
+    """A list of chars, stored as a `str`. The string is computed once."""
+
+    __slots__ = ("_str",)
+    value: str
+
+    def __init__(self, value) -> None:
+        if not isinstance(value, str):
+            value = "".join(v.value if isinstance(v, CharValue) else v for v in value)
+        super().__init__(value)
+        object.__setattr__(self, "_str", None)
 
     def __str__(self) -> str:
-        val = ", ".join(str(a) for a in self.value)
-        return f"[C:{val}]"
+        if self._str is None:
+            val = ", ".join(f"'{c}'" for c in self.value)
+            object.__setattr__(self, "_str", f"[C:{val}]")
+        return self._str  # type: ignore
 
     def tolocal(self):
-        return self.value
+        return tuple(CharValue(c) for c in self.value)
 
 
 JvmValue: TypeAlias = BoolValue | IntValue | CharValue | IntListValue | CharListValue
 
 
+METHODID_RE = re.compile(
+    r"(?P<class_name>.+)\.(?P<method_name>.*)\:\((?P<params>.*)\)(?P<return>.*)"
+)
+
+_methodids: dict[str, "MethodId"] = {}
+_classfiles: dict[str, Path] = {}
+
+
 @dataclass(frozen=True, order=True)
 class MethodId:
     class_name: str
@@ -156,12 +244,13 @@ class MethodId:
 
     @classmethod
     def parse(cls, name):
-        import re
+        """Parse a method id. Method ids are interned, so parsing the same
+        name again returns the same object.
+        """
+        if (methodid := _methodids.get(name)) is not None:
+            return methodid
 
-        RE = (
-            r"(?P<class_name>.+)\.(?P<method_name>.*)\:\((?P<params>.*)\)(?P<return>.*)"
-        )
-        if (i := re.match(RE, name)) is None:
+        if (i := METHODID_RE.match(name)) is None:
             raise ValueError("invalid method name: %r", name)
 
         methodid = cls(
@@ -173,6 +262,7 @@ class MethodId:
 
         assert str(methodid) == name, f"Expected {methodid} == {name}"
 
+        _methodids[name] = methodid
         return methodid
 
     def __str__(self) -> str:
@@ -180,13 +270,49 @@ class MethodId:
         pr = print_return_type(self.return_type)
         return f"{self.class_name}.{self.method_name}:{pp}{pr}"
 
+    @classmethod
+    def from_decompiled(cls, class_name: str, method: dict) -> "MethodId":
+        """Create the MethodId of a method from a decompiled classfile.
+
+        Raises a ValueError if the method uses types we can't represent.
+        """
+        returns = method["returns"]["type"]
+        return cls(
+            class_name=class_name,
+            method_name=method["name"],
+            params=tuple(decompiled_type(p["type"]) for p in method["params"]),
+            return_type=None if returns is None else decompiled_type(returns),
+        )
+
     def classfile(self):
-        return Path("decompiled", *self.class_name.split(".")).with_suffix(".json")
+        """The decompiled classfile of the method. Like method ids, the paths
+        are interned, so they are cheap to hash and print again.
+        """
+        if (classfile := _classfiles.get(self.class_name)) is None:
+            classfile = Path("decompiled", *self.class_name.split("."))
+            classfile = _classfiles[self.class_name] = classfile.with_suffix(".json")
+        return classfile
 
     def sourcefile(self):
         return Path("src/main/java", *self.class_name.split(".")).with_suffix(".java")
 
     def load(self):
+        """Load the decompiled method, through the process-wide cache.
+
+        The result is shared between callers, so don't modify it.
+        """
+        from jpamb_utils import cache
+
+        return cache.load_method(self)
+
+    def instructions(self):
+        """Load the typed instructions of the method, see `jpamb_utils.instructions`."""
+        from jpamb_utils import instructions
+
+        return instructions.load(self)
+
+    def scan(self):
+        """Find the method by reading and searching the entire classfile."""
         import json
 
         classfile = self.classfile()
@@ -216,35 +342,45 @@ class MethodId:
 
 @dataclass
 class InputParser:
+    """A single-pass parser of inputs, like `(1, [I:1, 2], 'a')`.
+
+    The parser keeps a cursor into the input and scans one token at a time.
+    Int and char arrays are decoded in one go, straight into their storage.
+    """
+
     Token = namedtuple("Token", "kind value")
 
-    tokens: list["InputParser.Token"]
+    TOKEN_SPECIFICATION = [
+        ("OPEN_ARRAY", r"\[[IC]:"),
+        ("CLOSE_ARRAY", r"\]"),
+        ("OPEN_INPUTS", r"\("),
+        ("CLOSE_INPUTS", r"\)"),
+        ("INT", r"-?\d+"),
+        ("BOOL", r"true|false"),
+        ("CHAR", r"'[^']'"),
+        ("COMMA", r","),
+    ]
+    TOKEN_RE = re.compile(
+        r"[ \t]*(?:" + "|".join(f"(?P<{n}>{m})" for n, m in TOKEN_SPECIFICATION) + ")"
+    )
+    INT_ARRAY_RE = re.compile(r"[ \t]*(-?\d+(?:[ \t]*,[ \t]*-?\d+)*)?[ \t]*\]")
+    CHAR_ARRAY_RE = re.compile(r"[ \t]*('[^']'(?:[ \t]*,[ \t]*'[^']')*)?[ \t]*\]")
+    CHAR_RE = re.compile(r"'([^'])'")
+
     input: str
+    pos: int
 
     def __init__(self, input) -> None:
         self.input = input
-        self.tokens = list(InputParser.tokenize(input))
+        self.pos = 0
+        self._head = None
 
     @staticmethod
     def tokenize(string):
-        token_specification = [
-            ("OPEN_ARRAY", r"\[[IC]:"),
-            ("CLOSE_ARRAY", r"\]"),
-            ("OPEN_INPUTS", r"\("),
-            ("CLOSE_INPUTS", r"\)"),
-            ("INT", r"-?\d+"),
-            ("BOOL", r"true|false"),
-            ("CHAR", r"'[^']'"),
-            ("COMMA", r","),
-            ("SKIP", r"[ \t]+"),
-        ]
-        tok_regex = "|".join(f"(?P<{n}>{m})" for n, m in token_specification)
-
-        for m in re.finditer(tok_regex, string):
-            kind, value = m.lastgroup, m.group()
-            if kind == "SKIP":
-                continue
-            yield InputParser.Token(kind, value)
+        pos = 0
+        while m := InputParser.TOKEN_RE.match(string, pos):
+            yield InputParser.Token(m.lastgroup, m.group(m.lastgroup))
+            pos = m.end()
 
     @staticmethod
     def parse(string) -> list[JvmValue]:
@@ -252,15 +388,25 @@ class InputParser:
 
     @property
     def head(self):
-        if self.tokens:
-            return self.tokens[0]
+        if self._head is None:
+            if m := self.TOKEN_RE.match(self.input, self.pos):
+                self._head = (
+                    InputParser.Token(m.lastgroup, m.group(m.lastgroup)),
+                    m.end(),
+                )
+            else:
+                return None
+        return self._head[0]
 
     def next(self):
-        self.tokens = self.tokens[1:]
+        if self.head is not None:
+            self.pos = self._head[1]  # type: ignore
+            self._head = None
 
     def expected(self, expected) -> NoReturn:
         raise ValueError(
-            f"Expected {expected} but got {self.tokens[:3]} in {self.input}"
+            f"Expected {expected} but got {self.input[self.pos:self.pos + 20]!r}"
+            f" at {self.pos} in {self.input[:80]}"
         )
 
     def expect(self, expect) -> Token:
@@ -280,6 +426,8 @@ class InputParser:
             return self.parse_array()
         if next.kind == "BOOL":
             return self.parse_bool()
+        if next.kind == "CHAR":
+            return self.parse_char()
         self.expected("input")
 
     def parse_int(self):
@@ -299,12 +447,18 @@ class InputParser:
         if key.value == "[I:":  # ]
             listtype = IntListValue
             parser = self.parse_int
+            fast = self.INT_ARRAY_RE
         elif key.value == "[C:":  # ]
             listtype = CharListValue
             parser = self.parse_char
+            fast = self.CHAR_ARRAY_RE
         else:
             self.expected("int or char array")
 
+        if m := fast.match(self.input, self.pos):
+            self.pos = m.end()
+            return listtype(self.decode_array(listtype, m.group(1) or ""))
+
         inputs = []
 
         if self.head is None:
@@ -324,6 +478,14 @@ class InputParser:
 
         return listtype(tuple(inputs))
 
+    def decode_array(self, listtype, body: str):
+        if listtype is CharListValue:
+            return "".join(self.CHAR_RE.findall(body))
+        try:
+            return array("i", map(int, body.split(",")) if body else ())
+        except OverflowError as e:
+            raise ValueError(f"Int array out of range in {self.input[:80]}") from e
+
     def parse_inputs(self):
         self.expect("OPEN_INPUTS")
         inputs = []
@@ -331,15 +493,16 @@ class InputParser:
         if self.head is None:
             self.expected("input or )")
 
-        if self.head.kind == "CLOSE_INPUTS":
-            return inputs
-
-        inputs.append(self.parse_input())
-
-        while self.head and self.head.kind == "COMMA":
-            self.next()
+        if self.head.kind != "CLOSE_INPUTS":
             inputs.append(self.parse_input())
 
+            while self.head and self.head.kind == "COMMA":
+                self.next()
+                inputs.append(self.parse_input())
+
         self.expect("CLOSE_INPUTS")
 
+        if self.input[self.pos :].strip():
+            self.expected("end of input")
+
         return inputs
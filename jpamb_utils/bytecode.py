@@ -0,0 +1,402 @@
+""" A compact, memory-mappable binary encoding of the decompiled bytecode.
+
+All methods of the suite are stored in a single file, `decompiled/.bytecode.bin`,
+so that tools can `mmap` it instead of parsing the pretty-printed json. The
+file is a header followed by a number of aligned sections:
+
+    strings   an interned string pool (offsets and utf-8 data)
+    methods   the method ids (sorted by name) and their instruction ranges
+    code      the opcodes, offsets and operand references of all instructions
+    operands  the deduplicated, tagged encoding of the remaining fields
+    sources   the sha256 of every classfile, as json
+
+The arrays are stored in native byte order, so they can be read with
+`memoryview.cast` without copying anything. Instructions decode to the same
+dictionaries as `m["code"]["bytecode"]`, but only when they are accessed.
+
+Like the method index, the file is stale when the content hash of a classfile
+differs from the one it was built from, and the classfiles are only hashed
+again when their mtime or size changed (see `jpamb_utils.index`).
+"""
+
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+BYTECODE_NAME = ".bytecode.bin"
+MAGIC = b"JPAMBBC\x02"
+
+# magic, byteorder, and (offset, count) of the arrays, the operands and the
+# sources.
+HEADER = struct.Struct("<8s8s22Q")
+SECTIONS = (
+    ("string_offsets", "I"),
+    ("string_data", "B"),
+    ("method_names", "I"),
+    ("method_starts", "I"),
+    ("method_counts", "I"),
+    ("method_max_locals", "I"),
+    ("code_oprs", "I"),
+    ("code_offsets", "I"),
+    ("code_operands", "I"),
+)
+
+# Tags of the operand encoding
+NULL, FALSE, TRUE, INT, FLOAT, STRING, LIST, OBJECT = range(8)
+
+U32 = struct.Struct("<I")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        self.operands = bytearray()
+        self.operand_refs: dict[bytes, int] = {}
+
+    def intern(self, string: str) -> int:
+        if (i := self.strings.get(string)) is None:
+            i = self.strings[string] = len(self.strings)
+        return i
+
+    def encode(self, value, out: bytearray):
+        if value is None:
+            out.append(NULL)
+        elif value is True:
+            out.append(TRUE)
+        elif value is False:
+            out.append(FALSE)
+        elif isinstance(value, int):
+            out.append(INT)
+            out += I64.pack(value)
+        elif isinstance(value, float):
+            out.append(FLOAT)
+            out += F64.pack(value)
+        elif isinstance(value, str):
+            out.append(STRING)
+            out += U32.pack(self.intern(value))
+        elif isinstance(value, list):
+            out.append(LIST)
+            out += U32.pack(len(value))
+            for v in value:
+                self.encode(v, out)
+        elif isinstance(value, dict):
+            out.append(OBJECT)
+            out += U32.pack(len(value))
+            for k, v in value.items():
+                out += U32.pack(self.intern(k))
+                self.encode(v, out)
+        else:
+            raise ValueError(f"Can't encode {value!r}")
+
+    def operand(self, value) -> int:
+        encoded = bytearray()
+        self.encode(value, encoded)
+        key = bytes(encoded)
+        if (ref := self.operand_refs.get(key)) is None:
+            ref = self.operand_refs[key] = len(self.operands)
+            self.operands += key
+        return ref
+
+
+def encode(methods: dict[str, dict], sources: dict[str, str]) -> bytes:
+    """Encode the decompiled methods, given by their method id, and the
+    sha256 of the classfiles they are from.
+    """
+    writer = _Writer()
+    names = array("I")
+    starts, counts, max_locals = array("I"), array("I"), array("I")
+    oprs, offsets, operands = array("I"), array("I"), array("I")
+
+    for name, method in sorted(methods.items()):
+        names.append(writer.intern(name))
+        starts.append(len(oprs))
+        counts.append(len(method["code"]["bytecode"]))
+        max_locals.append(method["code"]["max_locals"])
+        for inst in method["code"]["bytecode"]:
+            rest = {k: v for k, v in inst.items() if k not in ("opr", "offset")}
+            oprs.append(writer.intern(inst["opr"]))
+            offsets.append(inst["offset"])
+            operands.append(writer.operand(rest))
+
+    string_offsets = array("I", [0])
+    string_data = bytearray()
+    for string in writer.strings:
+        string_data += string.encode("utf-8")
+        string_offsets.append(len(string_data))
+
+    arrays = [
+        string_offsets.tobytes(),
+        bytes(string_data),
+        names.tobytes(),
+        starts.tobytes(),
+        counts.tobytes(),
+        max_locals.tobytes(),
+        oprs.tobytes(),
+        offsets.tobytes(),
+        operands.tobytes(),
+    ]
+
+    content = bytearray(HEADER.size)
+    layout = []
+    for (_, fmt), data in zip(SECTIONS, arrays):
+        content += bytes(-len(content) % 8)
+        layout += [len(content), len(data) // array(fmt).itemsize]
+        content += data
+    content += bytes(-len(content) % 8)
+    operands_offset = len(content)
+    content += writer.operands
+    layout += [operands_offset, len(writer.operands)]
+    sources_data = json.dumps(sources, sort_keys=True).encode()
+    layout += [len(content), len(sources_data)]
+    content += sources_data
+
+    HEADER.pack_into(content, 0, MAGIC, sys.byteorder.encode().ljust(8, b"\0"), *layout)
+    return bytes(content)
+
+
+class _Reader:
+    def __init__(self, buffer: memoryview, strings) -> None:
+        self.buffer = buffer
+        self.strings = strings
+
+    def decode(self, i: int):
+        buffer = self.buffer
+        tag = buffer[i]
+        i += 1
+        if tag == NULL:
+            return None, i
+        elif tag == FALSE:
+            return False, i
+        elif tag == TRUE:
+            return True, i
+        elif tag == INT:
+            return I64.unpack_from(buffer, i)[0], i + 8
+        elif tag == FLOAT:
+            return F64.unpack_from(buffer, i)[0], i + 8
+        elif tag == STRING:
+            return self.strings(U32.unpack_from(buffer, i)[0]), i + 4
+        elif tag == LIST:
+            (n,) = U32.unpack_from(buffer, i)
+            i += 4
+            values = []
+            for _ in range(n):
+                value, i = self.decode(i)
+                values.append(value)
+            return values, i
+        elif tag == OBJECT:
+            (n,) = U32.unpack_from(buffer, i)
+            i += 4
+            values = {}
+            for _ in range(n):
+                key = self.strings(U32.unpack_from(buffer, i)[0])
+                values[key], i = self.decode(i + 4)
+            return values, i
+        else:
+            raise ValueError(f"Unknown tag {tag} at {i - 1}")
+
+
+@dataclass(frozen=True)
+class MethodBytecode:
+    """The instructions of a single method, decoded lazily.
+
+    `oprs`, `offsets` and `operands` are zero-copy views into the file.
+    """
+
+    file: "BytecodeFile"
+    name: str
+    max_locals: int
+    oprs: memoryview
+    offsets: memoryview
+    operands: memoryview
+
+    def __len__(self) -> int:
+        return len(self.oprs)
+
+    def opr(self, i: int) -> str:
+        return self.file.string(self.oprs[i])
+
+    def __getitem__(self, i: int) -> dict:
+        inst, _ = self.file.reader.decode(self.operands[i])
+        inst["opr"] = self.opr(i)
+        inst["offset"] = self.offsets[i]
+        return inst
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class BytecodeFile:
+    """A memory-mapped bytecode file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mmap)
+
+        magic, byteorder, *layout = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a bytecode file")
+        if byteorder.rstrip(b"\0").decode() != sys.byteorder:
+            raise ValueError(f"{path} was written with a different byteorder")
+
+        for i, (name, fmt) in enumerate(SECTIONS):
+            offset, count = layout[2 * i : 2 * i + 2]
+            size = count * array(fmt).itemsize
+            setattr(self, name, buffer[offset : offset + size].cast(fmt))
+        offset, size = layout[-4:-2]
+        self.reader = _Reader(buffer[offset : offset + size], self.string)
+        offset, size = layout[-2:]
+        self.sources: dict[str, str] = json.loads(bytes(buffer[offset : offset + size]))
+        self._strings: dict[int, str] = {}
+
+    def string(self, i: int) -> str:
+        if (string := self._strings.get(i)) is None:
+            start, end = self.string_offsets[i], self.string_offsets[i + 1]
+            string = self._strings[i] = str(self.string_data[start:end], "utf-8")
+        return string
+
+    def __len__(self) -> int:
+        return len(self.method_names)
+
+    def names(self) -> Iterator[str]:
+        for i in self.method_names:
+            yield self.string(i)
+
+    def _find(self, name: str) -> Optional[int]:
+        lo, hi = 0, len(self.method_names)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(self.method_names[mid]) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.method_names) and self.string(self.method_names[lo]) == name:
+            return lo
+        return None
+
+    def __contains__(self, methodid) -> bool:
+        return self._find(str(methodid)) is not None
+
+    def is_current(self, methodid) -> bool:
+        """Check that the classfile of a method is the one the file was built
+        from, using the method index.
+        """
+        from jpamb_utils import index
+
+        classfile = methodid.classfile()
+        root = classfile.parents[methodid.class_name.count(".")]
+        methods = index.get_index(root)
+        try:
+            entry = methods.entry(classfile)
+        except OSError:
+            return False
+        methods.save()
+        return (
+            self.sources.get(classfile.relative_to(root).as_posix()) == entry["sha256"]
+        )
+
+    def method(self, methodid) -> Optional[MethodBytecode]:
+        """Get the instructions of a method, or None if it is not in the file."""
+        name = str(methodid)
+        if (i := self._find(name)) is None:
+            return None
+        start = self.method_starts[i]
+        end = start + self.method_counts[i]
+        return MethodBytecode(
+            self,
+            name,
+            self.method_max_locals[i],
+            self.code_oprs[start:end],
+            self.code_offsets[start:end],
+            self.code_operands[start:end],
+        )
+
+
+def collect(root: Path) -> tuple[dict[str, dict], dict[str, str]]:
+    """Collect all methods with code from the decompiled classfiles in root,
+    and the sha256 of the classfiles.
+    """
+    from jpamb_utils import MethodId
+
+    methods, sources = {}, {}
+    for classfile in sorted(root.glob("**/*.json")):
+        if classfile.name.startswith("."):
+            continue
+        relative = classfile.relative_to(root)
+        class_name = ".".join(relative.with_suffix("").parts)
+        content = classfile.read_bytes()
+        sources[relative.as_posix()] = hashlib.sha256(content).hexdigest()
+        for m in json.loads(content)["methods"]:
+            if m["code"] is None:
+                continue
+            try:
+                methodid = MethodId.from_decompiled(class_name, m)
+            except ValueError:
+                continue
+            methods[str(methodid)] = m
+    return methods, sources
+
+
+def build(root: Path = Path("decompiled")) -> Path:
+    """Write the bytecode file of all the decompiled classfiles in root."""
+    path = root / BYTECODE_NAME
+    tmp = path.with_name(f"{BYTECODE_NAME}.{os.getpid()}")
+    tmp.write_bytes(encode(*collect(root)))
+    os.replace(tmp, path)
+    _files.pop(path, None)
+    return path
+
+
+def is_stale(root: Path = Path("decompiled")) -> bool:
+    """Check if the bytecode file is missing, or was built from other
+    classfiles than the ones in root.
+    """
+    from jpamb_utils import index
+
+    try:
+        file = BytecodeFile(root / BYTECODE_NAME)
+    except (OSError, ValueError):
+        return True
+    current = {k: e["sha256"] for k, e in index.build(root).classes.items()}
+    return file.sources != current
+
+
+_files: dict[Path, BytecodeFile] = {}
+
+
+def load(root: Path = Path("decompiled"), check: bool = True) -> BytecodeFile:
+    """Open the bytecode file of root, building it if it is missing or stale.
+
+    With `check=False` the classfiles are not checked for changes.
+    """
+    path = root / BYTECODE_NAME
+    if (file := _files.get(path)) is None:
+        if is_stale(root) if check else not path.exists():
+            build(root)
+        file = _files[path] = BytecodeFile(path)
+    return file
+
+
+def find(root: Path = Path("decompiled")) -> Optional[BytecodeFile]:
+    """Open the bytecode file of root if there is one, without building it.
+
+    The file might be stale, so check `is_current` before using a method.
+    """
+    path = root / BYTECODE_NAME
+    if (file := _files.get(path)) is None:
+        try:
+            file = _files[path] = BytecodeFile(path)
+        except (OSError, ValueError):
+            return None
+    return file
@@ -0,0 +1,135 @@
+""" A process-wide, bounded LRU cache of parsed classfiles and methods.
+
+Entries are keyed by the path and version of the decompiled classfile, so a
+changed classfile is simply a cache miss, and the stale entries age out. The
+version of a classfile is checked at most every `CHECK_INTERVAL` seconds, so a
+hit costs no system call. The
+memory budget is counted in bytes of decompiled json, and can be set with the
+`JPAMB_CACHE_BUDGET` environment variable or with `configure`.
+
+The cached values are shared between all callers, so don't modify them.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Hashable
+import json
+import os
+import time
+
+DEFAULT_BUDGET = 64 * 1024 * 1024
+
+# Seconds that the version of a classfile is trusted before it is checked again
+CHECK_INTERVAL = 1.0
+
+
+@dataclass
+class LRUCache:
+    budget: int
+    entries: OrderedDict = field(default_factory=OrderedDict)
+    size: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def get(self, key: Hashable, load: Callable[[], tuple[Any, int]]) -> Any:
+        """Get the value of key, or load it as a (value, size) pair."""
+        if (entry := self.entries.get(key)) is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        value, size = load()
+        if size <= self.budget:
+            self.entries[key] = (value, size)
+            self.size += size
+            self.evict()
+        return value
+
+    def evict(self):
+        while self.size > self.budget:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def resize(self, budget: int):
+        self.budget = budget
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "size": self.size,
+            "budget": self.budget,
+        }
+
+
+_cache = LRUCache(int(os.environ.get("JPAMB_CACHE_BUDGET", DEFAULT_BUDGET)))
+_versions: dict[Path, tuple[float, tuple[int, int]]] = {}
+
+
+def configure(budget: int):
+    """Set the memory budget of the cache, evicting entries if needed."""
+    _cache.resize(budget)
+
+
+def clear():
+    _cache.clear()
+    _versions.clear()
+
+
+def stats() -> dict[str, int]:
+    return _cache.stats()
+
+
+def cached(key: Hashable, load: Callable[[], tuple[Any, int]]) -> Any:
+    """Get a value from the cache, or load it as a (value, size) pair."""
+    return _cache.get(key, load)
+
+
+def version(classfile: Path) -> tuple[int, int]:
+    """The (mtime, size) of a classfile, as of at most `CHECK_INTERVAL`
+    seconds ago.
+    """
+    now = time.monotonic()
+    if (known := _versions.get(classfile)) is None or now - known[0] > CHECK_INTERVAL:
+        stat = classfile.stat()
+        known = _versions[classfile] = (now, (stat.st_mtime_ns, stat.st_size))
+    return known[1]
+
+
+def load_class(classfile: Path) -> dict:
+    """Load an entire decompiled classfile."""
+
+    def load():
+        content = classfile.read_bytes()
+        return json.loads(content), len(content)
+
+    return _cache.get((str(classfile), version(classfile)), load)
+
+
+def load_method(methodid) -> dict:
+    """Load a single decompiled method, using the method index if possible."""
+    from jpamb_utils import index
+
+    classfile = methodid.classfile()
+    mtime, size = version(classfile)
+
+    def load():
+        if (found := index.span(methodid, classfile)) is None:
+            return methodid.scan(), size
+        start, end = found
+        with open(classfile, "rb") as f:
+            f.seek(start)
+            return json.loads(f.read(end - start)), end - start
+
+    return _cache.get((str(classfile), (mtime, size), methodid), load)
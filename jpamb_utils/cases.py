@@ -0,0 +1,350 @@
+""" A compact, memory-mappable index of the cases in `stats/cases.txt`.
+
+The cases are compiled into `stats/.cases.bin`, so that they don't have to be
+parsed line by line with regular expressions. Like `bytecode.py`, the file is a
+header followed by a number of aligned sections:
+
+    strings   an interned string pool (offsets and utf-8 data)
+    queries   the queries, bit i of an outcome set is the query i
+    methods   the method ids (sorted by name), their ranges of cases, and the
+              set of the outcomes of their cases
+    cases     the input, the outcome, and the parsed values of every case
+    values    the tagged encoding of the parsed values of the inputs
+
+Tools that only need to know what can happen in a method can check its
+outcome set:
+
+    index = cases.load()
+    if index.happens("jpamb.cases.Simple.divideByN:(I)I", "divide by zero"):
+        ...
+"""
+
+from array import array
+from pathlib import Path
+from typing import Iterator, Optional
+import mmap
+import os
+import re
+import struct
+import sys
+
+from jpamb_utils import (
+    BoolValue,
+    CharListValue,
+    CharValue,
+    InputParser,
+    IntListValue,
+    IntValue,
+    MethodId,
+)
+
+CASES_NAME = ".cases.bin"
+MAGIC = b"JPAMBCI\x01"
+
+SECTIONS = (
+    ("string_offsets", "I"),
+    ("string_data", "B"),
+    ("queries", "I"),
+    ("method_names", "I"),
+    ("method_starts", "I"),
+    ("method_counts", "I"),
+    ("method_outcomes", "Q"),
+    ("case_inputs", "I"),
+    ("case_results", "I"),
+    ("case_values", "I"),
+    ("value_data", "B"),
+)
+
+# magic, byteorder, and (offset, count) of the sections.
+HEADER = struct.Struct(f"<8s8s{2 * len(SECTIONS)}Q")
+
+# Tags of the value encoding
+BOOL, INT, CHAR, INTS, CHARS = range(5)
+
+U32 = struct.Struct("<I")
+I32 = struct.Struct("<i")
+
+CASE_RE = re.compile(r"([^ ]*) +(\([^)]*\)) -> (.*)")
+
+
+def _encode_values(values, out: bytearray):
+    out += U32.pack(len(values))
+    for value in values:
+        match value:
+            case BoolValue(v):
+                out += bytes([BOOL, v])
+            case IntValue(v):
+                out.append(INT)
+                out += I32.pack(v)
+            case CharValue(v):
+                out.append(CHAR)
+                out += U32.pack(ord(v))
+            case IntListValue(v):
+                out.append(INTS)
+                out += U32.pack(len(v))
+                out += array("i", v).tobytes()
+            case CharListValue(v):
+                data = v.encode("utf-8")
+                out.append(CHARS)
+                out += U32.pack(len(data))
+                out += data
+            case _:
+                raise ValueError(f"Can't encode {value!r}")
+
+
+def encode(lines: list[str], queries: list[str]) -> bytes:
+    """Encode the lines of a cases file, with outcome sets over `queries`."""
+    if len(queries) > 64:
+        raise ValueError("Outcome sets can have at most 64 queries")
+
+    strings: dict[str, int] = {}
+
+    def intern(string: str) -> int:
+        if (i := strings.get(string)) is None:
+            i = strings[string] = len(strings)
+        return i
+
+    bits = {q: i for i, q in enumerate(queries)}
+    methods: dict[str, list[tuple[str, str]]] = {}
+    for line in lines:
+        if not (m := CASE_RE.match(line.rstrip("\n"))):
+            raise ValueError(f"Unexpected line: {line!r}")
+        name, input, result = m.groups()
+        if result not in bits:
+            raise ValueError(f"Unknown outcome {result!r} in {line!r}")
+        methods.setdefault(name, []).append((input, result))
+
+    query_ids = array("I", map(intern, queries))
+    names, starts, counts, outcomes = array("I"), array("I"), array("I"), array("Q")
+    inputs, results, offsets = array("I"), array("I"), array("I")
+    values = bytearray()
+    for name, cases in sorted(methods.items()):
+        names.append(intern(name))
+        starts.append(len(inputs))
+        counts.append(len(cases))
+        outcome = 0
+        for input, result in cases:
+            outcome |= 1 << bits[result]
+            inputs.append(intern(input))
+            results.append(bits[result])
+            offsets.append(len(values))
+            _encode_values(InputParser.parse(input), values)
+        outcomes.append(outcome)
+
+    string_offsets = array("I", [0])
+    string_data = bytearray()
+    for string in strings:
+        string_data += string.encode("utf-8")
+        string_offsets.append(len(string_data))
+
+    arrays = [
+        string_offsets,
+        string_data,
+        query_ids,
+        names,
+        starts,
+        counts,
+        outcomes,
+        inputs,
+        results,
+        offsets,
+        values,
+    ]
+
+    content = bytearray(HEADER.size)
+    layout = []
+    for (_, fmt), data in zip(SECTIONS, arrays):
+        content += bytes(-len(content) % 8)
+        layout += [len(content), len(data)]
+        content += bytes(data)
+    content += bytes(-len(content) % 8)
+
+    HEADER.pack_into(content, 0, MAGIC, sys.byteorder.encode().ljust(8, b"\0"), *layout)
+    return bytes(content)
+
+
+class CaseIndex:
+    """A memory-mapped case index."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.version = _version(os.fstat(f.fileno()))
+        buffer = memoryview(self.mmap)
+
+        magic, byteorder, *layout = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a case index")
+        if byteorder.rstrip(b"\0").decode() != sys.byteorder:
+            raise ValueError(f"{path} was written with a different byteorder")
+
+        for i, (name, fmt) in enumerate(SECTIONS):
+            offset, count = layout[2 * i : 2 * i + 2]
+            size = count * array(fmt).itemsize
+            setattr(self, name, buffer[offset : offset + size].cast(fmt))
+        self._strings: dict[int, str] = {}
+        self._methodids: list[Optional[MethodId]] = [None] * len(self.method_names)
+        self.query_names = [self.string(q) for q in self.queries]
+
+    def string(self, i: int) -> str:
+        if (string := self._strings.get(i)) is None:
+            start, end = self.string_offsets[i], self.string_offsets[i + 1]
+            string = self._strings[i] = str(self.string_data[start:end], "utf-8")
+        return string
+
+    def __len__(self) -> int:
+        return len(self.case_inputs)
+
+    def methods(self) -> Iterator[str]:
+        for i in self.method_names:
+            yield self.string(i)
+
+    def _find(self, name: str) -> Optional[int]:
+        lo, hi = 0, len(self.method_names)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(self.method_names[mid]) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.method_names) and self.string(self.method_names[lo]) == name:
+            return lo
+        return None
+
+    def __contains__(self, methodid) -> bool:
+        return self._find(str(methodid)) is not None
+
+    def outcomes(self, methodid) -> int:
+        """The outcome set of a method, which is empty if it has no cases."""
+        if (i := self._find(str(methodid))) is None:
+            return 0
+        return self.method_outcomes[i]
+
+    def names(self, outcomes: int) -> list[str]:
+        """The queries in an outcome set."""
+        return [q for i, q in enumerate(self.query_names) if outcomes >> i & 1]
+
+    def happens(self, methodid, query: str) -> bool:
+        """Whether the query is the outcome of some case of the method."""
+        return bool(self.outcomes(methodid) >> self.query_names.index(query) & 1)
+
+    def methodid(self, i: int) -> MethodId:
+        """The method id of the i'th method, which is only parsed once."""
+        if (methodid := self._methodids[i]) is None:
+            name = self.string(self.method_names[i])
+            methodid = self._methodids[i] = MethodId.parse(name)
+        return methodid
+
+    def values(self, case: int) -> tuple:
+        """The parsed values of the input of a case."""
+        buffer = self.value_data
+        (n,) = U32.unpack_from(buffer, i := self.case_values[case])
+        i += 4
+        values = []
+        for _ in range(n):
+            tag = buffer[i]
+            if tag == BOOL:
+                values.append(BoolValue(bool(buffer[i + 1])))
+                i += 2
+            elif tag == INT:
+                values.append(IntValue(I32.unpack_from(buffer, i + 1)[0]))
+                i += 5
+            elif tag == CHAR:
+                values.append(CharValue(chr(U32.unpack_from(buffer, i + 1)[0])))
+                i += 5
+            elif tag == INTS:
+                (length,) = U32.unpack_from(buffer, i + 1)
+                ints = array("i")
+                ints.frombytes(buffer[i + 5 : i + 5 + 4 * length])
+                values.append(IntListValue(ints))
+                i += 5 + 4 * length
+            elif tag == CHARS:
+                (length,) = U32.unpack_from(buffer, i + 1)
+                chars = str(buffer[i + 5 : i + 5 + length], "utf-8")
+                values.append(CharListValue(chars))
+                i += 5 + length
+            else:
+                raise ValueError(f"Unknown tag {tag} at {i}")
+        return tuple(values)
+
+    def cases(self, methodid=None) -> Iterator[tuple[MethodId, str, tuple, str]]:
+        """The method id, input, parsed values, and outcome of the cases of a
+        method, or of all cases, in the order of the cases file.
+        """
+        if methodid is None:
+            methods = range(len(self.method_names))
+        elif (i := self._find(str(methodid))) is None:
+            return
+        else:
+            methods = [i]
+        for i in methods:
+            method = self.methodid(i)
+            start = self.method_starts[i]
+            for case in range(start, start + self.method_counts[i]):
+                yield (
+                    method,
+                    self.string(self.case_inputs[case]),
+                    self.values(case),
+                    self.query_names[self.case_results[case]],
+                )
+
+    def distribution(self) -> dict[str, float]:
+        """The share of the methods where every query is an outcome."""
+        total = len(self.method_outcomes) or 1
+        return {
+            q: sum(o >> i & 1 for o in self.method_outcomes) / total
+            for i, q in enumerate(self.query_names)
+        }
+
+
+def build(root: Path = Path("stats"), queries: Optional[list[str]] = None) -> Path:
+    """Write the case index of the cases file in root. The queries are the
+    outcomes in the cases file, unless they are given.
+    """
+    with open(root / "cases.txt", encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    if queries is None:
+        queries = sorted({line.rsplit("->", 1)[1].strip() for line in lines})
+    path = root / CASES_NAME
+    tmp = path.with_name(f"{CASES_NAME}.{os.getpid()}")
+    tmp.write_bytes(encode(lines, queries))
+    os.replace(tmp, path)
+    _indices.pop(path, None)
+    return path
+
+
+def _version(stat: os.stat_result) -> tuple[int, int]:
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def is_stale(root: Path = Path("stats")) -> bool:
+    try:
+        built = (root / CASES_NAME).stat().st_mtime_ns
+    except FileNotFoundError:
+        return True
+    return (root / "cases.txt").stat().st_mtime_ns > built
+
+
+_indices: dict[Path, CaseIndex] = {}
+
+
+def load(
+    root: Path = Path("stats"), queries: Optional[list[str]] = None, check=True
+) -> CaseIndex:
+    """Open the case index of root, building it if it is missing or stale.
+    An open index is checked again every time, and opened again if the file
+    was rebuilt, by this or another process.
+
+    With `check=False` the cases file is not checked for changes.
+    """
+    path = root / CASES_NAME
+    index = _indices.get(path)
+    if index is not None and not check:
+        return index
+    if is_stale(root) if check else not path.exists():
+        build(root, queries)
+        index = None
+    if index is None or index.version != _version(path.stat()):
+        index = _indices[path] = CaseIndex(path)
+    return index
@@ -0,0 +1,230 @@
+""" A byte-offset index over the methods of the decompiled classfiles.
+
+The index is stored next to the decompiled classfiles, in
+`decompiled/.index.json`, and maps every `str(MethodId)` to the byte range of
+the method's json in its classfile. This way `MethodId.load` only has to parse
+a single method instead of the entire classfile.
+
+An entry is invalidated when the mtime or size of the classfile changes, and
+the classfile is only re-indexed if its content hash changed as well.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+import hashlib
+import json
+import os
+import re
+
+INDEX_NAME = ".index.json"
+INDEX_VERSION = 1
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+def _skip(text: str, i: int) -> int:
+    return _WHITESPACE.match(text, i).end()  # type: ignore
+
+
+def _expect(text: str, i: int, char: str) -> int:
+    if text[i : i + 1] != char:
+        raise ValueError(f"Expected {char!r} at {i} but got {text[i:i+10]!r}")
+    return _skip(text, i + 1)
+
+
+def method_ranges(text: str) -> Iterator[tuple[dict, int, int]]:
+    """Find the methods of a classfile, and the character range they occupy."""
+    i = _expect(text, _skip(text, 0), "{")
+    while text[i] != "}":
+        key, i = _DECODER.raw_decode(text, i)
+        i = _expect(text, _skip(text, i), ":")
+        if key == "methods":
+            i = _expect(text, i, "[")
+            while text[i] != "]":
+                method, end = _DECODER.raw_decode(text, i)
+                yield method, i, end
+                i = _skip(text, end)
+                if text[i] == ",":
+                    i = _skip(text, i + 1)
+            i += 1
+        else:
+            _, i = _DECODER.raw_decode(text, i)
+        i = _skip(text, i)
+        if text[i] == ",":
+            i = _skip(text, i + 1)
+
+
+def index_classfile(class_name: str, content: bytes) -> dict[str, tuple[int, int]]:
+    """Compute the byte ranges of all the methods of a classfile."""
+    from jpamb_utils import MethodId
+
+    text = content.decode("utf-8")
+    is_ascii = len(text) == len(content)
+
+    def offset(i):
+        return i if is_ascii else len(text[:i].encode("utf-8"))
+
+    methods = {}
+    for method, start, end in method_ranges(text):
+        try:
+            methodid = MethodId.from_decompiled(class_name, method)
+        except ValueError:
+            continue
+        methods[str(methodid)] = (offset(start), offset(end))
+    return methods
+
+
+@dataclass
+class MethodIndex:
+    root: Path
+    classes: dict[str, dict] = field(default_factory=dict)
+    dirty: bool = False
+
+    @property
+    def path(self) -> Path:
+        return self.root / INDEX_NAME
+
+    @staticmethod
+    def open(root: Path) -> "MethodIndex":
+        index = MethodIndex(root)
+        try:
+            with open(index.path) as f:
+                content = json.load(f)
+            if content.get("version") == INDEX_VERSION:
+                index.classes = content["classes"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return index
+
+    def save(self):
+        """Write the index, if it changed. Failing to write is not an error."""
+        if not self.dirty:
+            return
+        tmp = self.path.with_name(f"{INDEX_NAME}.{os.getpid()}")
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"version": INDEX_VERSION, "classes": self.classes}, f)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except OSError:
+            tmp.unlink(missing_ok=True)
+
+    def entry(self, classfile: Path) -> dict:
+        """Get the up-to-date entry of a classfile, re-indexing it if needed."""
+        relative = classfile.relative_to(self.root)
+        key = relative.as_posix()
+        stat = classfile.stat()
+        entry = self.classes.get(key)
+        if (
+            entry is not None
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+        ):
+            return entry
+
+        content = classfile.read_bytes()
+        sha256 = hashlib.sha256(content).hexdigest()
+        if entry is None or entry["sha256"] != sha256:
+            class_name = ".".join(relative.with_suffix("").parts)
+            entry = {"sha256": sha256, "methods": index_classfile(class_name, content)}
+        entry["mtime_ns"] = stat.st_mtime_ns
+        entry["size"] = stat.st_size
+        self.classes[key] = entry
+        self.dirty = True
+        return entry
+
+    def refresh(self) -> "MethodIndex":
+        """Bring the index up-to-date with all classfiles in the root."""
+        classfiles = {
+            c.relative_to(self.root).as_posix(): c
+            for c in self.root.glob("**/*.json")
+            if not c.name.startswith(".")
+        }
+        for key in list(self.classes):
+            if key not in classfiles:
+                del self.classes[key]
+                self.dirty = True
+        for classfile in classfiles.values():
+            self.entry(classfile)
+        self.save()
+        return self
+
+
+_indices: dict[Path, MethodIndex] = {}
+
+
+def get_index(root: Path) -> MethodIndex:
+    if (index := _indices.get(root)) is None:
+        index = _indices[root] = MethodIndex.open(root)
+    return index
+
+
+def build(root: Path = Path("decompiled")) -> MethodIndex:
+    """Build or update the index of all classfiles in root."""
+    return get_index(root).refresh()
+
+
+def span(methodid, classfile: Path) -> Optional[tuple[int, int]]:
+    """Find the byte range of a method, or None if it is not indexed."""
+    root = classfile.parents[methodid.class_name.count(".")]
+    index = get_index(root)
+    try:
+        entry = index.entry(classfile)
+    except OSError:
+        return None
+    index.save()
+    return entry["methods"].get(str(methodid))
+
+
+def lookup(methodid, classfile: Path) -> Optional[dict]:
+    """Load a single method using the index, or None if it is not indexed."""
+    if (found := span(methodid, classfile)) is None:
+        return None
+    start, end = found
+    with open(classfile, "rb") as f:
+        f.seek(start)
+        return json.loads(f.read(end - start))
+
+
+def fingerprints(root: Path = Path("decompiled")) -> dict[str, str]:
+    """Hash the json of every indexed method, together with the methods of
+    the suite it calls (transitively), so the hash changes whenever the
+    behaviour of the method might have.
+
+    Calls are matched on class and method name, so all overloads count.
+    """
+    from jpamb_utils import MethodId, instructions
+
+    own: dict[str, str] = {}
+    calls: dict[str, set[tuple[str, str]]] = {}
+    by_name: dict[tuple[str, str], list[str]] = {}
+    for key, entry in build(root).classes.items():
+        content = (root / key).read_bytes()
+        for name, (start, end) in entry["methods"].items():
+            own[name] = hashlib.sha256(content[start:end]).hexdigest()
+            methodid = MethodId.parse(name)
+            by_name.setdefault((methodid.class_name, methodid.method_name), [])
+            by_name[methodid.class_name, methodid.method_name].append(name)
+            code = json.loads(content[start:end])["code"]
+            calls[name] = {
+                (inst.method.class_name.replace("/", "."), inst.method.name)
+                for inst in instructions.decode(code["bytecode"] if code else [])
+                if isinstance(inst, instructions.Invoke) and inst.method.class_name
+            }
+
+    result = {}
+    for name in own:
+        reached, todo = {name}, [name]
+        while todo:
+            for callee in calls[todo.pop()]:
+                for other in by_name.get(callee, []):
+                    if other not in reached:
+                        reached.add(other)
+                        todo.append(other)
+        digest = hashlib.sha256()
+        for other in sorted(reached):
+            digest.update(f"{other} {own[other]}\n".encode())
+        result[name] = digest.hexdigest()
+    return result
@@ -0,0 +1,367 @@
+""" Typed instructions, decoded once from the bytecode json.
+
+Every `opr` has its own immutable `__slots__` class, so tools can write
+
+    for inst in methodid.instructions():
+        if isinstance(inst, Invoke) and inst.method.class_name == "java/lang/AssertionError":
+            ...
+
+instead of digging through nested dictionaries. Branch targets are instruction
+indices, which is also what jvm2json emits, and are checked when decoding.
+Operations we don't know are decoded as `Unknown`, which keeps the json.
+"""
+
+from typing import Any, ClassVar, Optional
+import sys
+
+
+class _Slotted:
+    """Immutable objects with positional fields given by their `__slots__`."""
+
+    __slots__ = ()
+    _fields: ClassVar[tuple[str, ...]] = ()
+
+    def __init_subclass__(cls) -> None:
+        cls._fields = cls._fields + tuple(cls.__dict__.get("__slots__", ()))
+        cls.__match_args__ = cls._fields
+
+    def __init__(self, *args) -> None:
+        if len(args) != len(self._fields):
+            raise TypeError(f"{type(self).__name__} takes {self._fields}")
+        for name, value in zip(self._fields, args):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, f) for f in self._fields))
+
+    def __eq__(self, other) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    def __hash__(self) -> int:
+        return hash(tuple(repr(getattr(self, f)) for f in self._fields))
+
+    def __repr__(self) -> str:
+        args = ", ".join(f"{f}={getattr(self, f)!r}" for f in self._fields)
+        return f"{type(self).__name__}({args})"
+
+
+class MethodRef(_Slotted):
+    """A reference to a method. `ref` is the type it is invoked on, which is
+    None for dynamic invokes, and `class_name` is its name if it is a class.
+    """
+
+    __slots__ = ("ref", "class_name", "name", "args", "returns", "is_interface")
+    ref: Optional[dict]
+    class_name: Optional[str]
+    name: str
+    args: tuple
+    returns: Any
+    is_interface: Optional[bool]
+
+    @staticmethod
+    def decode(method: dict) -> "MethodRef":
+        ref = method.get("ref")
+        return MethodRef(
+            ref,
+            ref["name"] if ref and ref["kind"] == "class" else None,
+            method["name"],
+            tuple(method["args"]),
+            method["returns"],
+            method.get("is_interface"),
+        )
+
+
+class FieldRef(_Slotted):
+    __slots__ = ("class_name", "name", "type")
+    class_name: str
+    name: str
+    type: Any
+
+    @staticmethod
+    def decode(field: dict) -> "FieldRef":
+        return FieldRef(field["class"], field["name"], field["type"])
+
+
+class Instruction(_Slotted):
+    """The base of all instructions. `opr` is the name used in the json, and
+    `KEYS` are the json keys of the fields, if they differ from the names.
+    """
+
+    __slots__ = ("offset",)
+    offset: int
+    opr: ClassVar[str]
+    KEYS: ClassVar[dict[str, str]] = {}
+
+    @classmethod
+    def decode(cls, inst: dict, length: int) -> "Instruction":
+        return cls(
+            inst["offset"],
+            *(inst.get(cls.KEYS.get(f, f)) for f in cls._fields[1:]),
+        )
+
+
+def _target(target: int, length: int) -> int:
+    if not 0 <= target < length:
+        raise ValueError(f"Branch target {target} is not in a method of {length}")
+    return target
+
+
+class _Branch(Instruction):
+    __slots__ = ()
+
+    @classmethod
+    def decode(cls, inst, length):
+        self = super().decode(inst, length)
+        _target(self.target, length)  # type: ignore
+        return self
+
+
+class Load(Instruction):
+    opr = "load"
+    __slots__ = ("type", "index")
+
+
+class Store(Instruction):
+    opr = "store"
+    __slots__ = ("type", "index")
+
+
+class Push(Instruction):
+    """Push a constant, `type` and `value` are None when pushing null."""
+
+    opr = "push"
+    __slots__ = ("type", "value")
+
+    @classmethod
+    def decode(cls, inst, length):
+        value = inst["value"]
+        if value is None:
+            return cls(inst["offset"], None, None)
+        return cls(inst["offset"], value["type"], value["value"])
+
+
+class Return(Instruction):
+    opr = "return"
+    __slots__ = ("type",)
+
+
+class Get(Instruction):
+    opr = "get"
+    __slots__ = ("field", "static")
+    field: FieldRef
+
+    @classmethod
+    def decode(cls, inst, length):
+        return cls(inst["offset"], FieldRef.decode(inst["field"]), inst["static"])
+
+
+class Put(Get):
+    opr = "put"
+    __slots__ = ()
+
+
+class Goto(_Branch):
+    opr = "goto"
+    __slots__ = ("target",)
+
+
+class If(_Branch):
+    opr = "if"
+    __slots__ = ("condition", "target")
+
+
+class Ifz(_Branch):
+    opr = "ifz"
+    __slots__ = ("condition", "target")
+
+
+class Dup(Instruction):
+    opr = "dup"
+    __slots__ = ("words",)
+
+
+class Pop(Instruction):
+    opr = "pop"
+    __slots__ = ("words",)
+
+
+class Invoke(Instruction):
+    opr = "invoke"
+    __slots__ = ("access", "method", "stack_size", "index")
+    method: MethodRef
+
+    @classmethod
+    def decode(cls, inst, length):
+        return cls(
+            inst["offset"],
+            inst["access"],
+            MethodRef.decode(inst["method"]),
+            inst.get("stack_size"),
+            inst.get("index"),
+        )
+
+
+class New(Instruction):
+    opr = "new"
+    __slots__ = ("class_name",)
+    KEYS = {"class_name": "class"}
+
+
+class NewArray(Instruction):
+    opr = "newarray"
+    __slots__ = ("type", "dim")
+
+
+class ArrayLoad(Instruction):
+    opr = "array_load"
+    __slots__ = ("type",)
+
+
+class ArrayStore(Instruction):
+    opr = "array_store"
+    __slots__ = ("type",)
+
+
+class ArrayLength(Instruction):
+    opr = "arraylength"
+    __slots__ = ()
+
+
+class Binary(Instruction):
+    opr = "binary"
+    __slots__ = ("type", "operant")
+
+
+class Incr(Instruction):
+    opr = "incr"
+    __slots__ = ("index", "amount")
+
+
+class Cast(Instruction):
+    opr = "cast"
+    __slots__ = ("from_type", "to_type")
+    KEYS = {"from_type": "from", "to_type": "to"}
+
+
+class CheckCast(Instruction):
+    opr = "checkcast"
+    __slots__ = ("type",)
+
+
+class InstanceOf(Instruction):
+    opr = "instanceof"
+    __slots__ = ("type",)
+
+
+class Throw(Instruction):
+    opr = "throw"
+    __slots__ = ()
+
+
+class TableSwitch(Instruction):
+    opr = "tableswitch"
+    __slots__ = ("default", "low", "targets")
+
+    @classmethod
+    def decode(cls, inst, length):
+        return cls(
+            inst["offset"],
+            _target(inst["default"], length),
+            inst["low"],
+            tuple(_target(t, length) for t in inst["targets"]),
+        )
+
+
+class LookupSwitch(Instruction):
+    """A switch, `targets` is a tuple of (key, target) pairs."""
+
+    opr = "lookupswitch"
+    __slots__ = ("default", "targets")
+
+    @classmethod
+    def decode(cls, inst, length):
+        return cls(
+            inst["offset"],
+            _target(inst["default"], length),
+            tuple((t["key"], _target(t["target"], length)) for t in inst["targets"]),
+        )
+
+
+class Unknown(Instruction):
+    """An operation we don't have a class for, `fields` is the json."""
+
+    __slots__ = ("opr", "fields")  # type: ignore
+
+    @classmethod
+    def decode(cls, inst, length):
+        return cls(inst["offset"], inst["opr"], inst)
+
+
+OPERATIONS: dict[str, type[Instruction]] = {
+    c.opr: c
+    for c in [
+        Load,
+        Store,
+        Push,
+        Return,
+        Get,
+        Put,
+        Goto,
+        If,
+        Ifz,
+        Dup,
+        Pop,
+        Invoke,
+        New,
+        NewArray,
+        ArrayLoad,
+        ArrayStore,
+        ArrayLength,
+        Binary,
+        Incr,
+        Cast,
+        CheckCast,
+        InstanceOf,
+        Throw,
+        TableSwitch,
+        LookupSwitch,
+    ]
+}
+
+
+def decode(bytecode: list[dict]) -> tuple[Instruction, ...]:
+    """Decode the bytecode of a method, `m["code"]["bytecode"]`."""
+    length = len(bytecode)
+    return tuple(
+        OPERATIONS.get(inst["opr"], Unknown).decode(inst, length) for inst in bytecode
+    )
+
+
+def load(methodid) -> tuple[Instruction, ...]:
+    """Load the decoded instructions of a method, memoized in the process-wide
+    cache alongside the method.
+
+    The instructions are read from the bytecode file if its copy of the
+    method is current, and from the json otherwise.
+    """
+    from jpamb_utils import bytecode, cache
+
+    classfile = methodid.classfile()
+
+    def load():
+        root = classfile.parents[methodid.class_name.count(".")]
+        file = bytecode.find(root)
+        if file is not None and (code := file.method(methodid)) is not None:
+            if file.is_current(methodid):
+                instructions = decode(list(code))
+                return instructions, sum(sys.getsizeof(i) for i in instructions)
+        instructions = decode(methodid.load()["code"]["bytecode"])
+        return instructions, sum(sys.getsizeof(i) for i in instructions)
+
+    key = ("instructions", str(classfile), cache.version(classfile), methodid)
+    return cache.cached(key, load)
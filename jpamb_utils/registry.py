@@ -0,0 +1,105 @@
+""" A registry of interned method ids with dense integer handles.
+
+The registry is built once from the method index of the decompiled suite, and
+gives every method a handle in `range(len(registry))`, in sorted order. This
+allows per-method tables to be plain lists indexed by handle:
+
+    methods = registry.load()
+    counts = methods.table(0)
+    counts[methods.handle("jpamb.cases.Simple.divideByN:(I)I")] += 1
+
+All method ids in the registry are interned, so `MethodId.parse` returns the
+registered object without parsing it again. 'bin/evaluate.py' keys its tasks,
+the order of its results and the result cache on the handles.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+
+@dataclass
+class MethodRegistry:
+    root: Path = Path("decompiled")
+    ids: list = field(default_factory=list)
+    names: list[str] = field(default_factory=list)
+    handles: dict[str, int] = field(default_factory=dict)
+    methods: list[Optional[dict]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator:
+        return iter(self.ids)
+
+    def __contains__(self, methodid) -> bool:
+        return str(methodid) in self.handles
+
+    def intern(self, methodid) -> int:
+        """Get the handle of a method id, adding it if it is not registered."""
+        from jpamb_utils import MethodId
+
+        name = str(methodid)
+        if (handle := self.handles.get(name)) is None:
+            if isinstance(methodid, str):
+                methodid = MethodId.parse(methodid)
+            handle = self.handles[name] = len(self.ids)
+            self.ids.append(methodid)
+            self.names.append(name)
+            self.methods.append(None)
+        return handle
+
+    def handle(self, methodid) -> int:
+        """Get the handle of a registered method id (or its string)."""
+        return self.handles[str(methodid)]
+
+    def methodid(self, handle: int):
+        return self.ids[handle]
+
+    def name(self, handle: int) -> str:
+        return self.names[handle]
+
+    def method(self, handle: int) -> dict:
+        """Get the decompiled method, it is loaded the first time it is used."""
+        if (method := self.methods[handle]) is None:
+            method = self.methods[handle] = self.ids[handle].load()
+        return method
+
+    def table(self, default: Any = None) -> list:
+        """Create a table with an entry for every registered method."""
+        return [default] * len(self.ids)
+
+    def fingerprints(self) -> list[Optional[str]]:
+        """Get the fingerprint of every method (see `index.fingerprints`), or
+        None for methods that are not in the decompiled suite.
+        """
+        from jpamb_utils import index
+
+        table = self.table()
+        for name, fingerprint in index.fingerprints(self.root).items():
+            if (handle := self.handles.get(name)) is not None:
+                table[handle] = fingerprint
+        return table
+
+
+def build(root: Path = Path("decompiled")) -> MethodRegistry:
+    """Build a registry of all the methods in the decompiled suite."""
+    from jpamb_utils import MethodId, index
+
+    names = sorted(
+        name for c in index.build(root).classes.values() for name in c["methods"]
+    )
+    registry = MethodRegistry(root)
+    for name in names:
+        registry.intern(MethodId.parse(name))
+    return registry
+
+
+_registries: dict[Path, MethodRegistry] = {}
+
+
+def load(root: Path = Path("decompiled")) -> MethodRegistry:
+    """Get the registry of the decompiled suite, building it the first time."""
+    if (registry := _registries.get(root)) is None:
+        registry = _registries[root] = build(root)
+    return registry
@@ -0,0 +1,73 @@
+""" The tool side of the worker protocol.
+
+A tool declared with `worker: true` in the experiment is started once, with
+the environment variable `JPAMB_WORKER=1`. When it is ready it prints
+`{"ready": true}`, and then it receives one request per line on stdin:
+
+    {"id": 1, "args": ["jpamb.cases.Simple.divideByN:(I)I"]}
+
+For every request it answers with a single line on stdout, containing what the
+tool would have printed, and an error if it failed:
+
+    {"id": 1, "output": "divide by zero;80%\\n", "error": null}
+
+If the ready message contains `"marks": true`, the tool also prints the line
+`STDERR_DONE` (with the id) to stderr after every request, so that the harness
+knows which request the lines on stderr belong to.
+
+Tools written in Python can support both modes by moving their body into a
+function that takes the arguments, and calling `main`:
+
+    def analyse(args):
+        (name,) = args
+        ...
+        print("ok;90%")
+
+    worker.main(analyse)
+"""
+
+from contextlib import redirect_stdout
+from typing import Callable, TextIO
+import io
+import json
+import os
+import sys
+import traceback
+
+WORKER_ENV = "JPAMB_WORKER"
+STDERR_DONE = "--- jpamb worker done {id} ---"
+
+
+def serve(analyse: Callable[[list[str]], None], requests: TextIO, responses: TextIO):
+    """Answer requests until the input is closed."""
+    responses.write(json.dumps({"ready": True, "marks": True}) + "\n")
+    responses.flush()
+    for line in requests:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        output = io.StringIO()
+        error = None
+        try:
+            with redirect_stdout(output):
+                analyse(request["args"])
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                error = f"exited with {e.code}"
+        except Exception as e:
+            traceback.print_exc()
+            error = repr(e)
+        response = {"id": request["id"], "output": output.getvalue(), "error": error}
+        print(STDERR_DONE.format(id=request["id"]), file=sys.stderr, flush=True)
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
+
+
+def main(analyse: Callable[[list[str]], None]):
+    """Run `analyse` on the command line arguments, or serve requests if the
+    tool was started as a worker.
+    """
+    if os.environ.get(WORKER_ENV) == "1":
+        serve(analyse, sys.stdin, sys.stdout)
+    else:
+        analyse(sys.argv[1:])
@@ -2,17 +2,16 @@
 """ The cheating solution. 
 
 This solution uses apriori knowledge about the distribution of the test-cases
-to gain an advantage.
+to gain an advantage, which it gets from the case index (see
+`jpamb_utils.cases`).
 """
 
-import sys, csv
+import sys
+from jpamb_utils import cases
 
-with open("stats/distribution.csv") as f:
-    distribution = list(csv.DictReader(f))[-1]
+distribution = cases.load().distribution()
 
 print(f"Got {sys.argv[1:]}", file=sys.stderr)
 
 for k, v in distribution.items():
-    if k == "method":
-        continue
-    print(f"{k};{v}")
+    print(f"{k};{v:0.4%}")
@@ -1,35 +1,43 @@
 #!/usr/bin/env python3
 """ A very stupid syntatic bytecode analysis, that only checks for assertion errors.
+
+It can also run as a worker, see `jpamb_utils.worker`.
 """
 
 import sys, logging
-from jpamb_utils import MethodId
+from jpamb_utils import MethodId, worker
+from jpamb_utils.instructions import Invoke
 
 l = logging
 l.basicConfig(level=logging.DEBUG)
 
-(name,) = sys.argv[1:]
-
-l.debug("check assertion")
-l.debug("read the method name")
-method = MethodId.parse(name)
-
-l.debug("looking up method")
-m = method.load()
-
-l.debug("trying to find an assertion error being created")
-for inst in m["code"]["bytecode"]:
-    if (
-        inst["opr"] == "invoke"
-        and inst["method"]["ref"]["name"] == "java/lang/AssertionError"
-    ):
-        break
-else:
-    # I'm pretty sure the answer is no
-    l.debug("did not find it")
-    print("assertion error;20%")
-    sys.exit(0)
-
-l.debug("Found it")
-# I'm kind of sure the answer is yes.
-print("assertion error;80%")
+
+def analyse(args):
+    (name,) = args
+
+    l.debug("check assertion")
+    l.debug("read the method name")
+    method = MethodId.parse(name)
+
+    l.debug("looking up method")
+    instructions = method.instructions()
+
+    l.debug("trying to find an assertion error being created")
+    for inst in instructions:
+        if (
+            isinstance(inst, Invoke)
+            and inst.method.class_name == "java/lang/AssertionError"
+        ):
+            break
+    else:
+        # I'm pretty sure the answer is no
+        l.debug("did not find it")
+        print("assertion error;20%")
+        return
+
+    l.debug("Found it")
+    # I'm kind of sure the answer is yes.
+    print("assertion error;80%")
+
+
+worker.main(analyse)
@@ -1,25 +1,18 @@
 # /usr/bin/env python
-""" This solution cheats by loading the `stats/cases.txt` file.
+""" This solution cheats by loading the cases of `stats/cases.txt`, from the
+case index (see `jpamb_utils.cases`).
 """
 
 import sys
+from jpamb_utils import cases
 
 
 methodid = sys.argv[1]
 
-queries = set()
+index = cases.load()
+happens = index.names(index.outcomes(methodid))
+print(f"{methodid!r}, {happens!r}", file=sys.stderr)
 
-queries_in_method = set()
-
-with open("stats/cases.txt", "r") as f:
-    for line in f.readlines():
-        methodid_, case = line.split(" ", 1)
-        query = case.rsplit("->", 1)[1].strip()
-        print(f"{methodid_!r}, {query!r}", file=sys.stderr)
-        queries.add(query)
-        if methodid_ == methodid:
-            queries_in_method.add(query)
-
-for q in queries:
-    score = "100%" if q in queries_in_method else "0%"
+for q in index.query_names:
+    score = "100%" if q in happens else "0%"
     print(f"{q};{score}")
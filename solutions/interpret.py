@@ -6,7 +6,7 @@ from dataclasses import dataclass
 import sys, logging
 from typing import Optional
 
-from jpamb_utils import InputParser, IntValue, CharValue, MethodId
+from jpamb_utils import InputParser, IntValue, CharValue, MethodId, worker
 
 l = logging
 l.basicConfig(level=logging.DEBUG, format="%(message)s")
@@ -364,10 +364,14 @@ class SimpleInterpreter:
 #######################################################
 # ENTRYPOINT
 #######################################################
-if __name__ == "__main__":
-    methodid = MethodId.parse(sys.argv[1])
-    inputs = InputParser.parse(sys.argv[2])
+def main(args):
+    methodid = MethodId.parse(args[0])
+    inputs = InputParser.parse(args[1])
     m = methodid.load()
     i = SimpleInterpreter(m["code"]["bytecode"], [i.tolocal() for i in inputs], [])
     print(inputs)
     print(i.interpet())
+
+
+if __name__ == "__main__":
+    worker.main(main)
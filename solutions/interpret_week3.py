@@ -6,6 +6,7 @@ import numpy as np
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Literal, TypeAlias, Optional
+from jpamb_utils import cache
 
 
 l = logging
@@ -49,9 +50,11 @@ class MethodId:
 
     def load(self):
         classfile = self.classfile()
-        with open(classfile) as f:
-            l.debug(f"read decompiled classfile {classfile}")
-            classfile = json.load(f)
+        l.debug(f"read decompiled classfile {classfile}")
+        key = (str(classfile), cache.version(classfile), self.method_name, tuple(self.params))
+        return cache.cached(key, lambda: self.find(cache.load_class(classfile)))
+
+    def find(self, classfile):
         for m in classfile["methods"]:
             if (
                 m["name"] == self.method_name
@@ -61,7 +64,7 @@ class MethodId:
                     for p, t in zip(self.params, m["params"])
                 )
             ):
-                return m
+                return m, len(json.dumps(m))
         else:
             print("Could not find method")
             sys.exit(-1)
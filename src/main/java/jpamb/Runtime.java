@@ -1,9 +1,13 @@
 package jpamb;
 
+import java.io.BufferedReader;
+import java.io.IOException;
+import java.io.InputStreamReader;
 import java.lang.reflect.*;
 import java.util.ArrayList;
 import java.util.Arrays;
 import java.util.List;
+import java.util.concurrent.atomic.AtomicBoolean;
 import java.util.regex.*;
 import java.util.stream.Stream;
 
@@ -14,6 +18,9 @@ import jpamb.cases.*;
 /**
  * The runtime method runs a single test-case and print the result or the
  * exeception.
+ *
+ * With --server it instead reads a case per line from stdin, and prints a
+ * result per line, see serve.
  */
 public class Runtime {
   static List<Class<?>> caseclasses = List.of(
@@ -109,8 +116,95 @@ public class Runtime {
     return rparams;
   }
 
+  static Pattern methodPattern = Pattern.compile("(.*)\\.([^.(]*):\\((.*)\\)(.*)");
+
+  /** Find the method of a method id, or return null if it is not a method id */
+  public static Method findMethod(String thecase)
+      throws ClassNotFoundException, NoSuchMethodException {
+    Matcher matcher = methodPattern.matcher(thecase);
+    if (!matcher.find()) {
+      return null;
+    }
+    String cls = matcher.group(1);
+    String mth = matcher.group(2);
+    String prams = matcher.group(3);
+    Method m = Class.forName(cls).getMethod(mth, parseMethodSignature(prams));
+    if (!Modifier.isStatic(m.getModifiers())) {
+      throw new RuntimeException("Expected " + thecase + " to be static");
+    }
+    return m;
+  }
+
+  /** Run the method on an input, and return the result */
+  public static ResultType run(Method m, String input) throws IllegalAccessException {
+    Object[] params = InputParser.parse(input);
+    System.err.printf("Running %s with %s%n", m, Arrays.toString(params));
+    try {
+      m.invoke(null, params);
+    } catch (InvocationTargetException e) {
+      return ResultType.fromThrowable(e.getCause());
+    }
+    return ResultType.SUCCESS;
+  }
+
+  /**
+   * Read cases from stdin, one "methodid input" per line, and print the result
+   * of each case on its own line.
+   *
+   * A running case can't be stopped, so when a case runs for longer than
+   * timeout milliseconds, a watchdog thread prints "*" and stops the JVM.
+   * Cases that can't be run print a line starting with "error:".
+   */
+  public static void serve(long timeout) throws IOException, InterruptedException {
+    BufferedReader in = new BufferedReader(new InputStreamReader(System.in));
+    String line;
+    while ((line = in.readLine()) != null) {
+      line = line.strip();
+      if (line.isEmpty()) {
+        continue;
+      }
+      int space = line.indexOf(' ');
+      String id = space < 0 ? line : line.substring(0, space);
+      String input = space < 0 ? "()" : line.substring(space + 1).strip();
+
+      AtomicBoolean answered = new AtomicBoolean(false);
+      Thread watchdog = new Thread(() -> {
+        try {
+          Thread.sleep(timeout);
+        } catch (InterruptedException e) {
+          return;
+        }
+        if (answered.compareAndSet(false, true)) {
+          System.out.println(ResultType.NON_TERMINATION);
+          System.out.flush();
+          java.lang.Runtime.getRuntime().halt(0);
+        }
+      });
+      watchdog.setDaemon(true);
+      watchdog.start();
+
+      String result;
+      try {
+        Method m = findMethod(id);
+        result = m == null ? "error: invalid method id " + id : run(m, input).toString();
+      } catch (Throwable e) {
+        result = "error: " + e;
+      }
+
+      if (answered.compareAndSet(false, true)) {
+        watchdog.interrupt();
+        System.out.println(result);
+        System.out.flush();
+      } else {
+        // The watchdog has answered, and is stopping the JVM.
+        watchdog.join();
+      }
+    }
+  }
+
   public static void main(String[] args)
-      throws ClassNotFoundException, NoSuchMethodException, IllegalAccessException {
+      throws ClassNotFoundException, NoSuchMethodException, IllegalAccessException, IOException,
+      InterruptedException {
     if (args.length == 0) {
       var mths = caseclasses.stream().flatMap(c -> Stream.of(c.getMethods())).toList();
       for (Method m : mths) {
@@ -126,24 +220,16 @@ public class Runtime {
       }
       return;
     }
-    String thecase = args[0];
-    Pattern pattern = Pattern.compile("(.*)\\.([^.(]*):\\((.*)\\)(.*)");
-    Matcher matcher = pattern.matcher(thecase);
-    if (matcher.find()) {
-      String cls = matcher.group(1);
-      String mth = matcher.group(2);
-      String prams = matcher.group(3);
-      Method m = Class.forName(cls).getMethod(mth, parseMethodSignature(prams));
-      if (!Modifier.isStatic(m.getModifiers())) {
-        throw new RuntimeException("Expected " + pattern + " to be static");
-      }
+    if (args[0].equals("--server")) {
+      serve(args.length > 1 ? Long.parseLong(args[1]) : 500);
+      return;
+    }
+    Method m = findMethod(args[0]);
+    if (m != null) {
       for (int i = 1; i < args.length; i++) {
-        Object[] params = InputParser.parse(args[i]);
-        System.err.printf("Running %s with %s%n", m, Arrays.toString(params));
-        try {
-          m.invoke(null, params);
-        } catch (InvocationTargetException e) {
-          System.out.println(ResultType.fromThrowable(e.getCause()));
+        ResultType result = run(m, args[i]);
+        if (result != ResultType.SUCCESS) {
+          System.out.println(result);
           return;
         }
       }